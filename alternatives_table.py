@@ -0,0 +1,208 @@
+"""
+Precomputed alternatives of every catalog product.
+
+Every catalog product is itself a likely query, so its alternatives can be
+computed offline: for each category, the dense cosine and sparse dot-product
+similarities of all pairs of products are two matrix products, fused with
+the same RRF as the live query. The top-k neighbours of each product are
+stored with their prices in a small .npz file; at runtime the budget filter
+is a scan over that short list.
+
+Usage:
+    python alternatives_table.py --output Data_preparation/alternatives_table.npz
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+from qdrant_client.http.models import QueryResponse, ScoredPoint
+
+from catalog import CATALOG_PATH, build_payload, catalog_version, load_catalog, product_id, project_payload
+from local_search import RRF_K
+
+
+logger = logging.getLogger(__name__)
+
+TABLE_PATH = "Data_preparation/alternatives_table.npz"
+TABLE_SIZE = 50
+
+
+def _rrf_ranks(similarity, prefetch_limit, positive_only=False):
+    """
+    RRF contribution of every column for every row of a similarity matrix.
+
+    Mirrors a prefetch of prefetch_limit candidates: the best column of a
+    row gets 1 / k, the next 1 / (k + 1), and columns outside the prefetch
+    get nothing.
+    """
+    order = np.argsort(-similarity, axis=1, kind="stable")
+    ranks = np.empty_like(order)
+    rows = np.arange(similarity.shape[0])[:, None]
+    ranks[rows, order] = np.arange(similarity.shape[1])
+    contribution = 1.0 / (ranks + RRF_K)
+    keep = ranks < prefetch_limit
+    if positive_only:
+        keep &= similarity > 0
+    return np.where(keep, contribution, 0.0)
+
+
+def build_table(engine, k=TABLE_SIZE, prefetch_limit=100):
+    """
+    Compute the top-k fused neighbours of every catalog product.
+
+    Args:
+        engine: LocalSearchEngine over the catalog (dense and sparse rows)
+        k: Neighbours kept per product
+        prefetch_limit: Candidates of each prefetch, as in the live query
+
+    Returns:
+        Dict of arrays: neighbors (n, k) int32 catalog positions, best
+        first, -1 as padding; scores (n, k) float32 fused scores; prices
+        (n, k) float32
+    """
+    n = len(engine)
+    neighbors = np.full((n, k), -1, dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float32)
+    prices = np.zeros((n, k), dtype=np.float32)
+
+    for category, rows in engine._category_rows.items():
+        # All pairs of the category in two matrix products
+        dense = engine.dense[rows] @ engine.dense[rows].T
+        sparse_block = (engine.sparse[rows] @ engine.sparse[rows].T).toarray()
+
+        # A product is not its own alternative
+        np.fill_diagonal(dense, -np.inf)
+        np.fill_diagonal(sparse_block, 0.0)
+
+        fused = (
+            _rrf_ranks(dense, prefetch_limit)
+            + _rrf_ranks(sparse_block, prefetch_limit, positive_only=True)
+        )
+        width = min(k, len(rows) - 1)
+        if width <= 0:
+            continue
+        top = np.argsort(-fused, axis=1, kind="stable")[:, :width]
+        top_scores = np.take_along_axis(fused, top, axis=1)
+
+        neighbors[rows, :width] = np.where(top_scores > 0, rows[top], -1)
+        scores[rows, :width] = top_scores
+        prices[rows, :width] = engine.prices[rows[top]]
+        logger.info("   %s: %d products", category, len(rows))
+
+    return {"neighbors": neighbors, "scores": scores, "prices": prices}
+
+
+def save_table(path, table, version):
+    """Write the table and the catalog version it was computed from."""
+    np.savez_compressed(path, version=np.array(version), **table)
+
+
+class AlternativesTable:
+    """Lookup of the precomputed alternatives of catalog products."""
+
+    def __init__(self, neighbors, scores, prices, ids, payloads):
+        """
+        Args:
+            neighbors: (n, k) catalog positions, best first, -1 as padding
+            scores: (n, k) fused scores
+            prices: (n, k) neighbour prices
+            ids: Point ID of every catalog product
+            payloads: Payload of every catalog product
+        """
+        self.neighbors = neighbors
+        self.scores = scores
+        self.prices = prices
+        self.ids = ids
+        self.payloads = payloads
+        self.rows = {point_id: row for row, point_id in enumerate(ids)}
+
+    @classmethod
+    def load(cls, path=TABLE_PATH, catalog_path=CATALOG_PATH):
+        """
+        Load a table written by save_table.
+
+        Returns:
+            AlternativesTable, or None if the table was computed from
+            another version of the catalog
+        """
+        data = np.load(path)
+        if str(data["version"]) != catalog_version(catalog_path):
+            logger.warning("⚠️ %s is out of date with the catalog, rebuild it", path)
+            return None
+        records = load_catalog(catalog_path)
+        return cls(
+            data["neighbors"],
+            data["scores"],
+            data["prices"],
+            [product_id(record) for record in records],
+            [build_payload(record) for record in records],
+        )
+
+    def __len__(self):
+        return len(self.neighbors)
+
+    def query(self, point_id, budget, limit=10, payload_fields=None):
+        """
+        Alternatives of a catalog product under a budget.
+
+        The fused ranks were computed over the whole category, so with a
+        tight budget the order can differ slightly from a live query.
+
+        Args:
+            point_id: Point ID of the scanned product
+            budget: Maximum price
+            limit: Number of results to return
+            payload_fields: Payload fields to return (None: all)
+
+        Returns:
+            QueryResponse with ScoredPoint results, like client.query_points,
+            or None if the product is unknown, or the budget leaves fewer
+            than limit of the stored neighbours and the list was cut at k (a
+            live query may find more)
+        """
+        row = self.rows.get(point_id)
+        if row is None:
+            return None
+        neighbors = self.neighbors[row]
+        keep = np.flatnonzero((neighbors >= 0) & (self.prices[row] <= float(budget)))[:limit]
+        if len(keep) < limit and neighbors[-1] >= 0:
+            return None
+        points = [
+            ScoredPoint(
+                id=self.ids[neighbors[pos]],
+                version=0,
+                score=float(self.scores[row, pos]),
+                payload=project_payload(self.payloads[neighbors[pos]], payload_fields),
+            )
+            for pos in keep
+        ]
+        return QueryResponse(points=points)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the alternatives of every catalog product")
+    parser.add_argument("--output", default=TABLE_PATH)
+    parser.add_argument("--catalog", default=CATALOG_PATH)
+    parser.add_argument("--embeddings", default=None, help="Optional .npy cache of the dense vectors")
+    parser.add_argument("--k", type=int, default=TABLE_SIZE)
+    args = parser.parse_args()
+
+    # build_table logs its per-category progress
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    from local_search import LocalSearchEngine
+    from utils import get_model, get_vocab
+
+    start = time.perf_counter()
+    engine = LocalSearchEngine.from_catalog(
+        get_vocab(), get_model(), catalog_path=args.catalog, embeddings_path=args.embeddings
+    )
+    table = build_table(engine, k=args.k)
+    save_table(args.output, table, catalog_version(args.catalog))
+    print(f"✅ Alternatives of {len(engine)} products saved to {args.output} "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
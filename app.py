@@ -1,148 +1,86 @@
 from urllib import response
 import streamlit as st
-import base64
 from groq import Groq
 import os
 from PIL import Image
 import io
 from dotenv import load_dotenv
-from utils import get_alternatives
+from utils import (
+    get_alternatives,
+    get_catalog_alternatives,
+    get_query_planner,
+    get_resolver,
+    prime_query_embedding,
+    warmup,
+)
+from extraction import VLM_MODEL, run_extraction
+from comparison import generate_blurbs, render_comparison_cards, score_alternatives
+from card_stream import CardStreamParser
+import time
+from image_preprocessing import prepare_image
+from vlm_cache import VLMCache
+from resources import registry
+import logging
+import telemetry
+from telemetry import span
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize Groq client
+logging.basicConfig(
+    level=os.getenv("PARASAVE_LOG_LEVEL", "INFO"),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger("parasave")
+
+# Set PARASAVE_SINGLE_CALL_EXTRACTION=1 to extract everything in one VLM call
+SINGLE_CALL_EXTRACTION = os.getenv("PARASAVE_SINGLE_CALL_EXTRACTION") == "1"
+
+# "local" renders the comparison cards from computed scores, "llm" asks Groq
+# to write the whole HTML. PARASAVE_LLM_BLURBS=1 adds LLM "why" sentences to
+# the local cards.
+CARD_RENDERER = os.getenv("PARASAVE_CARD_RENDERER", "local")
+LLM_BLURBS = os.getenv("PARASAVE_LLM_BLURBS") == "1"
+# Stream the LLM-generated cards as they complete (PARASAVE_LLM_STREAMING=0 to disable)
+LLM_STREAMING = os.getenv("PARASAVE_LLM_STREAMING", "1") == "1"
+
+registry.register("groq", lambda: Groq(api_key=os.getenv("GROQ_API_KEY")))
+# Cache of VLM answers keyed by image content (PARASAVE_VLM_CACHE="" disables it)
+VLM_CACHE_PATH = os.getenv("PARASAVE_VLM_CACHE", "vlm_cache.sqlite")
+registry.register("vlm_cache", lambda: VLMCache(VLM_CACHE_PATH))
+
+def get_vlm_cache():
+    if not VLM_CACHE_PATH:
+        return None
+    cache = registry.get("vlm_cache")
+    telemetry.metrics.register_collector("vlm_cache", cache.stats)
+    return cache
+
+# Initialize Groq client (one shared client per process)
 def get_groq_client():
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         st.error("Please set GROQ_API_KEY environment variable")
         st.stop()
-    return Groq(api_key=api_key)
+    return registry.get("groq")
+
+# Load the models once per process, not on every script rerun
+@st.cache_resource(show_spinner="Loading models...")
+def load_resources():
+    # PARASAVE_METRICS_PORT serves /metrics for Prometheus
+    metrics_port = os.getenv("PARASAVE_METRICS_PORT")
+    if metrics_port:
+        telemetry.serve_metrics(int(metrics_port))
+    return warmup()
 
 # Function to encode image to base64
-def encode_image(image_file):
-    """Convert uploaded image to base64 string"""
+def encode_image(image_file, purpose="product"):
+    """Downscale and re-encode an uploaded image for the VLM (see prepare_image)"""
     if image_file is not None:
-        bytes_data = image_file.getvalue()
-        return base64.b64encode(bytes_data).decode('utf-8')
+        with span("preprocess", purpose=purpose):
+            return prepare_image(image_file.getvalue(), purpose=purpose)
     return None
 
-# Function to extract product name and brand
-def extract_product_info(client, image_base64):
-    """Extract product name and brand from image using Groq VLM"""
-    try:
-        response = client.chat.completions.create(
-            model="meta-llama/llama-4-scout-17b-16e-instruct",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}"
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": """Analyze this product image and extract the following information:
-
-Please provide the information in this exact format:
-Product Name: [name]
-Provide the whole name not just the brand
-If the text is in a language other than English, please provide the original text."""
-                        }
-                    ]
-                }
-            ],
-            temperature=0.1,
-            max_tokens=500
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error: {str(e)}"
-
-# Function to extract ingredients/composition
-def extract_ingredients(client, image_base64):
-    """Extract ingredients/composition from image using Groq VLM"""
-    try:
-        response = client.chat.completions.create(
-            model="meta-llama/llama-4-scout-17b-16e-instruct",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}"
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": """Analyze this image and extract all ingredients or composition information visible.
-
-Please list all ingredients/components you can identify, maintaining the original language if it's not in English.
-
-IMPORTANT: Return the ingredients as a single line separated by semicolons (;)
-
-Format:
-ingredient1;ingredient2;ingredient3;ingredient4
-
-If percentages or quantities are mentioned, include them with the ingredient name."""
-                        }
-                    ]
-                }
-            ],
-            temperature=0.1,
-            max_tokens=1000
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        return f"Error: {str(e)}"
-
-# Function to extract product category
-def extract_category(client, image_base64):
-    """Extract product category from predefined categories using Groq VLM"""
-    try:
-        response = client.chat.completions.create(
-            model="meta-llama/llama-4-scout-17b-16e-instruct",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}"
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": """Analyze this product image and determine which category it belongs to.
-
-The ONLY valid categories are:
-1. solar - Solar cream, sun cream, crème solaire, écran solaire
-2. foodSup - Food supplements, vitamins, dietary supplements, complément alimentaire
-3. faceGel - Face gels, gel nettoyant, purifiant, clean
-
-Instructions:
-- Respond with ONLY ONE of these exact words: solar, foodSup, or faceGel
-- If the product does not fit ANY of these categories, respond with: "Not one of the categories we are dealing with"
-- Be strict: only choose a category if you are confident the product fits
-
-Your response:"""
-                        }
-                    ]
-                }
-            ],
-            temperature=0.1,
-            max_tokens=100
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        return f"Error: {str(e)}"
-
 final_prompt = """
 
 You are comparing a reference product to similar alternatives found via vector search. 
@@ -191,19 +129,75 @@ You are comparing a reference product to similar alternatives found via vector s
 </div>
 """
 
-def get_alternatives_html(product_name, ingredients, category, budget):
-    """Generate HTML for alternatives using Groq"""
-    client = get_groq_client()
+CARDS_WRAPPER = "<div style='display: flex; flex-direction: column; gap: 1.5rem;'>{cards}</div>"
+
+def stream_alternatives_html(client, messages, placeholder):
+    """
+    Stream the LLM-generated cards into a Streamlit placeholder.
+
+    Each card is rendered as soon as its closing </div> arrives, instead of
+    waiting for the whole generation.
+
+    Returns:
+        Final HTML
+    """
+    start = time.perf_counter()
+    time_to_first_card = None
+    parser = CardStreamParser()
     
-    # Get alternatives from Qdrant
-    alternatives = get_alternatives(
-        ingredients=ingredients,
-        category=category,
-        budget=budget
+    stream = client.chat.completions.create(
+        model=VLM_MODEL,
+        messages=messages,
+        temperature=0.1,
+        max_tokens=2000,
+        stream=True
     )
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        new_cards = parser.feed(chunk.choices[0].delta.content or "")
+        if new_cards:
+            if time_to_first_card is None:
+                time_to_first_card = time.perf_counter() - start
+            placeholder.markdown(
+                CARDS_WRAPPER.format(cards="".join(parser.cards)), unsafe_allow_html=True
+            )
+    
+    total = time.perf_counter() - start
+    first = f"{time_to_first_card:.2f}s" if time_to_first_card is not None else "n/a"
+    if time_to_first_card is not None:
+        telemetry.observe("time_to_first_card_seconds", time_to_first_card)
+    logger.info("⏱️ Cards streamed: %d, first card %s, total %.2fs", len(parser.cards), first, total)
+    st.caption(f"⏱️ First card after {first}, all cards after {total:.2f}s")
+    
+    # No recognisable card: show whatever the model produced
+    if not parser.cards:
+        return parser.buffer
+    return CARDS_WRAPPER.format(cards="".join(parser.cards))
+
+def get_alternatives_html(product_name, ingredients, category, budget, alternatives=None, placeholder=None):
+    """Generate HTML for alternatives using Groq (streamed into placeholder if given)"""
+    client = get_groq_client()
+    
+    # Get alternatives from Qdrant (unless the extraction stage already did)
+    if alternatives is None:
+        alternatives = get_alternatives(
+            ingredients=ingredients,
+            category=category,
+            budget=budget
+        )
     
     # Check if we got results
     if not alternatives:
+        cheapest = get_query_planner().cheapest(category)
+        if cheapest is not None and budget < cheapest:
+            return f"""
+        <div style='background: linear-gradient(135deg, #fbbf24, #f59e0b); 
+                   padding: 2rem; border-radius: 15px; color: white; text-align: center;'>
+            <h3>💸 No products under {budget:.2f}dt</h3>
+            <p>The cheapest {category} product costs {cheapest:.2f}dt. Try a higher budget.</p>
+        </div>
+        """
         return """
         <div style='background: linear-gradient(135deg, #fbbf24, #f59e0b); 
                    padding: 2rem; border-radius: 15px; color: white; text-align: center;'>
@@ -212,6 +206,13 @@ def get_alternatives_html(product_name, ingredients, category, budget):
         </div>
         """
     
+    if CARD_RENDERER == "local":
+        scores = score_alternatives(ingredients, alternatives, budget, resolver=get_resolver())
+        blurbs = None
+        if LLM_BLURBS:
+            blurbs = generate_blurbs(client, VLM_MODEL, product_name, ingredients, alternatives, scores)
+        return render_comparison_cards(alternatives, scores, category, budget, blurbs)
+    
     # Format alternatives for prompt
     alternatives_text = ""
     for i, alt in enumerate(alternatives[:5], 1):
@@ -228,18 +229,23 @@ Alternative {i}:
 
 """
     
+    messages = [
+        {"role": "system", "content": "You are a helpful assistant that generates beautiful HTML for product comparisons."},
+        {"role": "user", "content": final_prompt.format(
+            product_name=product_name,
+            ingredients=", ".join(ingredients[:10]),
+            alternatives=alternatives_text
+        )}
+    ]
+    
     # Generate HTML for alternatives
     try:
+        if placeholder is not None and LLM_STREAMING:
+            return stream_alternatives_html(client, messages, placeholder)
+        
         response = client.chat.completions.create(
-            model="meta-llama/llama-4-scout-17b-16e-instruct",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that generates beautiful HTML for product comparisons."},
-                {"role": "user", "content": final_prompt.format(
-                    product_name=product_name,
-                    ingredients=", ".join(ingredients[:10]),
-                    alternatives=alternatives_text
-                )}
-            ],
+            model=VLM_MODEL,
+            messages=messages,
             temperature=0.1,
             max_tokens=2000
         )
@@ -249,28 +255,6 @@ Alternative {i}:
         return f"<p>Error: {str(e)}</p>"
 
 
-# Helper function to parse ingredients (✅ FIXED: use semicolon)
-def parse_ingredients_list(ingredients_text):
-    """Extract clean list of ingredients from AI response"""
-    # Remove any markdown, extra text
-    ingredients_text = ingredients_text.strip()
-    
-    # Split by semicolon (as requested in prompt)
-    if ';' in ingredients_text:
-        ingredients = [ing.strip() for ing in ingredients_text.split(';') if ing.strip()]
-    else:
-        # Fallback: try comma if semicolon not found
-        ingredients = [ing.strip() for ing in ingredients_text.split(',') if ing.strip()]
-    
-    # Clean up - remove any "Format:" or instruction text
-    ingredients = [ing for ing in ingredients if not ing.lower().startswith(('format', 'ingredient'))]
-    
-    # Lowercase for matching
-    ingredients = [ing.lower() for ing in ingredients]
-    
-    return ingredients[:20]  # Top 20 ingredients
-
-
 # Streamlit UI
 def main():
     st.set_page_config(page_title="Product Information Extractor", layout="wide")
@@ -278,8 +262,9 @@ def main():
     st.title("🛍️ ParaSave: Wellnes Product Information Extractor & Alternatives Finder")
     st.markdown("Extract product details and find **budget-friendly alternatives** using AI-powered search")
     
-    # Initialize Groq client
+    # Initialize Groq client and warm up the search stack
     client = get_groq_client()
+    load_resources()
     
     # Create three columns for inputs
     col1, col2, col3 = st.columns(3)
@@ -322,25 +307,39 @@ def main():
         if not product_image or not ingredients_image:
             st.warning("⚠️ Please upload **both images** and set your budget!")
         else:
-            with st.spinner("🔍 Analyzing images + searching alternatives..."):
+            with st.spinner("🔍 Analyzing images + searching alternatives..."), telemetry.request("scan") as trace:
                 # Encode images
-                product_b64 = encode_image(product_image)
-                ingredients_b64 = encode_image(ingredients_image)
+                product_prepared = encode_image(product_image, purpose="product")
+                ingredients_prepared = encode_image(ingredients_image, purpose="ingredients")
                 
-                # Extract information
+                # Extract information (concurrent VLM calls + speculative search)
                 with st.spinner("Extracting product details..."):
-                    product_info = extract_product_info(client, product_b64)
-                    category = extract_category(client, product_b64)
-                    ingredients_list = extract_ingredients(client, ingredients_b64)
+                    extraction = run_extraction(
+                        client,
+                        product_prepared.base64,
+                        ingredients_prepared.base64,
+                        budget=budget,
+                        search_fn=get_alternatives,
+                        prime_fn=prime_query_embedding,
+                        single_call=SINGLE_CALL_EXTRACTION,
+                        product_mime=product_prepared.mime_type,
+                        ingredients_mime=ingredients_prepared.mime_type,
+                        cache=get_vlm_cache(),
+                        catalog_fn=get_catalog_alternatives,
+                    )
+                product_info = extraction["product_info"]
+                category = extraction["category"]
+                ingredients_list = extraction["ingredients_raw"]
                 
                 # Display extracted info for debugging
                 with st.expander("🔍 Extracted Information (Debug)"):
                     st.write("**Product Info:**", product_info)
                     st.write("**Category:**", category)
                     st.write("**Raw Ingredients:**", ingredients_list)
+                    st.write("**Timings (s):**", extraction["timings"])
                 
-                # Parse ingredients
-                ingredients_clean = parse_ingredients_list(ingredients_list)
+                # Parsed ingredients
+                ingredients_clean = extraction["ingredients"]
                 
                 st.write("**Parsed Ingredients:**", ingredients_clean)
                 
@@ -350,15 +349,6 @@ def main():
                     st.error(f"⚠️ Invalid category: {category}. Must be one of: {valid_categories}")
                     st.stop()
                 
-                # CALL get_alternatives FUNCTION
-                st.info("🎯 Finding similar alternatives...")
-                alternatives_html = get_alternatives_html(
-                    product_name=product_info,
-                    ingredients=ingredients_clean,
-                    category=category,
-                    budget=budget
-                )
-                
                 # BEAUTIFUL RESULTS DISPLAY
                 st.markdown("## 🎉 **Results**")
                 
@@ -384,8 +374,25 @@ def main():
                 </div>
                 """, unsafe_allow_html=True)
                 
+                # CALL get_alternatives FUNCTION (streamed cards land in the placeholder)
+                alternatives_placeholder = st.empty()
+                alternatives_placeholder.info("🎯 Finding similar alternatives...")
+                with span("html", renderer=CARD_RENDERER):
+                    alternatives_html = get_alternatives_html(
+                        product_name=product_info,
+                        ingredients=ingredients_clean,
+                        category=category,
+                        budget=budget,
+                        alternatives=extraction["alternatives"],
+                        placeholder=alternatives_placeholder
+                    )
+                
                 # RENDER ALTERNATIVES HTML
-                st.markdown(alternatives_html, unsafe_allow_html=True)
+                alternatives_placeholder.markdown(alternatives_html, unsafe_allow_html=True)
+                
+                if trace:
+                    with st.expander("⏱️ Stage timings (Debug)"):
+                        st.code(telemetry.format_trace(trace))
     
     # Footer
     st.markdown("---")
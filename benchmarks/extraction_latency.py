@@ -0,0 +1,68 @@
+"""
+Compare sequential, concurrent and single-call extraction latency against
+the stub Groq server.
+
+Usage:
+    python -m benchmarks.extraction_latency --delay 0.8 --search-delay 0.3 --runs 5
+"""
+import argparse
+import statistics
+import time
+
+from groq import Groq
+
+from benchmarks.groq_stub import start_stub_server
+from extraction import (
+    extract_category,
+    extract_ingredients,
+    extract_product_info,
+    parse_ingredients_list,
+    run_extraction,
+)
+
+
+def run_sequential(client, image, budget, search_fn):
+    """The pre-concurrency flow of app.main()."""
+    start = time.perf_counter()
+    extract_product_info(client, image)
+    category = extract_category(client, image)
+    ingredients = parse_ingredients_list(extract_ingredients(client, image))
+    search_fn(ingredients, category, budget)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extraction latency benchmark")
+    parser.add_argument("--delay", type=float, default=0.8, help="stub VLM latency (s)")
+    parser.add_argument("--search-delay", type=float, default=0.3, help="simulated search latency (s)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(delay=args.delay)
+    client = Groq(api_key="stub", base_url=base_url)
+    image = "aGVsbG8="
+
+    def search_fn(ingredients, category, budget):
+        time.sleep(args.search_delay)
+        return []
+
+    modes = {
+        "sequential": lambda: run_sequential(client, image, 50, search_fn),
+        "concurrent": lambda: run_extraction(
+            client, image, image, budget=50, search_fn=search_fn
+        )["timings"]["total"],
+        "single_call": lambda: run_extraction(
+            client, image, image, budget=50, search_fn=search_fn, single_call=True
+        )["timings"]["total"],
+    }
+
+    try:
+        for name, run in modes.items():
+            latencies = [run() for _ in range(args.runs)]
+            print(f"{name:12s} median {statistics.median(latencies) * 1000:7.1f} ms")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
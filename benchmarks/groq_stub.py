@@ -0,0 +1,170 @@
+"""
+Local stand-in for the Groq chat completions API.
+
+Answers the ParaSave extraction prompts with canned responses after a
+configurable delay, so latency can be measured without network noise or
+API costs. Requests with "stream": true get the answer back as server-sent
+events in small chunks, like the real API. Point the Groq client at it with base_url (or GROQ_BASE_URL).
+
+Usage:
+    python -m benchmarks.groq_stub --port 8765 --delay 0.8
+    GROQ_BASE_URL=http://127.0.0.1:8765 GROQ_API_KEY=stub streamlit run app.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+CANNED_ANSWERS = {
+    "product_info": "Product Name: Bioderma Photoderm Crème SPF50+ 40ml",
+    "category": "solar",
+    "ingredients": (
+        "aqua;dicaprylyl carbonate;glycerin;octocrylene;butyl methoxydibenzoylmethane;"
+        "titanium dioxide;methylene bis-benzotriazolyl tetramethylbutylphenol;"
+        "cyclopentasiloxane;tocopherol;phenoxyethanol"
+    ),
+    "all": json.dumps({
+        "product_name": "Bioderma Photoderm Crème SPF50+ 40ml",
+        "category": "solar",
+        "ingredients": ["aqua", "dicaprylyl carbonate", "glycerin", "octocrylene",
+                        "butyl methoxydibenzoylmethane", "titanium dioxide", "tocopherol"],
+    }),
+    "html": (
+        "<div style='display: flex; flex-direction: column; gap: 1.5rem;'>"
+        "<div><h3>🥇 Alternative #1</h3><p>Stub card</p></div>"
+        "<div><h3>🥈 Alternative #2</h3><p>Stub card</p></div>"
+        "<div><h3>🥉 Alternative #3</h3><p>Stub card</p></div>"
+        "</div>"
+    ),
+}
+
+# Characters per streamed chunk (roughly a few tokens)
+STREAM_CHUNK_SIZE = 12
+
+
+def classify_prompt(body):
+    """Return which ParaSave call a chat completion request corresponds to."""
+    texts = []
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            texts.append(content)
+        else:
+            texts.extend(part.get("text", "") for part in content if part.get("type") == "text")
+    prompt = "\n".join(texts)
+
+    if body.get("response_format", {}).get("type") == "json_object":
+        return "all"
+    if "ONLY valid categories" in prompt:
+        return "category"
+    if "extract all ingredients" in prompt:
+        return "ingredients"
+    if "Product Name:" in prompt:
+        return "product_info"
+    return "html"
+
+
+def make_handler(delays, chunk_delay=0.02):
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            task = classify_prompt(body)
+            if body.get("stream"):
+                self._stream(body, task)
+                return
+            time.sleep(delays.get(task, delays["default"]))
+
+            answer = {
+                "id": f"stub-{task}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": CANNED_ANSWERS[task]},
+                    "finish_reason": "stop",
+                    "logprobs": None,
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }
+            data = json.dumps(answer).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, body, task):
+            # The delay is time to first token, then one chunk every chunk_delay
+            time.sleep(delays.get(task, delays["default"]))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+
+            text = CANNED_ANSWERS[task]
+            for start in range(0, len(text) + 1, STREAM_CHUNK_SIZE):
+                last = start + STREAM_CHUNK_SIZE > len(text)
+                chunk = {
+                    "id": f"stub-{task}",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "stub"),
+                    "choices": [{
+                        "index": 0,
+                        "delta": {"content": text[start:start + STREAM_CHUNK_SIZE]},
+                        "finish_reason": "stop" if last else None,
+                        "logprobs": None,
+                    }],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(chunk_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+        def log_message(self, format, *args):
+            pass
+
+    return StubHandler
+
+
+def start_stub_server(port=0, delay=0.8, delays=None, chunk_delay=0.02):
+    """
+    Start the stub server in a background thread.
+
+    Args:
+        port: Port to listen on (0 picks a free one)
+        delay: Default response delay in seconds
+        delays: Optional per-task delays ("product_info", "category", ...)
+        chunk_delay: Delay between streamed chunks in seconds
+
+    Returns:
+        Tuple of (server, base_url). Call server.shutdown() to stop it.
+    """
+    all_delays = {"default": delay}
+    all_delays.update(delays or {})
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(all_delays, chunk_delay))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub Groq server")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--delay", type=float, default=0.8)
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server(args.port, args.delay)
+    print(f"✅ Stub Groq server on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Memory, latency and recall of quantized dense vectors against float32.
+
+Runs the dense prefetch of the local engine (LocalSearchEngine.quantize)
+with float32, int8 and binary vectors, with and without rescoring the
+oversampled candidates with the float vectors. Queries are catalog
+products' ingredient lists (as in retrieval_bench), searched two ways:
+
+    filtered  category and price <= budget, like the app
+    catalog   the whole catalog, the scan that grows with it
+
+Reported for every mode:
+    - bytes scanned per full pass and the share saved against float32
+      (rescoring also reads oversampling * k float rows per query)
+    - p50/p95 latency of the dense prefetch
+    - recall@k of the dense top k against the float32 exact top k, and of
+      the app's hybrid query (RRF) against the same query on float32
+
+--scale N grows the catalog N times with perturbed copies of the vectors,
+to see how the scan cost grows past the three scraped categories.
+
+--qdrant-url runs the same comparison on Qdrant collections created with
+ingestion.create_collection(quantization=...); they are deleted afterwards.
+An in-memory (":memory:") Qdrant accepts the settings but does not
+quantize, so use a server.
+
+Usage:
+    python -m benchmarks.quantization_bench --queries 200 --oversampling 1,2,4
+    python -m benchmarks.quantization_bench --scale 20 --output quantization.json
+    python -m benchmarks.quantization_bench --qdrant-url http://localhost:6333
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import time
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.models import QuantizationSearchParams, SearchParams
+from scipy import sparse
+
+import utils
+from benchmarks.retrieval_bench import _format_metric, _load_model, make_queries, percentiles, recall_at_k
+from catalog import CATALOG_PATH, catalog_version, load_catalog
+from embedding_cache import EmbeddingCache
+from ingestion import COLLECTION_NAME, create_collection, iter_point_batches, upsert_batches
+from local_search import LocalSearchEngine
+from quantization import QUANTIZATION_KINDS
+from resources import registry
+
+
+# Noise of the perturbed copies of --scale (per component, before
+# renormalizing 384-dim unit vectors)
+SCALE_NOISE = 0.02
+
+
+def scale_engine(engine, scale, seed=0):
+    """
+    Engine over the catalog repeated scale times, every copy's dense
+    vectors perturbed so the copies do not tie.
+    """
+    if scale <= 1:
+        return engine
+    rng = np.random.default_rng(seed)
+    dense = [engine.dense]
+    for _ in range(scale - 1):
+        copy = engine.dense + rng.normal(0, SCALE_NOISE, engine.dense.shape).astype(np.float32)
+        dense.append(copy / np.linalg.norm(copy, axis=1, keepdims=True))
+    return LocalSearchEngine(
+        engine.records * scale,
+        np.vstack(dense),
+        sparse.vstack([engine.sparse] * scale, format="csr"),
+    )
+
+
+def encode_queries(model, resolver, queries):
+    """Dense and sparse vectors of benchmark queries, as the app builds them."""
+    texts = [utils.build_query(query["ingredients"])[1] for query in queries]
+    dense = model.encode(texts, convert_to_numpy=True, batch_size=32)
+    return [
+        (vector, utils.create_sparse_vector(utils.build_query(query["ingredients"])[0], resolver))
+        for vector, query in zip(dense, queries)
+    ]
+
+
+def run_mode(engine, queries, vectors, k, prefetch_limit):
+    """
+    Dense prefetch and hybrid query of every query with the engine's
+    current quantization.
+
+    Returns:
+        Dict of scope -> (dense latencies, dense top-k row IDs per query),
+        and the hybrid top-k point IDs per query
+    """
+    all_rows = np.arange(len(engine))
+    scopes = {"filtered": ([], []), "catalog": ([], [])}
+    hybrid = []
+    for query, (dense, query_sparse) in zip(queries, vectors):
+        for scope, (latencies, tops) in scopes.items():
+            rows = engine.filter_rows(query["category"], query["budget"]) if scope == "filtered" else all_rows
+            start = time.perf_counter()
+            top, _ = engine.dense_prefetch(dense, rows, k)
+            latencies.append(time.perf_counter() - start)
+            tops.append(rows[top].tolist())
+        response = engine.query(
+            dense, query_sparse, query["category"], query["budget"], prefetch_limit=prefetch_limit, limit=k
+        )
+        hybrid.append([point.id for point in response.points])
+    return scopes, hybrid
+
+
+def _mean_recall(results, truths, k):
+    values = [recall_at_k(result, truth, k) for result, truth in zip(results, truths)]
+    values = [value for value in values if value is not None]
+    return float(np.mean(values)) if values else None
+
+
+def local_modes(kinds, oversampling_values):
+    """(label, kind, oversampling, rescore) of every local mode, float first."""
+    modes = [("float32", None, 1.0, True)]
+    for kind in kinds:
+        modes.append((f"{kind} no rescore", kind, 1.0, False))
+        for oversampling in oversampling_values:
+            modes.append((f"{kind} rescore x{oversampling:g}", kind, oversampling, True))
+    return modes
+
+
+def benchmark_local(engine, queries, vectors, kinds, oversampling_values, k, prefetch_limit):
+    # Untimed pass: first touches of the vectors and the sparse matrix
+    run_mode(engine, queries[:10], vectors[:10], k, prefetch_limit)
+
+    float_bytes = engine.dense.nbytes
+    results = []
+    truths = None
+    for label, kind, oversampling, rescore in local_modes(kinds, oversampling_values):
+        engine.quantize(kind, oversampling=oversampling, rescore=rescore)
+        scopes, hybrid = run_mode(engine, queries, vectors, k, prefetch_limit)
+        if truths is None:
+            truths = ({scope: tops for scope, (_, tops) in scopes.items()}, hybrid)
+        index_bytes = engine.quantized.nbytes if engine.quantized is not None else float_bytes
+        result = {
+            "mode": label,
+            "quantization": kind or "none",
+            "oversampling": oversampling,
+            "rescore": rescore,
+            "index_bytes": int(index_bytes),
+            "memory_saved": 1 - index_bytes / float_bytes,
+            f"hybrid_recall@{k}": _mean_recall(hybrid, truths[1], k),
+        }
+        for scope, (latencies, tops) in scopes.items():
+            result[scope] = {
+                "latency_ms": percentiles(latencies),
+                f"recall@{k}": _mean_recall(tops, truths[0][scope], k),
+            }
+        results.append(result)
+    engine.quantize(None)
+    return results
+
+
+def benchmark_qdrant(client, engine, queries, vectors, kinds, oversampling_values, k, keep=False, workers=4):
+    """
+    Dense queries of the filtered scope against one collection per
+    quantization, with the float32 exact search as the truth.
+    """
+    records = engine.records
+    vocab = utils.get_vocab()
+    collections = {}
+    for kind in ["none"] + list(kinds):
+        name = f"{COLLECTION_NAME}_bench_{kind}"
+        create_collection(client, name, dense_dim=engine.dense.shape[1], recreate=True, quantization=kind)
+        batches = iter_point_batches(records, vocab, None, embeddings=np.asarray(engine.dense))
+        upsert_batches(client, batches, name, workers=workers)
+        collections[kind] = name
+
+    def run(name, search_params):
+        latencies = []
+        tops = []
+        for query, (dense, _) in zip(queries, vectors):
+            start = time.perf_counter()
+            response = client.query_points(
+                collection_name=name,
+                query=dense.tolist(),
+                using="dense",
+                query_filter=utils._price_category_filter(query["budget"], query["category"]),
+                search_params=search_params,
+                limit=k,
+                with_payload=False,
+            )
+            latencies.append(time.perf_counter() - start)
+            tops.append([point.id for point in response.points])
+        return latencies, tops
+
+    _, truths = run(collections["none"], SearchParams(exact=True))
+    modes = [("float32 hnsw", "none", None, None)]
+    for kind in kinds:
+        modes.append((f"{kind} no rescore", kind, 1.0, False))
+        for oversampling in oversampling_values:
+            modes.append((f"{kind} rescore x{oversampling:g}", kind, oversampling, True))
+
+    results = []
+    try:
+        for label, kind, oversampling, rescore in modes:
+            search_params = None
+            if rescore is not None:
+                search_params = SearchParams(
+                    quantization=QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+                )
+            latencies, tops = run(collections[kind], search_params)
+            results.append({
+                "mode": label,
+                "quantization": kind,
+                "oversampling": oversampling,
+                "rescore": rescore,
+                "latency_ms": percentiles(latencies),
+                f"recall@{k}": _mean_recall(tops, truths, k),
+            })
+    finally:
+        if not keep:
+            for name in collections.values():
+                client.delete_collection(name)
+    return results
+
+
+def print_report(report, k):
+    print(f"Local dense prefetch, {report['config']['products']} products")
+    for result in report["local"]:
+        print(
+            f"{result['mode']:<20s} {result['index_bytes'] / 1024:9.1f} KB "
+            f"({result['memory_saved']:6.1%} saved) | hybrid recall@{k} {_format_metric(result[f'hybrid_recall@{k}'])}"
+        )
+        for scope in ("filtered", "catalog"):
+            stats = result[scope]
+            print(
+                f"    {scope:<9s} recall@{k} {_format_metric(stats[f'recall@{k}'])}  "
+                f"p50 {stats['latency_ms']['p50']:7.3f} ms  p95 {stats['latency_ms']['p95']:7.3f} ms"
+            )
+    if report.get("qdrant"):
+        print("Qdrant dense search, filtered")
+        for result in report["qdrant"]:
+            print(
+                f"{result['mode']:<20s} recall@{k} {_format_metric(result[f'recall@{k}'])}  "
+                f"p50 {result['latency_ms']['p50']:7.2f} ms  p95 {result['latency_ms']['p95']:7.2f} ms"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantized dense vectors: memory, latency and recall")
+    parser.add_argument("--model", default=utils.MODEL_NAME, help="sentence-transformers model name")
+    parser.add_argument("--embeddings", default=None, help="Optional .npy cache of the catalog vectors")
+    parser.add_argument("--catalog", default=CATALOG_PATH)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--prefetch-limit", type=int, default=100, help="Prefetch limit of the hybrid query")
+    parser.add_argument("--quantization", default=",".join(QUANTIZATION_KINDS), help="Comma-separated kinds")
+    parser.add_argument("--oversampling", default="1,2,4", help="Comma-separated oversampling factors")
+    parser.add_argument("--scale", type=int, default=1, help="Repeat the catalog N times (perturbed copies)")
+    parser.add_argument("--qdrant-url", default=None, help="Also compare quantized Qdrant collections")
+    parser.add_argument("--keep-collections", action="store_true", help="Do not delete the Qdrant bench collections")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    kinds = [kind for kind in args.quantization.split(",") if kind]
+    oversampling_values = [float(value) for value in args.oversampling.split(",")]
+
+    if args.model != utils.MODEL_NAME:
+        registry.register("model", lambda: _load_model(args.model))
+    registry.register("embedding_cache", lambda: EmbeddingCache(utils.get_model(), args.model))
+    model = utils.get_model()
+    records = load_catalog(args.catalog)
+
+    start = time.perf_counter()
+    engine = LocalSearchEngine.from_catalog(
+        utils.get_vocab(), model, catalog_path=args.catalog, embeddings_path=args.embeddings
+    )
+    queries = make_queries(records, args.queries, 0.0, seed=args.seed)
+    vectors = encode_queries(model, utils.get_resolver(), queries)
+    scaled = scale_engine(engine, args.scale, seed=args.seed)
+    print(f"✅ {len(scaled)} products and {len(queries)} queries ready in {time.perf_counter() - start:.1f}s")
+
+    report = {
+        "config": {
+            "model": args.model,
+            "queries": len(queries),
+            "k": args.k,
+            "prefetch_limit": args.prefetch_limit,
+            "scale": args.scale,
+            "products": len(scaled),
+            "dim": int(engine.dense.shape[1]),
+            "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "catalog_version": catalog_version(args.catalog),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "local": benchmark_local(scaled, queries, vectors, kinds, oversampling_values, args.k, args.prefetch_limit),
+    }
+
+    if args.qdrant_url:
+        if args.qdrant_url == ":memory:":
+            client = QdrantClient(":memory:")
+            print("⚠️ In-memory Qdrant ignores quantization: only the code path is exercised")
+            # Local-mode Qdrant is not safe to write from several threads
+            workers = 1
+        else:
+            client = QdrantClient(args.qdrant_url, api_key=os.getenv("QDRANT_API_KEY"))
+            workers = 4
+        report["qdrant"] = benchmark_qdrant(
+            client, engine, queries, vectors, kinds, oversampling_values, args.k, args.keep_collections, workers
+        )
+
+    print_report(report, args.k)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
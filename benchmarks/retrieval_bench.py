@@ -0,0 +1,563 @@
+"""
+Offline latency and recall benchmark of the retrieval path.
+
+Loads the catalog into the local engine or an in-memory Qdrant collection
+and replays queries built from catalog products through
+utils.search_products, optionally with OCR-style noise. The VLM is not
+called: each query is a product's ingredient list passed through the
+app's ingredient parser, as if Groq had returned it.
+
+Reported for every parameter set and noise level:
+    - p50/p95/p99 latency of every stage (encode, sparse, search, rerank)
+    - throughput and latency with N concurrent clients
+    - recall@k and nDCG@k against a brute-force ground truth, and how
+      often the scanned product itself is in the top k
+
+Ground truth (--truth):
+    exhaustive  the reference query (noise-free ingredients, lambda 0.65,
+                RRF) with every filtered product in both prefetches, as
+                exact numpy scores over the catalog. Measures what
+                prefetch truncation, the ANN index, noise and parameter
+                changes cost.
+    overlap     every filtered product ranked by the position-aware
+                ingredient overlap with the noise-free query. Does not
+                depend on the embedding model; use it to compare models.
+
+Usage:
+    python -m benchmarks.retrieval_bench --queries 200 --noise 0,0.1,0.3
+    python -m benchmarks.retrieval_bench --sweep prefetch_limit=auto,50,100 --sweep fusion=rrf,dbsf \\
+        --output bench.json
+    python -m benchmarks.retrieval_bench --output new.json --compare bench.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from qdrant_client import QdrantClient
+
+import telemetry
+import utils
+from catalog import CATALOG_PATH, catalog_version, load_catalog, product_id
+from embedding_cache import EmbeddingCache
+from extraction import parse_ingredients_list
+from ingestion import ingest
+from local_search import LocalSearchEngine
+from reranker import weighted_overlap
+from resources import registry
+
+
+# Parameters that can be swept, with their parser
+PARAMS = {
+    "lambda_decay": float,
+    # "auto": sized by the query planner
+    "prefetch_limit": lambda value: value if value == "auto" else int(value),
+    "fusion": str,
+    "rerank": lambda value: value.lower() in ("1", "true", "yes"),
+}
+
+# Reference parameters of the exhaustive ground truth
+REFERENCE_LAMBDA = 0.65
+REFERENCE_FUSION = "rrf"
+
+# Common OCR confusions on printed INCI lists
+OCR_CONFUSIONS = [
+    ("rn", "m"), ("m", "rn"), ("l", "1"), ("i", "l"), ("o", "0"),
+    ("e", "c"), ("cl", "d"), ("h", "b"), ("y", "v"),
+]
+
+STAGES = ["encode", "sparse", "local_search", "qdrant", "rerank"]
+
+
+def _ocr_edit(text, rng):
+    """Apply one random OCR-like edit to an ingredient."""
+    if not text:
+        return text
+    kind = rng.random()
+    if kind < 0.5:
+        candidates = [(wrong, right) for wrong, right in OCR_CONFUSIONS if wrong in text.lower()]
+        if candidates:
+            wrong, right = rng.choice(candidates)
+            pos = text.lower().find(wrong)
+            return text[:pos] + right + text[pos + len(wrong):]
+    pos = rng.randrange(len(text))
+    if kind < 0.75:
+        return text[:pos] + text[pos + 1:]  # dropped character
+    if kind < 0.9:
+        return text[:pos] + text[pos] + text[pos:]  # doubled character
+    return text.replace(" ", "", 1)  # lost space
+
+
+def add_ocr_noise(ingredients_text, rate, rng):
+    """
+    Corrupt a semicolon-separated ingredient list like a bad OCR pass.
+
+    Each ingredient is dropped with probability rate / 4, merged with the
+    next one (lost separator) with probability rate / 4, and otherwise gets
+    one character-level edit with probability rate.
+
+    Args:
+        ingredients_text: "ing1;ing2;..." string from the catalog
+        rate: Noise level in [0, 1]
+        rng: random.Random instance
+
+    Returns:
+        The noisy ingredient string
+    """
+    if rate <= 0:
+        return ingredients_text
+    noisy = []
+    for ingredient in ingredients_text.split(";"):
+        draw = rng.random()
+        if draw < rate / 4:
+            continue
+        if rng.random() < rate:
+            ingredient = _ocr_edit(ingredient, rng)
+        if draw < rate / 2 and noisy:
+            noisy[-1] = f"{noisy[-1]} {ingredient}"
+        else:
+            noisy.append(ingredient)
+    return ";".join(noisy)
+
+
+def make_queries(records, n_queries, noise, seed=0, budget_range=(1.0, 2.0)):
+    """
+    Build benchmark queries from catalog products.
+
+    The sampled products and budgets depend only on seed, so every noise
+    level replays the same products.
+
+    Args:
+        records: Catalog records
+        n_queries: Number of queries (capped at the catalog size)
+        noise: OCR noise level
+        seed: Random seed
+        budget_range: Budget as a multiple of the product's price
+
+    Returns:
+        List of query dicts: source (point ID), category, budget, ingredients
+        (noisy, parsed like a VLM answer) and clean_ingredients
+    """
+    rng = random.Random(seed)
+    candidates = [pos for pos, record in enumerate(records) if record.get("ingredients")]
+    sources = rng.sample(candidates, min(n_queries, len(candidates)))
+    budgets = [rng.uniform(*budget_range) for _ in sources]
+
+    noise_rng = random.Random(f"{seed}-{noise}")
+    queries = []
+    for source, factor in zip(sources, budgets):
+        record = records[source]
+        clean = parse_ingredients_list(record["ingredients"])
+        noisy = parse_ingredients_list(add_ocr_noise(record["ingredients"], noise, noise_rng))
+        queries.append({
+            "source": product_id(record),
+            "category": record["category"],
+            "budget": round(record["price"] * factor, 2),
+            "ingredients": noisy or clean[:1],
+            "clean_ingredients": clean,
+        })
+    return queries
+
+
+def ground_truth(engine, model, resolver, queries, k, truth="exhaustive"):
+    """
+    Brute-force top-k point IDs of every query (see the module docstring).
+
+    Returns:
+        List of ID lists, best first
+    """
+    truths = []
+    texts = [utils.build_query(query["clean_ingredients"])[1] for query in queries]
+    dense_vectors = model.encode(texts, convert_to_numpy=True)
+    for query, query_dense in zip(queries, dense_vectors):
+        query_sparse = utils.create_sparse_vector(query["clean_ingredients"], resolver, REFERENCE_LAMBDA)
+        if truth == "overlap":
+            rows = engine.filter_rows(query["category"], query["budget"])
+            overlap = weighted_overlap(query_sparse, engine.sparse[rows])
+            order = np.argsort(-overlap, kind="stable")[:k]
+            truths.append([engine.ids[rows[pos]] for pos in order if overlap[pos] > 0])
+        else:
+            response = engine.query(
+                query_dense, query_sparse, query["category"], query["budget"],
+                prefetch_limit=len(engine), limit=k, fusion=REFERENCE_FUSION,
+            )
+            truths.append([point.id for point in response.points])
+    return truths
+
+
+def recall_at_k(result_ids, truth_ids, k):
+    """Share of the true top k found in the top k results."""
+    truth = set(truth_ids[:k])
+    if not truth:
+        return None
+    return len(truth.intersection(result_ids[:k])) / len(truth)
+
+
+def ndcg_at_k(result_ids, truth_ids, k):
+    """nDCG@k with graded relevance: k for the true best, k - 1 for the next..."""
+    relevance = {point_id: k - rank for rank, point_id in enumerate(truth_ids[:k])}
+    if not relevance:
+        return None
+    dcg = sum(relevance.get(point_id, 0) / math.log2(pos + 2) for pos, point_id in enumerate(result_ids[:k]))
+    ideal = sum(rel / math.log2(pos + 2) for pos, rel in enumerate(sorted(relevance.values(), reverse=True)))
+    return dcg / ideal
+
+
+def percentiles(values):
+    """p50/p95/p99/mean of latencies in seconds, as milliseconds."""
+    if not values:
+        return None
+    values = np.asarray(values) * 1000
+    return {
+        "p50": float(np.percentile(values, 50)),
+        "p95": float(np.percentile(values, 95)),
+        "p99": float(np.percentile(values, 99)),
+        "mean": float(values.mean()),
+    }
+
+
+def parse_sweeps(specs):
+    """
+    Expand --sweep name=v1,v2 options into the list of parameter sets.
+
+    Returns:
+        List of {param: value} dicts (cartesian product, defaults first)
+    """
+    defaults = {
+        "lambda_decay": REFERENCE_LAMBDA,
+        "prefetch_limit": "auto",
+        "fusion": utils.FUSION,
+        "rerank": utils.RERANK,
+    }
+    axes = {}
+    for spec in specs or []:
+        name, _, values = spec.partition("=")
+        if name not in PARAMS or not values:
+            raise ValueError(f"Invalid sweep {spec!r}, expected one of {sorted(PARAMS)}=v1,v2,...")
+        axes[name] = [PARAMS[name](value) for value in values.split(",")]
+    names = list(axes)
+    return [
+        {**defaults, **dict(zip(names, combination))}
+        for combination in itertools.product(*axes.values())
+    ]
+
+
+def _fallback_count():
+    return sum(value for (name, _), value in telemetry.metrics.counters.items() if name == "fallbacks")
+
+
+def run_pass(client, queries, params, k, clients=1):
+    """
+    Run every query through utils.search_products.
+
+    Args:
+        client: QdrantClient (None for the local engine)
+        queries: Queries from make_queries
+        params: Search parameters (see PARAMS)
+        k: Results per query
+        clients: Concurrent client threads
+
+    Returns:
+        Dict with the result IDs, per-query traces and the wall time
+    """
+    resolver = utils.get_resolver()
+    model = utils.get_model()
+
+    def search(query):
+        ingredients_clean, query_text = utils.build_query(query["ingredients"])
+        with telemetry.request("query") as trace:
+            response = utils.search_products(
+                query_text,
+                ingredients_clean,
+                query["budget"],
+                query["category"],
+                resolver,
+                model,
+                client,
+                lambda_decay=params["lambda_decay"],
+                limit=k,
+                fusion=params["fusion"],
+                rerank=params["rerank"],
+                prefetch_limit=None if params["prefetch_limit"] == "auto" else params["prefetch_limit"],
+            )
+        return [point.id for point in response.points], trace
+
+    start = time.perf_counter()
+    if clients == 1:
+        outputs = [search(query) for query in queries]
+    else:
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            outputs = list(executor.map(search, queries))
+    wall = time.perf_counter() - start
+
+    return {
+        "ids": [ids for ids, _ in outputs],
+        "traces": [trace for _, trace in outputs],
+        "wall": wall,
+    }
+
+
+def stage_latencies(traces):
+    """Percentiles of every stage over a list of request traces."""
+    durations = {}
+    for trace in traces:
+        for name, _, _, duration in trace:
+            durations.setdefault(name, []).append(duration)
+    stages = {"total": percentiles(durations.get("query", []))}
+    stages.update({stage: percentiles(durations[stage]) for stage in STAGES if stage in durations})
+    return stages
+
+
+def _mean(values):
+    values = [value for value in values if value is not None]
+    return float(np.mean(values)) if values else None
+
+
+def benchmark(client, query_sets, truths, params, k, client_levels, warm_cache=False):
+    """
+    Quality, stage latency and throughput of one parameter set.
+
+    Returns:
+        List of result dicts, one per noise level
+    """
+    cache = utils.get_embedding_cache()
+    result_cache = utils.get_result_cache()
+    results = []
+    for noise, queries in query_sets.items():
+        if not warm_cache:
+            cache.clear()
+            result_cache.clear()
+        fallbacks = _fallback_count()
+        run = run_pass(client, queries, params, k)
+        result = {
+            "params": params,
+            "noise": noise,
+            "queries": len(queries),
+            f"recall@{k}": _mean(recall_at_k(ids, truth, k) for ids, truth in zip(run["ids"], truths)),
+            f"ndcg@{k}": _mean(ndcg_at_k(ids, truth, k) for ids, truth in zip(run["ids"], truths)),
+            f"source_hit@{k}": _mean(
+                float(query["source"] in ids[:k]) for ids, query in zip(run["ids"], queries)
+            ),
+            "fallbacks": _fallback_count() - fallbacks,
+            "latency_ms": stage_latencies(run["traces"]),
+            "throughput": [],
+        }
+
+        # Throughput only for the first noise level (quality does not depend on it)
+        if noise == next(iter(query_sets)):
+            for clients in client_levels:
+                if not warm_cache:
+                    cache.clear()
+                    result_cache.clear()
+                load = run_pass(client, queries, params, k, clients=clients)
+                totals = [duration for trace in load["traces"] for name, _, _, duration in trace if name == "query"]
+                result["throughput"].append({
+                    "clients": clients,
+                    "qps": len(queries) / load["wall"],
+                    "latency_ms": percentiles(totals),
+                })
+        results.append(result)
+    return results
+
+
+def _format_metric(value):
+    """A quality metric for the report: "n/a" when no query had a ground truth."""
+    return "n/a" if value is None else f"{value:.3f}"
+
+
+def _result_key(result):
+    return json.dumps(result["params"], sort_keys=True), result["noise"]
+
+
+def compare(current, baseline, max_quality_drop=0.01, max_slowdown=0.25):
+    """
+    Regressions of a run against a baseline run (same params and noise).
+
+    Args:
+        current: Report dict of this run
+        baseline: Report dict loaded from a previous --output
+        max_quality_drop: Allowed absolute drop of recall/nDCG/source hits
+        max_slowdown: Allowed relative increase of p95 latency (and drop
+            of throughput)
+
+    Returns:
+        List of human-readable regressions (empty if none)
+    """
+    base_results = {_result_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        base = base_results.get(_result_key(result))
+        if base is None:
+            continue
+        label = f"{result['params']} noise={result['noise']}"
+        for metric, value in result.items():
+            if not metric.startswith(("recall@", "ndcg@", "source_hit@")):
+                continue
+            if value is not None and base.get(metric) is not None and value < base[metric] - max_quality_drop:
+                regressions.append(
+                    f"{label}: {metric} {_format_metric(base[metric])} -> {_format_metric(value)}"
+                )
+
+        total, base_total = result["latency_ms"]["total"], base["latency_ms"]["total"]
+        if total is None or base_total is None:
+            continue
+        p95, base_p95 = total["p95"], base_total["p95"]
+        if p95 > base_p95 * (1 + max_slowdown):
+            regressions.append(f"{label}: p95 {base_p95:.1f} ms -> {p95:.1f} ms")
+
+        base_qps = {level["clients"]: level["qps"] for level in base.get("throughput", [])}
+        for level in result["throughput"]:
+            before = base_qps.get(level["clients"])
+            if before and level["qps"] < before / (1 + max_slowdown):
+                regressions.append(
+                    f"{label}: {level['clients']} clients {before:.1f} -> {level['qps']:.1f} queries/s"
+                )
+    return regressions
+
+
+def print_report(report, k):
+    for result in report["results"]:
+        params = ", ".join(f"{name}={value}" for name, value in result["params"].items())
+        latency = result["latency_ms"]
+        print(
+            f"{params} | noise {result['noise']:.2f} | "
+            f"recall@{k} {_format_metric(result[f'recall@{k}'])} ndcg@{k} {_format_metric(result[f'ndcg@{k}'])} "
+            f"source@{k} {_format_metric(result[f'source_hit@{k}'])}"
+        )
+        for stage, stats in latency.items():
+            if stats is None:
+                continue
+            print(f"    {stage:<13s} p50 {stats['p50']:7.2f} ms  p95 {stats['p95']:7.2f} ms  p99 {stats['p99']:7.2f} ms")
+        for level in result["throughput"]:
+            print(
+                f"    {level['clients']:3d} clients  {level['qps']:8.1f} queries/s  "
+                f"p95 {level['latency_ms']['p95']:7.2f} ms"
+            )
+        if result["fallbacks"]:
+            print(f"    ⚠️ {result['fallbacks']} searches fell back to the local engine")
+
+
+def _load_model(name):
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval latency and recall benchmark")
+    parser.add_argument("--backend", choices=["local", "qdrant"], default="local")
+    parser.add_argument("--qdrant-url", default=":memory:",
+                        help="Qdrant URL; the default ingests the catalog into an in-memory collection")
+    parser.add_argument("--model", default=utils.MODEL_NAME, help="sentence-transformers model name")
+    parser.add_argument("--embeddings", default=None, help="Optional .npy cache of the catalog vectors")
+    parser.add_argument("--catalog", default=CATALOG_PATH)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", default="0,0.1,0.3", help="Comma-separated OCR noise levels")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--clients", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--sweep", action="append", help="name=v1,v2 (lambda_decay, prefetch_limit, fusion, rerank)")
+    parser.add_argument("--truth", choices=["exhaustive", "overlap"], default="exhaustive")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warm-cache", action="store_true", help="Keep query embeddings and results cached between passes")
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--compare", help="Baseline JSON report; exit 1 on regression")
+    parser.add_argument("--max-quality-drop", type=float, default=0.01)
+    parser.add_argument("--max-slowdown", type=float, default=0.25)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    telemetry.ENABLED = True
+    param_sets = parse_sweeps(args.sweep)
+    client_levels = [int(level) for level in args.clients.split(",")]
+
+    # Same resources as the app, with the benchmarked model and no persistent cache
+    if args.model != utils.MODEL_NAME:
+        registry.register("model", lambda: _load_model(args.model))
+    registry.register("embedding_cache", lambda: EmbeddingCache(utils.get_model(), args.model))
+    model = utils.get_model()
+    resolver = utils.get_resolver()
+    records = load_catalog(args.catalog)
+
+    start = time.perf_counter()
+    engine = LocalSearchEngine.from_catalog(
+        utils.get_vocab(), model, catalog_path=args.catalog, embeddings_path=args.embeddings
+    )
+    registry.register("local_engine", lambda: engine)
+    client = None
+    if args.backend == "local":
+        utils.SEARCH_BACKEND = "local"
+    else:
+        if args.qdrant_url == ":memory:":
+            client = QdrantClient(":memory:")
+            # One upload worker: local-mode Qdrant is not safe to write from
+            # several threads. The app's price histograms are left alone.
+            ingest(client, records, utils.get_vocab(), model, workers=1, write_stats=False)
+            if max(client_levels) > 1:
+                # Local-mode Qdrant is not safe to query from several threads
+                print("⚠️ In-memory Qdrant: concurrency levels above 1 are skipped")
+                client_levels = [level for level in client_levels if level == 1]
+        else:
+            client = QdrantClient(args.qdrant_url, api_key=os.getenv("QDRANT_API_KEY"))
+            print(f"⚠️ Using the existing {utils.COLLECTION_NAME} collection, it must hold {args.catalog}")
+    print(f"✅ {len(engine)} products loaded in {time.perf_counter() - start:.1f}s ({args.backend})")
+
+    noise_levels = [float(level) for level in args.noise.split(",")]
+    query_sets = {
+        noise: make_queries(records, args.queries, noise, seed=args.seed) for noise in noise_levels
+    }
+    truths = ground_truth(engine, model, resolver, query_sets[noise_levels[0]], args.k, args.truth)
+
+    # Untimed pass: the resolver keeps its fuzzy matches, so only the first
+    # parameter set would otherwise pay for them
+    for queries in query_sets.values():
+        run_pass(client, queries, param_sets[0], args.k)
+
+    results = []
+    for params in param_sets:
+        results.extend(benchmark(client, query_sets, truths, params, args.k, client_levels, args.warm_cache))
+
+    report = {
+        "config": {
+            "backend": args.backend,
+            "model": args.model,
+            "queries": args.queries,
+            "k": args.k,
+            "truth": args.truth,
+            "seed": args.seed,
+            "warm_cache": args.warm_cache,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "catalog_version": catalog_version(args.catalog),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    print_report(report, args.k)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.max_quality_drop, args.max_slowdown)
+        for regression in regressions:
+            print(f"❌ {regression}")
+        if regressions:
+            raise SystemExit(1)
+        print("✅ No regression against the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Local stand-in for a shop website, to run the scraper offline.
+
+Serves paginated category listings and product pages with the markup the
+"parashop" selectors expect, ETag and Last-Modified validators (304 on a
+matching conditional request), a configurable delay and an optional share
+of 503 answers. Products can be changed between crawls with set_price and
+set_description. Half the descriptions list one ingredient per line
+(newlines in a description are rendered as <br>).
+
+Usage:
+    python -m benchmarks.shop_stub --port 8766 --products 200 --delay 0.05
+"""
+import argparse
+import hashlib
+import html
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from scraper import SITES
+
+
+CATEGORIES = ["solar", "foodSup", "faceGel"]
+
+LISTING_PAGE = """<html><body><div class="main-products product-grid">{items}</div></body></html>"""
+
+LISTING_ITEM = """
+<div class="product-layout">
+  <div class="caption">
+    <div class="name"><a href="/product/{id}">{name}</a></div>
+    <div class="price"><div>{price}</div></div>
+  </div>
+  <div class="stats"><span><span>Brand</span><span><a href="/brand">{brand}</a></span></span></div>
+</div>"""
+
+PRODUCT_PAGE = """<html><body><div id="content"><h1>{name}</h1>
+<div class="product-blocks blocks-default"><div>{description}</div></div>
+<footer>Rendered at {rendered}</footer></div></body></html>"""
+
+
+class ShopCatalog:
+    """Products of the stub shop, with a modification time per page."""
+
+    def __init__(self, n_products=60):
+        self._lock = threading.Lock()
+        self.products = {}
+        start = time.time() - 3600
+        for i in range(n_products):
+            self.products[i] = {
+                "category": CATEGORIES[i % len(CATEGORIES)],
+                "name": f"Produit {i} SPF50" if i % 7 else f"Coffret cadeau {i}",
+                "brand": f"Marque {i % 5}",
+                "price": f"{20 + i % 40},900 DT",
+                "promo_price": f"{15 + i % 30},500 DT" if i % 4 == 0 else None,
+                "description": (
+                    f"Description du produit {i}. Ingrédients: AQUA; GLYCERIN; PARFUM."
+                    if i % 2 else
+                    # One ingredient per line (<br>), the most common layout
+                    f"Description du produit {i}.\nComposition:\nAqua\nGlycerin\nDimethicone\nParfum"
+                ),
+                "modified": start,
+            }
+
+    def set_price(self, product_id, price):
+        with self._lock:
+            self.products[product_id]["price"] = price
+            self.products[product_id]["modified"] = time.time()
+
+    def set_description(self, product_id, description):
+        with self._lock:
+            self.products[product_id]["description"] = description
+            self.products[product_id]["modified"] = time.time()
+
+    def listing(self, category, page, page_size):
+        with self._lock:
+            products = [(i, p) for i, p in sorted(self.products.items()) if p["category"] == category]
+        chunk = products[(page - 1) * page_size:page * page_size]
+        items = []
+        for i, product in chunk:
+            price = html.escape(product["price"])
+            if product["promo_price"]:
+                price = f'<span class="price-new">{html.escape(product["promo_price"])}</span><span class="price-old">{price}</span>'
+            else:
+                price = f"<span>{price}</span>"
+            items.append(LISTING_ITEM.format(
+                id=i, name=html.escape(product["name"]), brand=html.escape(product["brand"]), price=price
+            ))
+        modified = max((product["modified"] for _, product in chunk), default=0)
+        return LISTING_PAGE.format(items="".join(items)), modified
+
+    def product_page(self, product_id):
+        with self._lock:
+            product = dict(self.products[product_id])
+        body = PRODUCT_PAGE.format(
+            name=html.escape(product["name"]),
+            description=html.escape(product["description"]).replace("\n", "<br>"),
+            rendered=product["modified"],
+        )
+        return body, product["modified"]
+
+
+def make_handler(catalog, page_size, delay, error_rate, counters):
+    class ShopHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            with counters["lock"]:
+                counters["requests"] += 1
+                # Every 1 / error_rate-th request fails
+                fail = error_rate > 0 and counters["requests"] % max(1, round(1 / error_rate)) == 0
+            if fail:
+                self.send_error(503)
+                return
+
+            url = urlsplit(self.path)
+            parts = url.path.strip("/").split("/")
+            if len(parts) == 2 and parts[0] == "category" and parts[1] in CATEGORIES:
+                page = int(parse_qs(url.query).get("page", ["1"])[0])
+                body, modified = catalog.listing(parts[1], page, page_size)
+            elif len(parts) == 2 and parts[0] == "product" and parts[1].isdigit() and int(parts[1]) in catalog.products:
+                body, modified = catalog.product_page(int(parts[1]))
+            else:
+                self.send_error(404)
+                return
+
+            data = body.encode("utf-8")
+            etag = f'"{hashlib.sha1(data).hexdigest()}"'
+            last_modified = formatdate(int(modified), usegmt=True)
+            if self._not_modified(etag, int(modified)):
+                with counters["lock"]:
+                    counters["not_modified"] += 1
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _not_modified(self, etag, modified):
+            if self.headers.get("If-None-Match"):
+                return self.headers["If-None-Match"] == etag
+            since = self.headers.get("If-Modified-Since")
+            if since:
+                try:
+                    return modified <= parsedate_to_datetime(since).timestamp()
+                except (TypeError, ValueError):
+                    return False
+            return False
+
+        def log_message(self, format, *args):
+            pass
+
+    return ShopHandler
+
+
+def fixture_sites(base_url):
+    """SITES-style config pointing the "parashop" selectors at the stub."""
+    site = dict(SITES["parashop"])
+    site["listings"] = {category: f"{base_url}/category/{category}" for category in CATEGORIES}
+    return {"stub": site}
+
+
+def start_stub_server(port=0, n_products=60, page_size=12, delay=0.0, error_rate=0.0):
+    """
+    Start the stub shop in a background thread.
+
+    Args:
+        port: Port to listen on (0 picks a free one)
+        n_products: Products spread over the three categories
+        page_size: Products per listing page
+        delay: Response delay in seconds
+        error_rate: Share of requests answered with 503
+
+    Returns:
+        Tuple of (server, base_url, catalog, counters). Call
+        server.shutdown() to stop it.
+    """
+    catalog = ShopCatalog(n_products)
+    counters = {"lock": threading.Lock(), "requests": 0, "not_modified": 0}
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", port), make_handler(catalog, page_size, delay, error_rate, counters)
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", catalog, counters
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub shop website")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--products", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    server, base_url, _, _ = start_stub_server(args.port, args.products, delay=args.delay)
+    print(f"✅ Stub shop on {base_url}/category/solar")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import re
+
+
+_DIV_TAG_RE = re.compile(r"<(/?)div\b[^>]*>", re.IGNORECASE)
+
+
+class CardStreamParser:
+    """
+    Split streamed LLM HTML into complete comparison cards.
+
+    Feed the text deltas as they arrive; feed() returns the cards whose
+    closing </div> has just been received. Cards are the top-level <div>s,
+    or the children of the outer flex column wrapper when the model emits
+    one (as in the example of the prompt).
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.cards = []
+        self._pos = 0
+        self._depth = 0
+        self._card_depth = None
+        self._card_start = None
+
+    def feed(self, text):
+        """
+        Add a chunk of streamed text.
+
+        Args:
+            text: Newly received text
+
+        Returns:
+            List of cards (HTML strings) completed by this chunk
+        """
+        self.buffer += text
+        completed = []
+
+        # Tags cut in half at the end of the buffer are simply not matched
+        # yet; scanning resumes after the last complete tag.
+        for match in _DIV_TAG_RE.finditer(self.buffer, self._pos):
+            self._pos = match.end()
+            closing = match.group(1) == "/"
+
+            if not closing:
+                if self._card_depth is None:
+                    # The first div decides whether there is a wrapper
+                    self._card_depth = 1 if "flex-direction" in match.group(0) else 0
+                if self._depth == self._card_depth:
+                    self._card_start = match.start()
+                self._depth += 1
+            else:
+                self._depth = max(self._depth - 1, 0)
+                if self._depth == self._card_depth and self._card_start is not None:
+                    completed.append(self.buffer[self._card_start:match.end()])
+                    self._card_start = None
+
+        self.cards.extend(completed)
+        return completed
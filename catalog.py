@@ -0,0 +1,119 @@
+import ast
+import hashlib
+import json
+import uuid
+
+
+CATALOG_PATH = "Data_preparation/data_parasave_with_ingredient_scores.json"
+VOCABULARY_PATH = "parasave_vocabulary.json"
+
+VALID_CATEGORIES = ["solar", "foodSup", "faceGel"]
+
+# Same fix that was applied to the Qdrant collection with set_payload
+CATEGORY_FIXES = {"Solar": "solar"}
+
+PAYLOAD_FIELDS = [
+    "product_name",
+    "product_brand",
+    "price",
+    "promo",
+    "category",
+    "ingredients",
+    "description",
+    "url",
+    "scraping_date",
+]
+
+
+def normalize_category(category):
+    """Map raw scraped category labels to the ones used at search time."""
+    return CATEGORY_FIXES.get(category, category)
+
+
+def parse_ingredient_scores(scores):
+    """
+    Return ingredient scores as a dict.
+
+    Older exports store the dict as its Python repr string.
+    """
+    if not scores:
+        return {}
+    if isinstance(scores, str):
+        return ast.literal_eval(scores)
+    return scores
+
+
+def load_catalog(path=CATALOG_PATH):
+    """
+    Load the product catalog.
+
+    Args:
+        path: Path to the JSON export of the preprocessing notebook
+
+    Returns:
+        List of product records (see product_id for their point IDs)
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        records = json.load(f)
+
+    for record in records:
+        record["category"] = normalize_category(record["category"])
+        record["price"] = float(record["price"])
+        record["ingredient_scores"] = parse_ingredient_scores(record.get("ingredient_scores"))
+
+    return records
+
+
+def catalog_version(path=CATALOG_PATH):
+    """SHA-1 of the catalog file, stored in derived files to detect stale ones."""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def load_vocabulary(path=VOCABULARY_PATH):
+    """Load the ingredient vocabulary (list of unique ingredients)."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def product_id(record):
+    """
+    Point ID of a product: a UUID derived from its URL.
+
+    Stable across re-scrapes and reorderings of the catalog, unlike the
+    record's position.
+    """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, record["url"]))
+
+
+def build_payload(record):
+    """Build the Qdrant payload of a catalog record."""
+    payload = {field: record.get(field) for field in PAYLOAD_FIELDS}
+    payload["price"] = float(record["price"])
+    return payload
+
+
+def project_payload(payload, fields=None):
+    """Copy of a payload restricted to fields (all fields if None)."""
+    if fields is None:
+        return dict(payload)
+    return {field: payload.get(field) for field in fields}
+
+
+def scores_to_sparse(scores, vocab_index):
+    """
+    Convert an ingredient score dict to sparse index/value lists.
+
+    Args:
+        scores: Dict mapping ingredient to its weight
+        vocab_index: Dict mapping ingredient to its vocabulary index
+
+    Returns:
+        Tuple of (indices, values) sorted by index
+    """
+    pairs = sorted(
+        (vocab_index[ing], float(weight))
+        for ing, weight in scores.items()
+        if ing in vocab_index and weight > 0
+    )
+    return [idx for idx, _ in pairs], [value for _, value in pairs]
@@ -0,0 +1,300 @@
+import html
+import json
+import logging
+
+import numpy as np
+
+from ingredient_resolver import ngram_similarity, normalize_ingredient
+
+
+logger = logging.getLogger(__name__)
+
+# Weights of the overall similarity score
+OVERLAP_WEIGHT = 0.6
+POSITION_WEIGHT = 0.25
+COVERAGE_WEIGHT = 0.15
+
+# A partial match counts for half of an exact one in the weighted overlap
+PARTIAL_CREDIT = 0.5
+PARTIAL_THRESHOLD = 0.6
+
+MEDALS = ["🥇", "🥈", "🥉", "🏅", "🏅"]
+GRADIENTS = [
+    (75, "#4ade80, #22c55e", "#22c55e"),
+    (50, "#60a5fa, #3b82f6", "#3b82f6"),
+    (0, "#fbbf24, #f59e0b", "#f59e0b"),
+]
+
+
+def split_ingredients(ingredients_text):
+    """Split a catalog ingredient string (semicolon-separated) into a list."""
+    if not ingredients_text:
+        return []
+    return [ing.strip().lower() for ing in ingredients_text.split(";") if ing.strip()]
+
+
+def _canonical(ingredient, resolver):
+    """Key identifying an ingredient across spelling variants."""
+    if resolver is not None:
+        resolution = resolver.resolve(ingredient)
+        if resolution.index is not None:
+            return ("vocab", resolution.index)
+    return ("key", normalize_ingredient(ingredient))
+
+
+def score_alternatives(query_ingredients, alternatives, budget, resolver=None, lambda_decay=0.65):
+    """
+    Compute the comparison numbers of each alternative against the query.
+
+    Per alternative: matched, partial and missing query ingredients, the
+    agreement of matched positions, the decay-weighted overlap (each match
+    counts min(e^(-k*pos_query), e^(-k*pos_alternative))), the coverage and
+    the price headroom under the budget. Ingredient matching happens once per
+    pair of lists; every score is then computed with array operations over
+    the whole candidate set.
+
+    Args:
+        query_ingredients: Ingredients of the scanned product, in order
+        alternatives: Points returned by get_alternatives (with .payload)
+        budget: Maximum price
+        resolver: Optional IngredientResolver to match spelling variants
+        lambda_decay: Decay constant of the position weights
+
+    Returns:
+        List of dicts, one per alternative, in the same order
+    """
+    query = [ing for ing in query_ingredients if ing.strip()]
+    n_query = len(query)
+    n_alt = len(alternatives)
+    if n_alt == 0:
+        return []
+
+    query_canon = [_canonical(ing, resolver) for ing in query]
+    query_keys = [normalize_ingredient(ing) for ing in query]
+
+    # (alternatives x query) positions of exact and partial matches, 0 = none
+    exact_pos = np.zeros((n_alt, max(n_query, 1)), dtype=np.int32)
+    partial_pos = np.zeros_like(exact_pos)
+    lengths = np.zeros(n_alt, dtype=np.int32)
+    prices = np.zeros(n_alt, dtype=np.float64)
+
+    for row, alt in enumerate(alternatives):
+        payload = alt.payload or {}
+        alt_ingredients = split_ingredients(payload.get("ingredients"))
+        lengths[row] = len(alt_ingredients)
+        prices[row] = float(payload.get("price") or 0.0)
+
+        positions = {}
+        for pos, ing in enumerate(alt_ingredients, start=1):
+            positions.setdefault(_canonical(ing, resolver), pos)
+        alt_keys = [normalize_ingredient(ing) for ing in alt_ingredients]
+
+        for col, canon in enumerate(query_canon):
+            pos = positions.get(canon)
+            if pos is not None:
+                exact_pos[row, col] = pos
+                continue
+            # Partial: close spelling or one name contained in the other
+            best, best_pos = PARTIAL_THRESHOLD, 0
+            key = query_keys[col]
+            for pos, alt_key in enumerate(alt_keys, start=1):
+                if not key or not alt_key:
+                    continue
+                if len(key) >= 4 and len(alt_key) >= 4 and (key in alt_key or alt_key in key):
+                    best_pos = pos
+                    break
+                similarity = ngram_similarity(key, alt_key)
+                if similarity >= best:
+                    best, best_pos = similarity, pos
+            partial_pos[row, col] = best_pos
+
+    exact_pos = exact_pos[:, :n_query]
+    partial_pos = partial_pos[:, :n_query]
+    query_pos = np.arange(1, n_query + 1)
+    query_weights = np.exp(-lambda_decay * query_pos)
+
+    matched = exact_pos > 0
+    partial = partial_pos > 0
+    n_matched = matched.sum(axis=1)
+
+    # Decay-weighted overlap, normalized by the query's own total weight
+    exact_weights = np.where(matched, np.minimum(query_weights, np.exp(-lambda_decay * exact_pos)), 0.0)
+    partial_weights = np.where(partial, np.minimum(query_weights, np.exp(-lambda_decay * partial_pos)), 0.0)
+    total_weight = query_weights.sum() if n_query else 1.0
+    overlap = (exact_weights.sum(axis=1) + PARTIAL_CREDIT * partial_weights.sum(axis=1)) / total_weight
+
+    # Position agreement of the exact matches: 1 = same position
+    span = np.maximum(np.maximum(lengths, n_query), 1)[:, None]
+    agreement = np.where(matched, 1.0 - np.abs(exact_pos - query_pos) / span, 0.0)
+    position_agreement = agreement.sum(axis=1) / np.maximum(n_matched, 1)
+
+    coverage = n_matched / max(n_query, 1)
+    top_n = min(3, n_query)
+    same_top = (exact_pos[:, :top_n] == query_pos[:top_n]).all(axis=1) if top_n else np.zeros(n_alt, bool)
+
+    budget = float(budget)
+    headroom = np.clip((budget - prices) / budget, 0.0, 1.0) if budget > 0 else np.zeros(n_alt)
+
+    similarity = 100.0 * (
+        OVERLAP_WEIGHT * overlap
+        + POSITION_WEIGHT * position_agreement
+        + COVERAGE_WEIGHT * coverage
+    )
+
+    scores = []
+    for row in range(n_alt):
+        scores.append({
+            "similarity": float(np.round(similarity[row], 1)),
+            "weighted_overlap": float(overlap[row]),
+            "position_agreement": float(position_agreement[row]),
+            "coverage": float(coverage[row]),
+            "matched": [query[col] for col in np.flatnonzero(matched[row])],
+            "partial": [query[col] for col in np.flatnonzero(partial[row])],
+            "missing": [query[col] for col in np.flatnonzero(~matched[row] & ~partial[row])],
+            "same_top": bool(same_top[row]),
+            "price": float(prices[row]),
+            "price_headroom": float(headroom[row]),
+        })
+    return scores
+
+
+def explain(score, budget):
+    """Deterministic one-line reason for a card."""
+    parts = []
+    n_query = len(score["matched"]) + len(score["partial"]) + len(score["missing"])
+    if score["same_top"]:
+        parts.append("same top ingredients in the same order")
+    parts.append(f"shares {len(score['matched'])} of your {n_query} ingredients")
+    if score["partial"]:
+        parts.append(f"{len(score['partial'])} close variants")
+    saving = float(budget) - score["price"]
+    if saving > 0:
+        parts.append(f"{saving:.2f}dt under your budget")
+    text = ", ".join(parts)
+    return text[0].upper() + text[1:]
+
+
+def _ingredient_list(items, limit=6):
+    shown = ", ".join(html.escape(item) for item in items[:limit])
+    if len(items) > limit:
+        shown += f" +{len(items) - limit} more"
+    return shown or "none"
+
+
+def render_card(rank, alternative, score, category, budget, blurb=None):
+    """HTML of one comparison card."""
+    payload = alternative.payload or {}
+    name = str(payload.get("product_name", "Unknown"))
+    brand = str(payload.get("product_brand") or "")
+    # Most scraped names already start with the brand
+    if brand and not name.lower().startswith(brand.lower()):
+        name = f"{brand} {name}"
+    name = html.escape(name)
+    url = html.escape(str(payload.get("url") or "#"), quote=True)
+    n_query = len(score["matched"]) + len(score["partial"]) + len(score["missing"])
+
+    gradient, accent = next((g, a) for threshold, g, a in GRADIENTS if score["similarity"] >= threshold)
+    medal = MEDALS[rank - 1] if rank <= len(MEDALS) else "🏅"
+    position_note = (
+        "<span style='color: #dcfce7'>✓ same positions</span>"
+        if score["position_agreement"] >= 0.8 and score["matched"] else ""
+    )
+    within_budget = score["price"] <= float(budget)
+    reason = html.escape(blurb) if blurb else html.escape(explain(score, budget))
+
+    return f"""  <div style='background: linear-gradient(135deg, {gradient}); color: white; padding: 1.5rem; border-radius: 15px;'>
+    <div style='display: flex; justify-content: space-between; align-items: center;'>
+      <h3>{medal} Alternative #{rank} - {name} ({score['price']:.2f}dt)</h3>
+      <span style='font-size: 1.3rem; font-weight: bold;'>{score['similarity']:.0f}%</span>
+    </div>
+    <div style='background: rgba(255,255,255,0.2); padding: 1rem; border-radius: 10px; margin-top: 1rem;'>
+      <p><strong>✅ Ingredients Match ({len(score['matched'])}/{n_query}):</strong> {_ingredient_list(score['matched'])} {position_note}</p>
+      <p><strong>⚠️ Partial:</strong> {_ingredient_list(score['partial'])}</p>
+      <p><strong>❌ Missing:</strong> {_ingredient_list(score['missing'])}</p>
+      <p><strong>{'✅' if within_budget else '❌'} Price:</strong> {'Under' if within_budget else 'Over'} budget ({score['price_headroom']:.0%} headroom) | <strong>✅ Category:</strong> {html.escape(category)}</p>
+      <p><em>{reason}</em></p>
+      <a href="{url}" target="_blank"
+         style='display: inline-block; margin-top: 1rem; padding: 0.75rem 1.5rem;
+                background: white; color: {accent}; border-radius: 8px;
+                text-decoration: none; font-weight: bold; box-shadow: 0 2px 4px rgba(0,0,0,0.1);'>
+        🛒 View Product
+      </a>
+    </div>
+  </div>
+"""
+
+
+def rank_alternatives(alternatives, scores, max_cards=5):
+    """Order alternatives by computed similarity (search order breaks ties)."""
+    order = sorted(range(len(alternatives)), key=lambda i: (-scores[i]["similarity"], i))
+    return order[:max_cards]
+
+
+def render_comparison_cards(alternatives, scores, category, budget, blurbs=None, max_cards=5):
+    """
+    Render the comparison cards locally.
+
+    Args:
+        alternatives: Points returned by get_alternatives
+        scores: Output of score_alternatives for the same points
+        category: Product category
+        budget: Maximum price
+        blurbs: Optional dict {alternative index: short "why" text}
+        max_cards: Number of cards to show
+
+    Returns:
+        HTML string
+    """
+    blurbs = blurbs or {}
+    cards = [
+        render_card(rank, alternatives[i], scores[i], category, budget, blurbs.get(i))
+        for rank, i in enumerate(rank_alternatives(alternatives, scores, max_cards), start=1)
+    ]
+    return (
+        "<div style='display: flex; flex-direction: column; gap: 1.5rem;'>\n"
+        + "".join(cards)
+        + "</div>"
+    )
+
+
+BLURB_PROMPT = """A shopper scanned "{product_name}" (key ingredients: {ingredients}).
+For each alternative below, write ONE short sentence (max 20 words) on why it is a good alternative.
+Return a JSON object mapping the alternative number to its sentence, e.g. {{"1": "..."}}.
+
+{alternatives}"""
+
+
+def generate_blurbs(client, model, product_name, query_ingredients, alternatives, scores, max_cards=5):
+    """
+    Ask the LLM for short "why" sentences for the top cards.
+
+    Returns:
+        Dict {alternative index: sentence}; empty if the call fails
+    """
+    order = rank_alternatives(alternatives, scores, max_cards)
+    lines = []
+    for number, i in enumerate(order, start=1):
+        payload = alternatives[i].payload or {}
+        lines.append(
+            f"{number}. {payload.get('product_brand', '')} {payload.get('product_name', '')}"
+            f" - {scores[i]['similarity']:.0f}% similar, matches: {', '.join(scores[i]['matched'][:5])}"
+        )
+
+    try:
+        response = client.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": BLURB_PROMPT.format(
+                product_name=product_name,
+                ingredients=", ".join(query_ingredients[:10]),
+                alternatives="\n".join(lines),
+            )}],
+            temperature=0.1,
+            max_tokens=300,
+            response_format={"type": "json_object"}
+        )
+        data = json.loads(response.choices[0].message.content)
+    except Exception as e:
+        logger.warning("⚠️ Could not generate blurbs: %s", e)
+        return {}
+
+    return {i: str(data[str(number)]) for number, i in enumerate(order, start=1) if str(number) in data}
@@ -0,0 +1,225 @@
+"""
+Cache of query embeddings.
+
+Usage (pre-warm the on-disk store from the catalog):
+    python embedding_cache.py --store embeddings_cache.sqlite
+"""
+import argparse
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from catalog import CATALOG_PATH, load_catalog
+
+
+# Part of every key. Version 1 keys normalized the text (lowercased,
+# whitespace collapsed) while the model saw the raw text, so two texts the
+# cased model embeds differently could share a vector; stores written then
+# are ignored.
+KEY_VERSION = 2
+
+
+def catalog_query_text(ingredients, max_ingredients=20):
+    """
+    Build the query text get_alternatives would send for a catalog product.
+
+    Args:
+        ingredients: Semicolon-separated ingredient string from the catalog
+        max_ingredients: Same truncation as the app's ingredient parser
+
+    Returns:
+        Query text ("ing1, ing2, ...")
+    """
+    ingredients_clean = [ing.strip().lower() for ing in ingredients.split(";") if ing.strip()]
+    return ", ".join(ingredients_clean[:max_ingredients])
+
+
+class EmbeddingCache:
+    """
+    Bounded LRU cache in front of model.encode.
+
+    Keys are a SHA-1 of the model name and the exact text the model
+    embeds, so entries from another model are never returned and a cached
+    vector is the one an uncached encode would give. Callers normalize the
+    text beforehand (utils.build_query lowercases and strips it). When
+    store_path is set, every embedding is also written to a sqlite file and
+    looked up there on an in-memory miss, which keeps the cache warm across
+    Streamlit restarts.
+    """
+
+    def __init__(self, model, model_name, max_size=1024, store_path=None):
+        """
+        Args:
+            model: Sentence transformer model
+            model_name: Name of the model (part of the cache key)
+            max_size: Maximum number of embeddings kept in memory
+            store_path: Optional sqlite file for the persistent store
+        """
+        self.model = model
+        self.model_name = model_name
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+
+        if store_path:
+            self._db = sqlite3.connect(store_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, text):
+        """Return the cache key of a text for this model."""
+        data = f"{KEY_VERSION}\0{self.model_name}\0{text}".encode("utf-8")
+        return hashlib.sha1(data).hexdigest()
+
+    def stats(self):
+        """Return hit/miss counters and the current size."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+        }
+
+    def clear(self):
+        """Drop the in-memory entries and reset the counters (the sqlite store is kept)."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def encode(self, texts):
+        """
+        Embed texts, only running the model on cache misses.
+
+        Misses are encoded together in a single batched model.encode call.
+
+        Args:
+            texts: List of texts
+
+        Returns:
+            Array of shape (len(texts), dim)
+        """
+        keys = [self.key(text) for text in texts]
+        vectors = [None] * len(texts)
+        missing = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._get(key)
+                if vector is None:
+                    missing.setdefault(key, []).append(i)
+                else:
+                    vectors[i] = vector
+            self.hits += len(texts) - sum(len(rows) for rows in missing.values())
+            self.misses += sum(len(rows) for rows in missing.values())
+
+        if missing:
+            miss_keys = list(missing)
+            encoded = self.model.encode(
+                [texts[missing[key][0]] for key in miss_keys],
+                convert_to_numpy=True,
+            ).astype(np.float32)
+
+            with self._lock:
+                for key, vector in zip(miss_keys, encoded):
+                    self._put(key, vector)
+                    for i in missing[key]:
+                        vectors[i] = vector
+                self._commit()
+
+        return np.vstack(vectors)
+
+    def encode_one(self, text):
+        """Embed a single text (see encode)."""
+        return self.encode([text])[0]
+
+    def warm(self, texts, batch_size=64):
+        """
+        Pre-compute embeddings for texts that are likely to be queried.
+
+        Args:
+            texts: Iterable of texts
+            batch_size: Number of texts encoded per model call
+
+        Returns:
+            Number of texts that had to be encoded
+        """
+        misses_before = self.misses
+        texts = list(texts)
+        for start in range(0, len(texts), batch_size):
+            self.encode(texts[start:start + batch_size])
+        return self.misses - misses_before
+
+    def warm_from_catalog(self, records=None, batch_size=64):
+        """Pre-warm with the query text of every catalog product."""
+        if records is None:
+            records = load_catalog(CATALOG_PATH)
+        texts = [catalog_query_text(record["ingredients"]) for record in records]
+        return self.warm(texts, batch_size=batch_size)
+
+    def _get(self, key):
+        vector = self._entries.get(key)
+        if vector is not None:
+            self._entries.move_to_end(key)
+            return vector
+
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT vector FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                vector = np.frombuffer(row[0], dtype=np.float32)
+                self._remember(key, vector)
+                return vector
+
+        return None
+
+    def _put(self, key, vector):
+        self._remember(key, vector)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector) VALUES (?, ?, ?)",
+                (key, self.model_name, vector.tobytes()),
+            )
+
+    def _remember(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _commit(self):
+        if self._db is not None:
+            self._db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-warm the query embedding store")
+    parser.add_argument("--store", required=True, help="sqlite file to fill")
+    parser.add_argument("--catalog", default=CATALOG_PATH)
+    parser.add_argument("--model", default="paraphrase-multilingual-MiniLM-L12-v2")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+
+    cache = EmbeddingCache(SentenceTransformer(args.model), args.model, store_path=args.store)
+    encoded = cache.warm_from_catalog(load_catalog(args.catalog))
+    print(f"✅ Store warmed: {encoded} new embeddings in {args.store}")
+
+
+if __name__ == "__main__":
+    main()
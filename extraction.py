@@ -0,0 +1,363 @@
+import base64
+import json
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
+from catalog import VALID_CATEGORIES
+from telemetry import span, submit
+from vlm_cache import cache_version
+
+
+logger = logging.getLogger(__name__)
+
+
+VLM_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+
+PRODUCT_INFO_PROMPT = """Analyze this product image and extract the following information:
+
+Please provide the information in this exact format:
+Product Name: [name]
+Provide the whole name not just the brand
+If the text is in a language other than English, please provide the original text."""
+
+INGREDIENTS_PROMPT = """Analyze this image and extract all ingredients or composition information visible.
+
+Please list all ingredients/components you can identify, maintaining the original language if it's not in English.
+
+IMPORTANT: Return the ingredients as a single line separated by semicolons (;)
+
+Format:
+ingredient1;ingredient2;ingredient3;ingredient4
+
+If percentages or quantities are mentioned, include them with the ingredient name."""
+
+CATEGORY_PROMPT = """Analyze this product image and determine which category it belongs to.
+
+The ONLY valid categories are:
+1. solar - Solar cream, sun cream, crème solaire, écran solaire
+2. foodSup - Food supplements, vitamins, dietary supplements, complément alimentaire
+3. faceGel - Face gels, gel nettoyant, purifiant, clean
+
+Instructions:
+- Respond with ONLY ONE of these exact words: solar, foodSup, or faceGel
+- If the product does not fit ANY of these categories, respond with: "Not one of the categories we are dealing with"
+- Be strict: only choose a category if you are confident the product fits
+
+Your response:"""
+
+COMBINED_PROMPT = """The first image shows the front of a product, the second image its ingredients label.
+
+Return a JSON object with exactly these keys:
+- "product_name": the whole product name, not just the brand, in the original language
+- "category": ONLY ONE of "solar" (sun cream, crème solaire, écran solaire), "foodSup" (food supplements, vitamins, complément alimentaire), "faceGel" (face gels, gel nettoyant, purifiant), or "none" if it fits none of them
+- "ingredients": list of every ingredient visible on the label, in order, in the original language, with percentages if mentioned"""
+
+
+def _image_content(image_base64, mime_type="image/jpeg"):
+    return {
+        "type": "image_url",
+        "image_url": {
+            "url": f"data:{mime_type};base64,{image_base64}"
+        }
+    }
+
+
+def _ask_vlm(client, image_base64, prompt, max_tokens, mime_type="image/jpeg"):
+    response = client.chat.completions.create(
+        model=VLM_MODEL,
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    _image_content(image_base64, mime_type),
+                    {
+                        "type": "text",
+                        "text": prompt
+                    }
+                ]
+            }
+        ],
+        temperature=0.1,
+        max_tokens=max_tokens
+    )
+    return response.choices[0].message.content
+
+
+# Function to extract product name and brand
+def extract_product_info(client, image_base64, mime_type="image/jpeg"):
+    """Extract product name and brand from image using Groq VLM"""
+    try:
+        return _ask_vlm(client, image_base64, PRODUCT_INFO_PROMPT, 500, mime_type)
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+# Function to extract ingredients/composition
+def extract_ingredients(client, image_base64, mime_type="image/jpeg"):
+    """Extract ingredients/composition from image using Groq VLM"""
+    try:
+        return _ask_vlm(client, image_base64, INGREDIENTS_PROMPT, 1000, mime_type)
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+# Function to extract product category
+def extract_category(client, image_base64, mime_type="image/jpeg"):
+    """Extract product category from predefined categories using Groq VLM"""
+    try:
+        return _ask_vlm(client, image_base64, CATEGORY_PROMPT, 100, mime_type).strip()
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+# Function to extract everything in one structured call
+def extract_all(
+    client,
+    product_base64,
+    ingredients_base64,
+    product_mime="image/jpeg",
+    ingredients_mime="image/jpeg"
+):
+    """
+    Extract product name, category and ingredients with a single Groq call.
+
+    Returns:
+        Dict with product_info, category and ingredients_raw, formatted like
+        the answers of the three separate extraction functions
+    """
+    try:
+        response = client.chat.completions.create(
+            model=VLM_MODEL,
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        _image_content(product_base64, product_mime),
+                        _image_content(ingredients_base64, ingredients_mime),
+                        {
+                            "type": "text",
+                            "text": COMBINED_PROMPT
+                        }
+                    ]
+                }
+            ],
+            temperature=0.1,
+            max_tokens=1500,
+            response_format={"type": "json_object"}
+        )
+        data = json.loads(response.choices[0].message.content)
+    except Exception as e:
+        error = f"Error: {str(e)}"
+        return {"product_info": error, "category": error, "ingredients_raw": error}
+
+    ingredients = data.get("ingredients") or []
+    if isinstance(ingredients, str):
+        ingredients = [ingredients]
+    return {
+        "product_info": f"Product Name: {data.get('product_name', '')}",
+        "category": str(data.get("category", "")).strip(),
+        "ingredients_raw": ";".join(str(ing) for ing in ingredients),
+    }
+
+
+# Helper function to parse ingredients (✅ FIXED: use semicolon)
+def parse_ingredients_list(ingredients_text):
+    """Extract clean list of ingredients from AI response"""
+    # Remove any markdown, extra text
+    ingredients_text = ingredients_text.strip()
+
+    # Split by semicolon (as requested in prompt)
+    if ';' in ingredients_text:
+        ingredients = [ing.strip() for ing in ingredients_text.split(';') if ing.strip()]
+    else:
+        # Fallback: try comma if semicolon not found
+        ingredients = [ing.strip() for ing in ingredients_text.split(',') if ing.strip()]
+
+    # Clean up - remove any "Format:" or instruction text
+    ingredients = [ing for ing in ingredients if not ing.lower().startswith(('format', 'ingredient'))]
+
+    # Lowercase for matching
+    ingredients = [ing.lower() for ing in ingredients]
+
+    return ingredients[:20]  # Top 20 ingredients
+
+
+def _is_valid_result(result):
+    """Error answers must not be cached."""
+    if isinstance(result, dict):
+        return not result["product_info"].startswith("Error:")
+    return not result.startswith("Error:")
+
+
+def _cached_call(cache, task, prompt, image_bytes, compute, allow_near=True):
+    """Run compute() through the VLM result cache when there is one."""
+    def timed_compute():
+        with span(f"vlm.{task}"):
+            return compute()
+
+    if cache is None:
+        return timed_compute()
+    version = cache_version(VLM_MODEL, prompt)
+    return cache.get_or_compute(
+        task, version, image_bytes, timed_compute, is_valid=_is_valid_result, allow_near=allow_near
+    )
+
+
+def run_extraction(
+    client,
+    product_base64,
+    ingredients_base64,
+    budget=None,
+    search_fn=None,
+    prime_fn=None,
+    single_call=False,
+    max_workers=6,
+    product_mime="image/jpeg",
+    ingredients_mime="image/jpeg",
+    cache=None,
+    catalog_fn=None
+):
+    """
+    Run the VLM extraction calls concurrently, with speculative retrieval.
+
+    The product info, category and ingredients calls are independent, so
+    they run in parallel and the latency is the slowest call instead of the
+    sum. As soon as the ingredients are parsed, searches for every valid
+    category start; once the category answer lands, only the matching
+    search is kept. If the product is found in the catalog (catalog_fn),
+    its precomputed alternatives are used and the searches are dropped.
+
+    Args:
+        client: Groq client
+        product_base64: Base64 front-of-pack image
+        ingredients_base64: Base64 ingredients label image
+        budget: Maximum price (retrieval is skipped when None)
+        search_fn: search_fn(ingredients, category, budget) -> alternatives
+        prime_fn: Optional prime_fn(ingredients) run once before the
+            per-category searches (e.g. to embed the query a single time)
+        single_call: Extract everything with one structured Groq call
+        max_workers: Thread pool size
+        product_mime: MIME type of the product image
+        ingredients_mime: MIME type of the ingredients image
+        cache: Optional VLMCache; a repeat scan then skips the VLM calls
+        catalog_fn: Optional catalog_fn(product_info, category, budget) ->
+            alternatives or None, tried once the product name and category
+            are known
+
+    Returns:
+        Dict with product_info, category, ingredients_raw, ingredients,
+        alternatives (None if retrieval did not run) and timings in seconds
+    """
+    start = time.perf_counter()
+    timings = {}
+    results = {}
+    searches = {}
+    retrieve = search_fn is not None and budget is not None
+    catalog_alternatives = None
+
+    def elapsed():
+        return time.perf_counter() - start
+
+    def start_searches(ingredients):
+        if catalog_alternatives is not None:
+            return
+        # Only the matching category if we already know it
+        if "category" not in results:
+            categories = VALID_CATEGORIES
+        elif results["category"] in VALID_CATEGORIES:
+            categories = [results["category"]]
+        else:
+            categories = []
+        for category in categories:
+            searches[category] = submit(executor, search_fn, ingredients, category, budget)
+
+    product_bytes = base64.b64decode(product_base64)
+    ingredients_bytes = base64.b64decode(ingredients_base64)
+
+    # Not a with-block: leaving it would wait for the discarded searches
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        pending = {}
+        if single_call:
+            pending[submit(
+                executor, _cached_call, cache, "all", COMBINED_PROMPT, product_bytes + ingredients_bytes,
+                partial(extract_all, client, product_base64, ingredients_base64,
+                        product_mime, ingredients_mime),
+                allow_near=False
+            )] = "all"
+        else:
+            # Text read off the label: a near-duplicate image can be another
+            # product on the same template, so only exact bytes hit
+            pending[submit(
+                executor, _cached_call, cache, "product_info", PRODUCT_INFO_PROMPT, product_bytes,
+                partial(extract_product_info, client, product_base64, product_mime),
+                allow_near=False
+            )] = "product_info"
+            pending[submit(
+                executor, _cached_call, cache, "category", CATEGORY_PROMPT, product_bytes,
+                partial(extract_category, client, product_base64, product_mime)
+            )] = "category"
+            pending[submit(
+                executor, _cached_call, cache, "ingredients_raw", INGREDIENTS_PROMPT, ingredients_bytes,
+                partial(extract_ingredients, client, ingredients_base64, ingredients_mime),
+                allow_near=False
+            )] = "ingredients_raw"
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+
+                if name == "prime":
+                    # Priming is only an optimisation, search even if it failed
+                    if future.exception() is not None:
+                        logger.warning("⚠️ Query priming failed: %s", future.exception())
+                    start_searches(results["ingredients"])
+                    continue
+
+                if name == "all":
+                    results.update(future.result())
+                    for key in ("product_info", "category", "ingredients_raw"):
+                        timings[key] = elapsed()
+                else:
+                    results[name] = future.result()
+                    timings[name] = elapsed()
+
+                if (
+                    retrieve and catalog_fn is not None and "catalog" not in timings
+                    and "product_info" in results and "category" in results
+                ):
+                    # In-memory lookup, cheap enough to run inline
+                    catalog_alternatives = catalog_fn(results["product_info"], results["category"], budget)
+                    timings["catalog"] = elapsed()
+                    if catalog_alternatives is not None:
+                        for future in searches.values():
+                            future.cancel()
+
+                if "ingredients_raw" in results and "ingredients" not in results:
+                    results["ingredients"] = parse_ingredients_list(results["ingredients_raw"])
+                    if retrieve and results["ingredients"]:
+                        if prime_fn is not None:
+                            pending[submit(executor, prime_fn, results["ingredients"])] = "prime"
+                        else:
+                            start_searches(results["ingredients"])
+
+        # Drop the speculative searches for the other categories
+        category = results["category"]
+        for other, future in searches.items():
+            if other != category:
+                future.cancel()
+
+        alternatives = None
+        if catalog_alternatives is not None:
+            alternatives = catalog_alternatives
+            timings["alternatives"] = timings["catalog"]
+        elif category in searches:
+            alternatives = searches[category].result()
+            timings["alternatives"] = elapsed()
+    finally:
+        executor.shutdown(wait=False)
+
+    timings["total"] = elapsed()
+    results["alternatives"] = alternatives
+    results["timings"] = timings
+    return results
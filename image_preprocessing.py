@@ -0,0 +1,129 @@
+import base64
+import hashlib
+import io
+import logging
+import threading
+from collections import OrderedDict, namedtuple
+
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+# Ingredient labels are small dense text and need more pixels than the
+# front-of-pack shot, where the VLM only reads the product name.
+IMAGE_PROFILES = {
+    "ingredients": {"max_edge": 1600, "quality": 85, "image_format": "JPEG"},
+    "product": {"max_edge": 768, "quality": 80, "image_format": "JPEG"},
+}
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+}
+
+# base64: payload for the VLM, original_size/size: bytes before/after,
+# original_dimensions/dimensions: (width, height) before/after
+PreparedImage = namedtuple(
+    "PreparedImage",
+    ["base64", "mime_type", "original_size", "size", "original_dimensions", "dimensions"],
+)
+
+_CACHE_SIZE = 32
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _encode(image, image_format, quality):
+    if image_format == "JPEG" and image.mode != "RGB":
+        # JPEG has no alpha channel: flatten transparent PNGs onto white
+        if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+            rgba = image.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.split()[-1])
+            image = background
+        else:
+            image = image.convert("RGB")
+
+    buffer = io.BytesIO()
+    if image_format == "PNG":
+        image.save(buffer, format="PNG", optimize=True)
+    else:
+        image.save(buffer, format=image_format, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+def prepare_image(image_bytes, purpose="product", max_edge=None, quality=None, image_format=None):
+    """
+    Shrink an uploaded photo before sending it to the VLM.
+
+    Applies the EXIF orientation, downscales so the longest edge is at most
+    max_edge and re-encodes. Results are cached per upload content and
+    settings, so Streamlit reruns don't redo the work.
+
+    Args:
+        image_bytes: Raw uploaded file content
+        purpose: "product" or "ingredients", selects the default settings
+        max_edge: Maximum width/height in pixels (overrides the profile)
+        quality: JPEG/WEBP quality (overrides the profile)
+        image_format: "JPEG", "PNG" or "WEBP" (overrides the profile)
+
+    Returns:
+        PreparedImage
+    """
+    profile = IMAGE_PROFILES[purpose]
+    max_edge = max_edge or profile["max_edge"]
+    quality = quality or profile["quality"]
+    image_format = (image_format or profile["image_format"]).upper()
+
+    key = (hashlib.sha256(image_bytes).hexdigest(), max_edge, quality, image_format)
+    with _cache_lock:
+        prepared = _cache.get(key)
+        if prepared is not None:
+            _cache.move_to_end(key)
+            return prepared
+
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        original_format = image.format
+        original_dimensions = image.size
+        rotated = image.getexif().get(0x0112, 1) != 1
+        image = ImageOps.exif_transpose(image)
+        # thumbnail() keeps the aspect ratio and never upscales
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        encoded = _encode(image, image_format, quality)
+        dimensions = image.size
+        mime_type = MIME_TYPES[image_format]
+
+        # Re-encoding a small, already compressed upload can make it bigger
+        unchanged = not rotated and dimensions == original_dimensions
+        if unchanged and len(encoded) >= len(image_bytes) and original_format in MIME_TYPES:
+            encoded = image_bytes
+            mime_type = MIME_TYPES[original_format]
+    except Exception as e:
+        # Not decodable by Pillow: send the upload as is
+        logger.warning("⚠️ Could not preprocess %s image: %s", purpose, e)
+        encoded = image_bytes
+        original_dimensions = dimensions = None
+        mime_type = "image/jpeg"
+
+    prepared = PreparedImage(
+        base64=base64.b64encode(encoded).decode("utf-8"),
+        mime_type=mime_type,
+        original_size=len(image_bytes),
+        size=len(encoded),
+        original_dimensions=original_dimensions,
+        dimensions=dimensions,
+    )
+    logger.info(
+        "🖼️ %s image: %.0f KB %s -> %.0f KB %s (%s)",
+        purpose, prepared.original_size / 1024, original_dimensions,
+        prepared.size / 1024, dimensions, mime_type
+    )
+
+    with _cache_lock:
+        _cache[key] = prepared
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return prepared
@@ -0,0 +1,388 @@
+"""
+Load the product catalog into the Qdrant collection.
+
+Replaces the Qdrant_integration notebook. The "sparse" vector is a real
+Qdrant sparse vector (index/value pairs) instead of a dense 2,809-wide
+list of mostly zeros.
+
+Usage:
+    python ingestion.py --recreate
+    python ingestion.py --url http://localhost:6333 --batch-size 128 --workers 8
+    python ingestion.py --quantization int8 --hnsw-m 16 --hnsw-ef-construct 128
+
+--quantization keeps an int8 (scalar) or binary copy of the dense vectors
+in RAM and the float originals on disk; searches scan the compressed copy
+and rescore an oversampled candidate list with the originals (see
+utils.DENSE_OVERSAMPLING). On an existing collection the option is applied
+in place, without re-uploading.
+
+Passing --url :memory: runs against an in-process Qdrant, which is handy
+to check the pipeline without a cluster (uploads then use a single worker:
+local mode is not safe to write from several threads).
+"""
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    Distance,
+    HnswConfigDiff,
+    PayloadSchemaType,
+    PointStruct,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SparseVector,
+    SparseVectorParams,
+    VectorParams,
+    VectorParamsDiff,
+)
+
+from catalog import (
+    CATALOG_PATH,
+    VOCABULARY_PATH,
+    build_payload,
+    load_catalog,
+    load_vocabulary,
+    product_id,
+    scores_to_sparse,
+)
+from query_planner import write_price_stats
+
+
+COLLECTION_NAME = "wellness_products"
+QDRANT_URL = "https://f0c459b3-fc02-412f-b600-df3242a3c241.europe-west3-0.gcp.cloud.qdrant.io:6333"
+MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+DENSE_DIM = 384
+
+QUANTIZATION_CHOICES = ("none", "int8", "binary")
+
+
+def quantization_config(quantization):
+    """
+    Qdrant quantization config of the dense vector.
+
+    Args:
+        quantization: "int8", "binary", or None / "none"
+
+    Returns:
+        ScalarQuantization, BinaryQuantization or None
+    """
+    if quantization in (None, "none"):
+        return None
+    if quantization == "int8":
+        # Components beyond the 0.99 quantile are clipped: a handful of
+        # outliers would otherwise stretch the int8 range for every vector
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    if quantization == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    raise ValueError(f"Unknown quantization {quantization!r}, expected one of {QUANTIZATION_CHOICES}")
+
+
+def create_collection(
+    client,
+    collection_name=COLLECTION_NAME,
+    dense_dim=DENSE_DIM,
+    recreate=False,
+    quantization=None,
+    hnsw_m=None,
+    hnsw_ef_construct=None
+):
+    """
+    Create the hybrid collection with a dense and a sparse named vector.
+
+    Args:
+        client: Qdrant client
+        collection_name: Name of the collection
+        dense_dim: Dimension of the dense embeddings
+        recreate: Drop the collection first if it already exists
+        quantization: Optional "int8" or "binary" quantization of the
+            dense vector (applied in place to an existing collection)
+        hnsw_m: Optional HNSW graph degree of the dense vector
+        hnsw_ef_construct: Optional HNSW build-time beam width
+    """
+    quantization = quantization_config(quantization)
+    hnsw_config = None
+    if hnsw_m is not None or hnsw_ef_construct is not None:
+        hnsw_config = HnswConfigDiff(m=hnsw_m, ef_construct=hnsw_ef_construct)
+
+    if client.collection_exists(collection_name):
+        if not recreate:
+            print(f"ℹ️ Collection {collection_name} already exists")
+            if quantization is not None or hnsw_config is not None:
+                client.update_collection(
+                    collection_name=collection_name,
+                    vectors_config={
+                        "dense": VectorParamsDiff(quantization_config=quantization, hnsw_config=hnsw_config),
+                    },
+                )
+                print(f"✅ Dense vector settings of {collection_name} updated")
+            return
+        client.delete_collection(collection_name)
+
+    client.create_collection(
+        collection_name=collection_name,
+        vectors_config={
+            "dense": VectorParams(
+                size=dense_dim,
+                distance=Distance.COSINE,
+                hnsw_config=hnsw_config,
+                quantization_config=quantization,
+                # The compressed copy is scanned from RAM; the originals
+                # are only read to rescore candidates
+                on_disk=quantization is not None,
+            ),
+        },
+        sparse_vectors_config={
+            "sparse": SparseVectorParams(),
+        },
+    )
+    print(f"✅ Collection {collection_name} created")
+
+
+def create_payload_indexes(client, collection_name=COLLECTION_NAME):
+    """Index the fields used by the search filter."""
+    client.create_payload_index(
+        collection_name=collection_name,
+        field_name="category",
+        field_schema=PayloadSchemaType.KEYWORD,
+    )
+    client.create_payload_index(
+        collection_name=collection_name,
+        field_name="price",
+        field_schema=PayloadSchemaType.FLOAT,
+    )
+
+
+def _fingerprint(*parts):
+    return hashlib.sha1(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+def vector_hash(record, indices, values):
+    """Fingerprint of a point's vectors: the embedded text and the sparse vector."""
+    return _fingerprint(MODEL_NAME, record["ingredients"], indices, values)
+
+
+def content_hash(record):
+    """Fingerprint of the heavy payload fields (description, ingredients)."""
+    return _fingerprint(record.get("description"), record.get("ingredients"))
+
+
+def point_payload(record, indices, values):
+    """
+    Payload of a point: the catalog fields plus the fingerprints sync.py
+    compares to find what changed without downloading vectors.
+    """
+    payload = build_payload(record)
+    payload["vector_hash"] = vector_hash(record, indices, values)
+    payload["content_hash"] = content_hash(record)
+    return payload
+
+
+def iter_point_batches(records, vocab, model, batch_size=64, embeddings=None):
+    """
+    Yield lists of points, embedding one batch at a time.
+
+    Only one batch of embeddings is held in memory at once.
+
+    Args:
+        records: Catalog records
+        vocab: List of all unique ingredients (vocabulary)
+        model: Sentence transformer model
+        batch_size: Number of points per batch
+        embeddings: Optional precomputed dense vectors aligned with records
+            (written by preprocess.py), used instead of model.encode
+
+    Yields:
+        List of PointStruct
+    """
+    vocab_index = {term: idx for idx, term in enumerate(vocab)}
+
+    for start in range(0, len(records), batch_size):
+        batch = records[start:start + batch_size]
+        if embeddings is not None:
+            dense_vectors = embeddings[start:start + batch_size]
+        else:
+            dense_vectors = model.encode(
+                [record["ingredients"] for record in batch],
+                convert_to_numpy=True,
+                batch_size=batch_size,
+            )
+
+        points = []
+        for record, dense in zip(batch, dense_vectors):
+            indices, values = scores_to_sparse(record["ingredient_scores"], vocab_index)
+            points.append(
+                PointStruct(
+                    id=product_id(record),
+                    vector={
+                        "dense": dense.tolist(),
+                        "sparse": SparseVector(indices=indices, values=values),
+                    },
+                    payload=point_payload(record, indices, values),
+                )
+            )
+        yield points
+
+
+def upsert_batches(client, batches, collection_name=COLLECTION_NAME, workers=4):
+    """
+    Upsert point batches with a bounded number of requests in flight.
+
+    Args:
+        client: Qdrant client
+        batches: Iterable of point lists
+        collection_name: Name of the collection
+        workers: Maximum number of concurrent upserts
+
+    Returns:
+        Number of points upserted
+    """
+    total = 0
+    pending = set()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for points in batches:
+            # Back-pressure: don't build more batches than we can send
+            if len(pending) >= workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    total += future.result()
+
+            pending.add(executor.submit(_upsert, client, collection_name, points))
+
+        for future in pending:
+            total += future.result()
+
+    return total
+
+
+def _upsert(client, collection_name, points):
+    client.upsert(collection_name=collection_name, points=points, wait=True)
+    return len(points)
+
+
+def ingest(
+    client,
+    records,
+    vocab,
+    model,
+    collection_name=COLLECTION_NAME,
+    batch_size=64,
+    workers=4,
+    recreate=False,
+    embeddings=None,
+    quantization=None,
+    hnsw_m=None,
+    hnsw_ef_construct=None,
+    write_stats=True
+):
+    """
+    Create the collection, its payload indexes, and upload the catalog.
+
+    Args:
+        client: Qdrant client
+        records: Catalog records
+        vocab: List of all unique ingredients (vocabulary)
+        model: Sentence transformer model (unused with embeddings)
+        collection_name: Name of the collection
+        batch_size: Number of points per upsert
+        workers: Maximum number of concurrent upserts
+        recreate: Drop the collection first if it already exists
+        embeddings: Optional precomputed dense vectors aligned with records
+        quantization: Optional "int8" or "binary" dense quantization
+        hnsw_m: Optional HNSW graph degree of the dense vector
+        hnsw_ef_construct: Optional HNSW build-time beam width
+        write_stats: Refresh the query planner's price histograms (off for
+            throwaway collections, e.g. benchmarks)
+
+    Returns:
+        Number of points upserted
+    """
+    create_collection(
+        client,
+        collection_name,
+        dense_dim=embeddings.shape[1] if embeddings is not None else model.get_sentence_embedding_dimension(),
+        recreate=recreate,
+        quantization=quantization,
+        hnsw_m=hnsw_m,
+        hnsw_ef_construct=hnsw_ef_construct,
+    )
+    # Index before uploading so Qdrant builds the filterable HNSW links once
+    create_payload_indexes(client, collection_name)
+
+    batches = iter_point_batches(records, vocab, model, batch_size=batch_size, embeddings=embeddings)
+    total = upsert_batches(client, batches, collection_name, workers=workers)
+    print(f"✅ {total} products inserted into {collection_name}")
+    if write_stats:
+        # Price histograms of the query planner follow what is indexed
+        write_price_stats(records)
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load the ParaSave catalog into Qdrant")
+    parser.add_argument("--url", default=os.getenv("QDRANT_URL", QDRANT_URL))
+    parser.add_argument("--catalog", default=CATALOG_PATH)
+    parser.add_argument("--vocab", default=VOCABULARY_PATH)
+    parser.add_argument("--embeddings", default=None, help="Dense vectors from preprocess.py (.npy)")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--recreate", action="store_true", help="drop the collection first")
+    parser.add_argument("--quantization", choices=QUANTIZATION_CHOICES, default="none", help="dense vector quantization")
+    parser.add_argument("--hnsw-m", type=int, default=None, help="HNSW graph degree of the dense vector")
+    parser.add_argument("--hnsw-ef-construct", type=int, default=None, help="HNSW build-time beam width")
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    if args.url == ":memory:":
+        client = QdrantClient(":memory:")
+        if args.workers > 1:
+            # Local-mode Qdrant is not safe to write from several threads
+            print("⚠️ In-memory Qdrant: uploading with a single worker")
+            args.workers = 1
+    else:
+        client = QdrantClient(args.url, api_key=os.getenv("QDRANT_API_KEY"))
+
+    records = load_catalog(args.catalog)
+    if args.embeddings:
+        # Vectors of the preprocessing run: no model needed
+        model = None
+        embeddings = np.load(args.embeddings)
+        if len(embeddings) != len(records):
+            raise SystemExit(f"❌ {args.embeddings} has {len(embeddings)} vectors for {len(records)} products")
+    else:
+        # Imported here so the module can be used without loading torch
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(MODEL_NAME)
+        embeddings = None
+    ingest(
+        client,
+        records,
+        load_vocabulary(args.vocab),
+        model,
+        collection_name=args.collection,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        recreate=args.recreate,
+        embeddings=embeddings,
+        quantization=args.quantization,
+        hnsw_m=args.hnsw_m,
+        hnsw_ef_construct=args.hnsw_ef_construct,
+    )
+
+
+if __name__ == "__main__":
+    main()
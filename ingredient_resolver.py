@@ -0,0 +1,213 @@
+import re
+import unicodedata
+from collections import Counter, namedtuple
+
+
+# Result of resolving one query ingredient against the vocabulary.
+# index/term are the primary vocabulary entry, indices holds every entry
+# sharing its normalized key ("aqua", "aqua (water)", "aqua (eau)"...).
+# index/term are None and indices is empty when nothing resolved.
+# method is one of "exact", "normalized", "fuzzy" or None.
+ResolvedIngredient = namedtuple(
+    "ResolvedIngredient", ["query", "index", "term", "score", "method", "indices"]
+)
+
+_PARENTHETICAL_RE = re.compile(r"[\(\[\{][^\)\]\}]*[\)\]\}]")
+_PERCENT_RE = re.compile(r"\d+(?:[.,]\d+)?\s*%")
+_NON_ALNUM_RE = re.compile(r"[^0-9a-z]+")
+
+
+def normalize_ingredient(text):
+    """
+    Normalize an ingredient name into a lookup key.
+
+    Lowercases, strips accents, removes INCI parentheticals such as
+    "(aqua)" and percentages such as "5%", and collapses punctuation and
+    whitespace into single spaces.
+
+    Args:
+        text: Raw ingredient string
+
+    Returns:
+        Normalized key (may be empty)
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = _PARENTHETICAL_RE.sub(" ", text)
+    text = _PERCENT_RE.sub(" ", text)
+    return _NON_ALNUM_RE.sub(" ", text).strip()
+
+
+def _char_ngrams(key, n):
+    """Return the set of character n-grams of a key, padded with spaces."""
+    padded = f" {key} "
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+
+def ngram_similarity(a, b, n=3):
+    """
+    Dice similarity of the character n-grams of two normalized keys.
+
+    Args:
+        a: First key
+        b: Second key
+        n: n-gram length
+
+    Returns:
+        Similarity in [0, 1]
+    """
+    grams_a = _char_ngrams(a, n)
+    grams_b = _char_ngrams(b, n)
+    return 2.0 * len(grams_a & grams_b) / (len(grams_a) + len(grams_b))
+
+
+class IngredientResolver:
+    """
+    Map free-text ingredients to vocabulary indices.
+
+    Resolution goes through three tiers, cheapest first:
+        1. exact: dict lookup on the stripped, lowercased ingredient
+        2. normalized: dict lookup on normalize_ingredient() keys
+        3. fuzzy: character n-gram index, Dice similarity >= threshold
+
+    Build it once at startup; every lookup is then O(1) for the first two
+    tiers and proportional to the number of shared n-grams for the third.
+    """
+
+    def __init__(self, vocab, ngram_size=3, fuzzy_threshold=0.75, fuzzy_cache_size=4096):
+        """
+        Args:
+            vocab: List of all unique ingredients (vocabulary)
+            ngram_size: Character n-gram length for the fuzzy tier
+            fuzzy_threshold: Minimum Dice similarity for a fuzzy match
+            fuzzy_cache_size: Number of fuzzy lookups to memoize
+        """
+        self.vocab = vocab
+        self.ngram_size = ngram_size
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_cache_size = fuzzy_cache_size
+        self._fuzzy_cache = {}
+
+        self._exact = {}
+        self._key_of = {}
+        groups = {}
+        for idx, term in enumerate(vocab):
+            # Keep the first index if the vocabulary has duplicates
+            self._exact.setdefault(term, idx)
+            key = normalize_ingredient(term)
+            if key:
+                self._key_of[idx] = key
+                groups.setdefault(key, []).append(idx)
+
+        # normalized key -> (primary index, all indices). The primary entry
+        # is the one spelled exactly like the key, else the shortest.
+        self._normalized = {}
+        for key, indices in groups.items():
+            primary = min(indices, key=lambda i: (vocab[i] != key, len(vocab[i]), i))
+            self._normalized[key] = (primary, tuple(indices))
+
+        # n-gram -> list of normalized keys, and key -> n-gram count
+        self._ngram_index = {}
+        self._ngram_counts = {}
+        for key in self._normalized:
+            grams = _char_ngrams(key, ngram_size)
+            self._ngram_counts[key] = len(grams)
+            for gram in grams:
+                self._ngram_index.setdefault(gram, []).append(key)
+
+    def __len__(self):
+        return len(self.vocab)
+
+    def __contains__(self, ingredient):
+        return self.lookup(ingredient) is not None
+
+    def lookup(self, ingredient):
+        """
+        Return the vocabulary index for an ingredient, or None.
+
+        Args:
+            ingredient: Raw ingredient string
+
+        Returns:
+            Vocabulary index or None
+        """
+        return self.resolve(ingredient).index
+
+    def resolve(self, ingredient):
+        """
+        Resolve a single ingredient through the exact, normalized and
+        fuzzy tiers.
+
+        Args:
+            ingredient: Raw ingredient string
+
+        Returns:
+            ResolvedIngredient
+        """
+        ing_lower = ingredient.strip().lower()
+
+        idx = self._exact.get(ing_lower)
+        if idx is not None:
+            key = self._key_of.get(idx)
+            indices = self._normalized[key][1] if key else (idx,)
+            return ResolvedIngredient(ingredient, idx, self.vocab[idx], 1.0, "exact", indices)
+
+        key = normalize_ingredient(ing_lower)
+        if not key:
+            return ResolvedIngredient(ingredient, None, None, 0.0, None, ())
+
+        group = self._normalized.get(key)
+        if group is not None:
+            idx, indices = group
+            return ResolvedIngredient(ingredient, idx, self.vocab[idx], 1.0, "normalized", indices)
+
+        cached = self._fuzzy_cache.get(key)
+        if cached is None:
+            cached = self._fuzzy_match(key)
+            if len(self._fuzzy_cache) >= self.fuzzy_cache_size:
+                self._fuzzy_cache.clear()
+            self._fuzzy_cache[key] = cached
+        match, score = cached
+        if match is not None:
+            idx, indices = self._normalized[match]
+            return ResolvedIngredient(ingredient, idx, self.vocab[idx], score, "fuzzy", indices)
+
+        return ResolvedIngredient(ingredient, None, None, score, None, ())
+
+    def resolve_many(self, ingredients):
+        """
+        Resolve a list of ingredients, preserving order.
+
+        Args:
+            ingredients: List of raw ingredient strings
+
+        Returns:
+            List of ResolvedIngredient, one per input
+        """
+        return [self.resolve(ing) for ing in ingredients]
+
+    def _fuzzy_match(self, key):
+        """Return (best normalized key, Dice score) or (None, best score)."""
+        grams = _char_ngrams(key, self.ngram_size)
+        shared = Counter()
+        for gram in grams:
+            for candidate in self._ngram_index.get(gram, ()):
+                shared[candidate] += 1
+
+        best_key = None
+        best_score = 0.0
+        n_query = len(grams)
+        for candidate, common in shared.items():
+            score = 2.0 * common / (n_query + self._ngram_counts[candidate])
+            # Tie-break on the shorter key to prefer the plainer INCI name
+            if score > best_score or (
+                score == best_score and best_key is not None and len(candidate) < len(best_key)
+            ):
+                best_key = candidate
+                best_score = score
+
+        if best_score >= self.fuzzy_threshold:
+            return best_key, best_score
+        return None, best_score
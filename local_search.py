@@ -0,0 +1,351 @@
+import math
+import os
+
+import numpy as np
+from scipy import sparse
+from qdrant_client.http.models import QueryResponse, ScoredPoint
+
+from catalog import (
+    CATALOG_PATH,
+    build_payload,
+    load_catalog,
+    product_id,
+    project_payload,
+    scores_to_sparse,
+)
+from quantization import QuantizedVectors
+from reranker import RERANK_CANDIDATES, rerank_scores
+
+
+# Qdrant's default RRF constant: score = 1 / (rank + k) with 0-based rank
+RRF_K = 2
+
+
+def _top_k(scores, k):
+    """Return the positions of the k highest scores, best first."""
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _dbsf_normalize(scores):
+    """
+    Distribution-based score normalization, as in Qdrant's DBSF fusion.
+
+    Scores are mapped linearly so that mean - 3 std is 0 and mean + 3 std
+    is 1, with the sample standard deviation and no clipping (outliers
+    land outside [0, 1]). A single score, or identical scores, give 0.5.
+    """
+    if len(scores) == 0:
+        return scores
+    if len(scores) == 1:
+        return np.full(1, 0.5)
+    mean = scores.mean()
+    std = scores.std(ddof=1)
+    if std == 0:
+        return np.full(len(scores), 0.5)
+    low = mean - 3 * std
+    return (scores - low) / (6 * std)
+
+
+class LocalSearchEngine:
+    """
+    In-process hybrid search over a catalog snapshot.
+
+    Mirrors the Qdrant query used by utils.search_products: a dense cosine
+    prefetch and a sparse dot-product prefetch, both filtered on category
+    and price, fused with RRF (or DBSF), optionally followed by the
+    reranker's second stage. The whole catalog fits in memory, so this
+    avoids the network round trip entirely.
+
+    Results match Qdrant's on the same data up to the order of points
+    with equal scores (the catalog has several duplicated products).
+
+    After quantize(), the dense prefetch scans int8 or binary codes of the
+    vectors and rescores the best candidates with the float rows, like a
+    quantized Qdrant collection.
+    """
+
+    def __init__(self, records, dense_vectors, sparse_matrix):
+        """
+        Args:
+            records: List of product records
+            dense_vectors: Array of shape (n_products, dim)
+            sparse_matrix: CSR matrix of shape (n_products, vocab_size)
+        """
+        self.records = records
+        self.ids = [product_id(record) for record in records]
+        self.payloads = [build_payload(record) for record in records]
+
+        dense = np.asarray(dense_vectors, dtype=np.float32)
+        norms = np.linalg.norm(dense, axis=1, keepdims=True)
+        if np.allclose(norms, 1.0, atol=1e-5):
+            # Already unit rows (snapshot): keep the memory-mapped pages
+            self.dense = dense
+        else:
+            norms[norms == 0] = 1.0
+            # Unit rows turn cosine similarity into a plain dot product
+            self.dense = dense / norms
+        self.sparse = sparse.csr_matrix(sparse_matrix, dtype=np.float32)
+        self.quantized = None
+        self.oversampling = 1.0
+        self.rescore = True
+
+        # Per category: row IDs sorted by price, and the sorted prices.
+        # A budget filter is then a binary search plus a prefix slice.
+        categories = np.array([record["category"] for record in records])
+        prices = np.array([record["price"] for record in records], dtype=np.float64)
+        self.prices = prices
+        self._category_rows = {}
+        self._category_prices = {}
+        for category in np.unique(categories):
+            rows = np.flatnonzero(categories == category)
+            rows = rows[np.argsort(prices[rows], kind="stable")]
+            self._category_rows[category] = rows
+            self._category_prices[category] = prices[rows]
+
+    @classmethod
+    def from_catalog(cls, vocab, model, catalog_path=CATALOG_PATH, embeddings_path=None):
+        """
+        Build an engine from the catalog JSON.
+
+        Args:
+            vocab: List of all unique ingredients (vocabulary)
+            model: Sentence transformer model used for the dense vectors
+            catalog_path: Path to the catalog JSON
+            embeddings_path: Optional .npy file caching the dense vectors
+
+        Returns:
+            LocalSearchEngine
+        """
+        records = load_catalog(catalog_path)
+
+        if embeddings_path and os.path.exists(embeddings_path):
+            dense_vectors = np.load(embeddings_path)
+        else:
+            # Same input text as the preprocessing notebook
+            dense_vectors = model.encode(
+                [record["ingredients"] for record in records],
+                convert_to_numpy=True,
+                batch_size=32,
+            )
+            if embeddings_path:
+                np.save(embeddings_path, dense_vectors)
+
+        vocab_index = {term: idx for idx, term in enumerate(vocab)}
+        indptr = [0]
+        indices = []
+        values = []
+        for record in records:
+            row_indices, row_values = scores_to_sparse(record["ingredient_scores"], vocab_index)
+            indices.extend(row_indices)
+            values.extend(row_values)
+            indptr.append(len(indices))
+        sparse_matrix = sparse.csr_matrix(
+            (np.array(values, dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr)),
+            shape=(len(records), len(vocab)),
+        )
+
+        return cls(records, dense_vectors, sparse_matrix)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        Build an engine from a CatalogSnapshot (snapshot.py).
+
+        The float32 dense vectors and the CSR arrays stay memory-mapped, so
+        workers opened on the same snapshot share them.
+        """
+        return cls(snapshot.records(), snapshot.dense, snapshot.sparse_matrix())
+
+    def __len__(self):
+        return len(self.records)
+
+    def filter_rows(self, category, budget):
+        """
+        Return the row IDs in a category priced at or under budget.
+
+        Args:
+            category: Product category
+            budget: Maximum price
+
+        Returns:
+            Array of row IDs sorted by price
+        """
+        rows = self._category_rows.get(category)
+        if rows is None:
+            return np.empty(0, dtype=np.int64)
+        end = np.searchsorted(self._category_prices[category], float(budget), side="right")
+        return rows[:end]
+
+    def dense_scores(self, query_dense, rows):
+        """Cosine similarity of the query against the given rows."""
+        query = np.asarray(query_dense, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        return self.dense[rows] @ query
+
+    def quantize(self, kind, oversampling=2.0, rescore=True):
+        """
+        Scan compressed dense vectors in the dense prefetch.
+
+        Args:
+            kind: "int8" or "binary" (None: back to the float vectors)
+            oversampling: Candidates scanned per prefetch slot, rescored
+                with the float vectors
+            rescore: Rescore the candidates (False: approximate scores)
+        """
+        self.quantized = QuantizedVectors(self.dense, kind) if kind else None
+        self.oversampling = max(1.0, float(oversampling))
+        self.rescore = rescore
+
+    def dense_prefetch(self, query_dense, rows, k):
+        """
+        Dense prefetch over the given rows.
+
+        Args:
+            query_dense: Dense query vector
+            rows: Row IDs
+            k: Candidates to keep
+
+        Returns:
+            Tuple of (positions in rows of the top k, best first; scores
+            aligned with rows, only meaningful at those positions)
+        """
+        if self.quantized is None:
+            scores = self.dense_scores(query_dense, rows)
+            return _top_k(scores, k), scores
+
+        query = np.asarray(query_dense, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        approx = self.quantized.scores(query, rows)
+        if not self.rescore:
+            return _top_k(approx, k), approx
+        # Only the float rows of the candidates are read
+        candidates = _top_k(approx, math.ceil(k * self.oversampling))
+        scores = np.zeros(len(rows), dtype=np.float32)
+        scores[candidates] = self.dense[rows[candidates]] @ query
+        return candidates[_top_k(scores[candidates], k)], scores
+
+    def sparse_scores(self, query_sparse, rows):
+        """Sparse dot product of the query against the given rows."""
+        query = np.zeros(self.sparse.shape[1], dtype=np.float32)
+        if len(query_sparse.indices):
+            query[np.asarray(query_sparse.indices)] = query_sparse.values
+        return self.sparse[rows] @ query
+
+    def query(
+        self,
+        query_dense,
+        query_sparse,
+        category,
+        budget,
+        prefetch_limit=100,
+        limit=10,
+        fusion="rrf",
+        rerank=False,
+        payload_fields=None
+    ):
+        """
+        Run the filtered hybrid query with precomputed query vectors.
+
+        Args:
+            query_dense: Dense query vector
+            query_sparse: SparseVector for the sparse query
+            category: Product category
+            budget: Maximum price
+            prefetch_limit: Candidates kept from each prefetch
+            limit: Number of results to return
+            fusion: "rrf" (rank-based) or "dbsf" (score-based)
+            rerank: Re-score the top fused candidates with the reranker
+            payload_fields: Payload fields to return (None: all)
+
+        Returns:
+            QueryResponse with ScoredPoint results, like client.query_points
+        """
+        rows = self.filter_rows(category, budget)
+        if len(rows) == 0:
+            return QueryResponse(points=[])
+
+        # 1. Dense prefetch
+        dense_top, dense = self.dense_prefetch(query_dense, rows, prefetch_limit)
+
+        # 2. Sparse prefetch (only products sharing at least one ingredient)
+        sparse_scores = self.sparse_scores(query_sparse, rows)
+        sparse_top = _top_k(sparse_scores, prefetch_limit)
+        sparse_top = sparse_top[sparse_scores[sparse_top] > 0]
+
+        # 3. Fusion
+        fused = np.zeros(len(rows), dtype=np.float64)
+        if fusion == "dbsf":
+            fused[dense_top] += _dbsf_normalize(dense[dense_top])
+            fused[sparse_top] += _dbsf_normalize(sparse_scores[sparse_top])
+            candidates = np.union1d(dense_top, sparse_top)
+        else:
+            fused[dense_top] += 1.0 / (np.arange(len(dense_top)) + RRF_K)
+            fused[sparse_top] += 1.0 / (np.arange(len(sparse_top)) + RRF_K)
+            candidates = np.flatnonzero(fused)
+        n_hits = min(RERANK_CANDIDATES if rerank else limit, len(candidates))
+        top = candidates[_top_k(fused[candidates], n_hits)]
+
+        # 4. Optional second stage over the fused candidates
+        if rerank and len(top):
+            fused = np.zeros(len(rows), dtype=np.float64)
+            fused[top] = rerank_scores(
+                query_dense, query_sparse, self.dense[rows[top]], self.sparse[rows[top]]
+            )
+            top = top[_top_k(fused[top], min(limit, len(top)))]
+        top = top[:limit]
+
+        points = [
+            ScoredPoint(
+                id=self.ids[rows[pos]],
+                version=0,
+                score=float(fused[pos]),
+                payload=project_payload(self.payloads[rows[pos]], payload_fields),
+            )
+            for pos in top
+        ]
+        return QueryResponse(points=points)
+
+    def search_products(
+        self,
+        query_text,
+        query_ingredients,
+        budget,
+        category,
+        vocab,
+        model,
+        client=None,
+        lambda_decay=0.65,
+        limit=10
+    ):
+        """
+        Drop-in local replacement for utils.search_products.
+
+        Args:
+            query_text: Text representation of ingredients (for dense search)
+            query_ingredients: List of ingredients (for sparse search)
+            budget: Maximum price
+            category: Product category
+            vocab: Vocabulary list or IngredientResolver
+            model: Sentence transformer model
+            client: Unused, kept for signature compatibility
+            lambda_decay: Decay constant for scoring
+            limit: Number of results to return
+
+        Returns:
+            QueryResponse with the same shape as Qdrant's
+        """
+        # Imported here to avoid a circular import with utils
+        from utils import create_sparse_vector
+
+        query_dense = model.encode([query_text])[0]
+        query_sparse = create_sparse_vector(query_ingredients, vocab, lambda_decay)
+        return self.query(query_dense, query_sparse, category, budget, limit=limit)
@@ -0,0 +1,415 @@
+"""
+Preprocessing pipeline from scraped products to the search catalog.
+
+Replaces the preprocessing notebook. Records stream through the same
+stages: parse the price, extract the ingredient list from the description,
+compute the e^(-k * position) ingredient weights, embed the ingredient text.
+The CPU stages run in a process pool, one record at a time with
+precompiled patterns, while the main process encodes what comes out in
+large batches.
+
+Embeddings are cached by a hash of the ingredient text (and the model
+name), so a refresh only encodes the products whose ingredients changed.
+
+Outputs:
+    - the catalog JSON, with ingredient_scores as a real dict
+    - the vocabulary JSON
+    - the dense vectors as .npy, aligned with the catalog (the
+      --embeddings input of ingestion.py, alternatives_table.py and
+      PARASAVE_EMBEDDINGS_PATH)
+    - the binary snapshot the app memory-maps (see snapshot.py)
+
+Usage:
+    python preprocess.py --input Data_preparation/data_parasave.json
+    python preprocess.py --input data_parasave.json --workers 8 --batch-size 256
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+from catalog import CATALOG_PATH, VOCABULARY_PATH, catalog_version
+from snapshot import SNAPSHOT_PATH, write_snapshot
+
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+EMBEDDINGS_PATH = "Data_preparation/catalog_embeddings.npy"
+EMBEDDING_CACHE_PATH = "Data_preparation/embedding_cache.npz"
+
+# Decay constant of the ingredient weights
+LAMBDA_DECAY = 0.65
+
+# Section titles that start an ingredient list in the descriptions
+INGREDIENT_KEYWORDS = ["composition", "ingrédients", "ingredients", "formule", "composants", "inci"]
+
+# One pattern per keyword, tried in order: the section runs until the next
+# usual section title or the end of the description
+INGREDIENT_PATTERNS = [
+    re.compile(
+        rf"{keyword}\s*[:：]?\s*(.*?)(?=Conseils|Mode d'emploi|Utilisation|Précautions|Avertissement|$)",
+        re.IGNORECASE | re.DOTALL,
+    )
+    for keyword in INGREDIENT_KEYWORDS
+]
+PARENTHESIS_LINE = re.compile(r"^\([^)]+\)$")
+TRAILING_PARENTHESIS = re.compile(r"\s*\([^)]*\)\s*$")
+TRAILING_DASH = re.compile(r"\s*-\s*[^-]+$")
+PRICE_NOISE = re.compile(r"[^\d,]")
+
+
+def parse_price(price):
+    """
+    Parse a scraped price ("1.234,900 DT") into a float.
+
+    Returns:
+        Price, or None if it cannot be parsed
+    """
+    if isinstance(price, (int, float)):
+        return float(price)
+    if not price:
+        return None
+    # Thousands dots and the currency go, the decimal comma becomes a dot
+    try:
+        return float(PRICE_NOISE.sub("", price).replace(",", "."))
+    except ValueError:
+        return None
+
+
+def format_ingredients(text):
+    """
+    Turn an ingredient section into a semicolon-separated list.
+
+    Detects whether the section is one ingredient per line, or dot- or
+    comma-separated (same rules as the notebook).
+    """
+    text = text.strip()
+    ingredients = []
+
+    if text.count("\n") > 2:
+        for line in text.split("\n"):
+            line = line.strip()
+            if not line or PARENTHESIS_LINE.match(line):
+                continue
+            # Trailing "(description)" or " - description"
+            cleaned = TRAILING_DASH.sub("", TRAILING_PARENTHESIS.sub("", line)).strip()
+            if cleaned and len(cleaned) < 100:
+                ingredients.append(cleaned)
+    elif text.count(".") > 2:
+        ingredients = [part.strip() for part in text.split(".") if len(part.strip()) > 2]
+    elif text.count(",") > 2:
+        ingredients = [part.strip() for part in text.split(",") if len(part.strip()) > 2]
+    else:
+        ingredients = [text]
+
+    if not ingredients:
+        return None
+    return ";".join(ingredients).replace("\t", ";").replace("\n", ";")
+
+
+def extract_ingredients(description):
+    """
+    Extract the ingredient list of a product description.
+
+    Returns:
+        Semicolon-separated ingredients, or None if no section is found
+    """
+    if not description:
+        return None
+    for pattern in INGREDIENT_PATTERNS:
+        match = pattern.search(description)
+        if match:
+            section = match.group(1).strip()
+            if len(section) > 10:
+                return format_ingredients(section)
+    return None
+
+
+def _json_double(value):
+    """
+    Round like the notebook's DataFrame.to_json export (double_precision=10):
+    10 decimals, or 10 significant digits in exponent form below 1e-15.
+    Keeps regenerated catalogs identical to the notebook's.
+    """
+    if 0 < abs(value) < 1e-15:
+        return float(f"{value:.9e}")
+    return round(value, 10)
+
+
+def ingredient_weights(ingredients, k=LAMBDA_DECAY):
+    """
+    e^(-k * position) weight of every ingredient, position starting at 1.
+
+    Args:
+        ingredients: Semicolon-separated ingredient string
+        k: Decay constant
+
+    Returns:
+        Dict of ingredient (lowercase) -> weight
+    """
+    names = [name.strip().lower() for name in ingredients.split(";")]
+    return {
+        name: _json_double(math.exp(-k * position))
+        for position, name in enumerate(filter(None, names), start=1)
+    }
+
+
+def process_record(record, k=LAMBDA_DECAY):
+    """
+    CPU stages of one scraped record (runs in the worker processes).
+
+    Returns:
+        Catalog record with a float price, ingredients and
+        ingredient_scores, or None if the product has no description,
+        price or ingredient list
+    """
+    if not record.get("description"):
+        return None
+    price = parse_price(record.get("price"))
+    if price is None:
+        return None
+    ingredients = record.get("ingredients") or extract_ingredients(record["description"])
+    if not ingredients:
+        return None
+
+    processed = dict(record)
+    processed["price"] = price
+    processed["ingredients"] = ingredients
+    processed["ingredient_scores"] = ingredient_weights(ingredients, k)
+    return processed
+
+
+def _process_chunk(chunk, k):
+    return [process_record(record, k) for record in chunk]
+
+
+def iter_processed(records, workers=4, chunk_size=64, k=LAMBDA_DECAY):
+    """
+    Stream records through the CPU stages, in input order.
+
+    Chunks of records go to a process pool with at most 2 * workers chunks
+    in flight, so results are consumed while the workers keep going.
+
+    Yields:
+        Processed records (or None for dropped ones)
+    """
+    records = iter(records)
+    chunks = iter(lambda: list(islice(records, chunk_size)), [])
+    if workers <= 1:
+        for chunk in chunks:
+            yield from _process_chunk(chunk, k)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = []
+        for chunk in chunks:
+            pending.append(executor.submit(_process_chunk, chunk, k))
+            if len(pending) >= 2 * workers:
+                yield from pending.pop(0).result()
+        for future in pending:
+            yield from future.result()
+
+
+def text_key(model_name, text):
+    """Cache key of an ingredient text for a model."""
+    return hashlib.sha1(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Dense vectors of ingredient texts, keyed by text_key.
+
+    Persisted as an .npz file of keys and vectors; entries of other models
+    never match since the model name is part of the key.
+    """
+
+    def __init__(self, model, model_name, path=None):
+        self.model = model
+        self.model_name = model_name
+        self.path = path
+        self.vectors = {}
+        self.reused = 0
+        self.encoded = 0
+        if path and os.path.exists(path):
+            data = np.load(path)
+            self.vectors = dict(zip(data["keys"].tolist(), data["vectors"]))
+
+    def embed(self, texts, batch_size=256):
+        """
+        Vectors of texts, encoding only the ones not in the store.
+
+        Returns:
+            Array of shape (len(texts), dim)
+        """
+        keys = [text_key(self.model_name, text) for text in texts]
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in self.vectors:
+                missing.setdefault(key, text)
+        self.reused += len(texts) - len(missing)
+
+        if missing:
+            encoded = self.model.encode(
+                list(missing.values()), convert_to_numpy=True, batch_size=batch_size
+            ).astype(np.float32)
+            self.vectors.update(zip(missing, encoded))
+            self.encoded += len(missing)
+        return np.vstack([self.vectors[key] for key in keys])
+
+    def save(self, keep=None):
+        """
+        Write the store, optionally only the keys in keep (drops vectors of
+        texts that are no longer in the catalog).
+        """
+        keys = [key for key in self.vectors if keep is None or key in keep]
+        np.savez(
+            self.path,
+            keys=np.array(keys),
+            vectors=np.array([self.vectors[key] for key in keys], dtype=np.float32),
+        )
+
+
+def extend_vocabulary(base, catalog):
+    """
+    Vocabulary of a catalog that keeps the order of an existing one.
+
+    Terms of base keep their index and new terms are appended (sorted), so
+    the sparse vectors of unchanged products stay identical and sync.py
+    does not re-upload them.
+
+    Args:
+        base: Existing vocabulary (None or empty: start from scratch)
+        catalog: Processed catalog records
+
+    Returns:
+        List of ingredients
+    """
+    base = list(base or [])
+    known = set(base)
+    terms = {name for record in catalog for name in record["ingredient_scores"]}
+    return base + sorted(terms - known)
+
+
+def run_pipeline(
+    records,
+    model,
+    model_name=MODEL_NAME,
+    store_path=None,
+    workers=4,
+    batch_size=256,
+    k=LAMBDA_DECAY,
+    base_vocabulary=None
+):
+    """
+    Run every stage over scraped records.
+
+    Args:
+        records: Iterable of scraped product dicts
+        model: Sentence transformer model
+        model_name: Name of the model (part of the embedding keys)
+        store_path: .npz file of cached embeddings (None: no cache)
+        workers: Processes of the CPU stages (<= 1: inline)
+        batch_size: Texts per model.encode call
+        k: Decay constant of the ingredient weights
+        base_vocabulary: Existing vocabulary whose order is kept
+
+    Returns:
+        Tuple of (catalog records, vocabulary, dense vectors, EmbeddingStore)
+    """
+    store = EmbeddingStore(model, model_name, store_path)
+    catalog = []
+    vectors = []
+    batch = []
+
+    def flush():
+        vectors.append(store.embed([record["ingredients"] for record in batch], batch_size))
+        catalog.extend(batch)
+        batch.clear()
+
+    for record in iter_processed(records, workers=workers, k=k):
+        if record is None:
+            continue
+        batch.append(record)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+
+    vocabulary = extend_vocabulary(base_vocabulary, catalog)
+    dense = np.vstack(vectors) if vectors else np.empty((0, 0), dtype=np.float32)
+    return catalog, vocabulary, dense, store
+
+
+def _write_json(path, data, **kwargs):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, **kwargs)
+    os.replace(tmp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Preprocess scraped products into the search catalog")
+    parser.add_argument("--input", default="Data_preparation/data_parasave.json", help="Scraper output")
+    parser.add_argument("--output", default=CATALOG_PATH)
+    parser.add_argument("--vocab", default=VOCABULARY_PATH)
+    parser.add_argument("--embeddings", default=EMBEDDINGS_PATH, help="Dense vectors (.npy, aligned with the catalog)")
+    parser.add_argument("--cache", default=EMBEDDING_CACHE_PATH, help="Embedding cache (.npz); empty to disable")
+    parser.add_argument("--snapshot", default=SNAPSHOT_PATH, help="Binary catalog snapshot; empty to skip")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--lambda-decay", type=float, default=LAMBDA_DECAY)
+    parser.add_argument(
+        "--rebuild-vocab", action="store_true",
+        help="sort the vocabulary from scratch (changes the sparse indices: every point is re-uploaded)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    # Imported here so the module can be used without loading torch
+    from sentence_transformers import SentenceTransformer
+
+    with open(args.input, "r", encoding="utf-8") as f:
+        records = json.load(f)
+    base_vocabulary = None
+    if os.path.exists(args.vocab) and not args.rebuild_vocab:
+        with open(args.vocab, "r", encoding="utf-8") as f:
+            base_vocabulary = json.load(f)
+
+    start = time.perf_counter()
+    catalog, vocabulary, dense, store = run_pipeline(
+        records,
+        SentenceTransformer(MODEL_NAME),
+        store_path=args.cache or None,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        k=args.lambda_decay,
+        base_vocabulary=base_vocabulary,
+    )
+
+    _write_json(args.output, catalog)
+    _write_json(args.vocab, vocabulary, indent=2)
+    np.save(args.embeddings, dense)
+    if args.snapshot:
+        write_snapshot(args.snapshot, catalog, vocabulary, dense, source_version=catalog_version(args.output))
+    if args.cache:
+        store.save(keep={text_key(MODEL_NAME, record["ingredients"]) for record in catalog})
+
+    logger.info(
+        "✅ %d of %d products kept, %d ingredients, %d embeddings reused, %d encoded (%.1fs)",
+        len(catalog), len(records), len(vocabulary), store.reused, store.encoded,
+        time.perf_counter() - start,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import re
+from collections import namedtuple
+
+from catalog import product_id
+from ingredient_resolver import _char_ngrams, normalize_ingredient
+
+
+# Catalog product matched from a VLM product_info answer.
+# id is the point ID (catalog.product_id), score the name similarity.
+ProductMatch = namedtuple("ProductMatch", ["id", "score", "name", "brand"])
+
+_PRODUCT_NAME_RE = re.compile(r"product\s*name\s*:\s*(.+)", re.IGNORECASE)
+
+
+def normalize_product_name(text):
+    """
+    Normalize a product name (catalog entry or VLM answer) into a key.
+
+    Keeps only the "Product Name: ..." line of a VLM answer, drops the
+    "..." of truncated catalog names, then applies the same normalization
+    as the ingredient keys.
+
+    Args:
+        text: Raw product name or product_info string
+
+    Returns:
+        Normalized key (may be empty)
+    """
+    match = _PRODUCT_NAME_RE.search(text or "")
+    if match:
+        text = match.group(1).splitlines()[0]
+    text = text.replace("...", " ").replace("…", " ")
+    return normalize_ingredient(text)
+
+
+class ProductMatcher:
+    """
+    Map the product_info string of the VLM to a catalog product.
+
+    Candidates are the products sharing at least one word with the query
+    (inverted word index); each candidate is scored with the Dice
+    similarity of the character trigrams of the two names. Products whose
+    brand does not appear in the query are penalized, since the front of
+    the pack almost always shows the brand. A query that matches two
+    differently named products almost equally well ("AKTIV 30 comprimes")
+    is ambiguous and returns no match.
+    """
+
+    def __init__(self, records, threshold=0.7, min_margin=0.05, brand_penalty=0.8, ngram_size=3):
+        """
+        Args:
+            records: Catalog records
+            threshold: Minimum score of a match
+            min_margin: Minimum lead over the best differently named product
+            brand_penalty: Score multiplier when the brand is not in the query
+            ngram_size: Character n-gram length
+        """
+        self.threshold = threshold
+        self.min_margin = min_margin
+        self.brand_penalty = brand_penalty
+        self.ngram_size = ngram_size
+        self.ids = [product_id(record) for record in records]
+        self.names = []
+        self.brands = []
+        self.categories = []
+        self._keys = []
+        self._grams = []
+        self._brand_keys = []
+        self._word_index = {}
+
+        for idx, record in enumerate(records):
+            key = normalize_product_name(str(record.get("product_name") or ""))
+            self.names.append(record.get("product_name"))
+            self.brands.append(record.get("product_brand"))
+            self.categories.append(record.get("category"))
+            self._keys.append(key)
+            self._grams.append(_char_ngrams(key, ngram_size))
+            self._brand_keys.append(normalize_ingredient(str(record.get("product_brand") or "")))
+            for word in set(key.split()):
+                self._word_index.setdefault(word, []).append(idx)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def match(self, product_info, category=None):
+        """
+        Find the catalog product named in product_info.
+
+        Args:
+            product_info: VLM answer ("Product Name: ...") or a plain name
+            category: Only consider products of this category
+
+        Returns:
+            ProductMatch, or None if no product scores above the threshold
+            or the match is ambiguous
+        """
+        key = normalize_product_name(product_info)
+        if not key:
+            return None
+        grams = _char_ngrams(key, self.ngram_size)
+        padded_key = f" {key} "
+
+        candidates = set()
+        for word in set(key.split()):
+            candidates.update(self._word_index.get(word, ()))
+
+        best_score, best_idx = 0.0, None
+        runner_up = 0.0
+        # Sorted so that duplicated products resolve to the lowest ID
+        for idx in sorted(candidates):
+            if category is not None and self.categories[idx] != category:
+                continue
+            other = self._grams[idx]
+            score = 2.0 * len(grams & other) / (len(grams) + len(other))
+            brand_key = self._brand_keys[idx]
+            if brand_key and f" {brand_key} " not in padded_key:
+                score *= self.brand_penalty
+            if score > best_score:
+                if best_idx is not None and self._keys[best_idx] != self._keys[idx]:
+                    runner_up = best_score
+                best_score, best_idx = score, idx
+            elif score > runner_up and self._keys[idx] != self._keys[best_idx]:
+                runner_up = score
+
+        if best_idx is None or best_score < self.threshold:
+            return None
+        if best_score - runner_up < self.min_margin:
+            return None
+        return ProductMatch(self.ids[best_idx], best_score, self.names[best_idx], self.brands[best_idx])
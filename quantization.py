@@ -0,0 +1,81 @@
+"""
+Compressed copies of the dense vectors for the local engine.
+
+Same two schemes as the Qdrant quantization options of ingestion.py:
+    - int8: every component scaled by a bound (the 0.99 quantile of the
+      absolute values) and rounded to [-127, 127]; 4x smaller
+    - binary: the sign of every component, 8 per byte; 32x smaller, the
+      score is the share of matching signs
+
+Scores computed on the codes are approximate: the local engine takes the
+best oversampling * k rows by approximate score and rescores them with the
+float vectors (which can stay memory-mapped, only those rows are read).
+"""
+import numpy as np
+
+
+QUANTIZATION_KINDS = ("int8", "binary")
+
+# Rows scored per chunk (bounds the float copy of int8 codes)
+CHUNK_ROWS = 4096
+
+# Number of set bits of every byte value
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+class QuantizedVectors:
+    """int8 or binary codes of unit dense vectors, with approximate dot products."""
+
+    def __init__(self, vectors, kind="int8", quantile=0.99):
+        """
+        Args:
+            vectors: (n, dim) unit float vectors
+            kind: "int8" or "binary"
+            quantile: Quantile of the absolute values mapped to 127 (int8)
+        """
+        if kind not in QUANTIZATION_KINDS:
+            raise ValueError(f"Unknown quantization {kind!r}, expected one of {QUANTIZATION_KINDS}")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.kind = kind
+        self.dim = vectors.shape[1]
+        if kind == "int8":
+            self.bound = float(np.quantile(np.abs(vectors), quantile)) or 1.0
+            self.codes = self._int8_codes(vectors)
+        else:
+            self.bound = None
+            self.codes = np.packbits(vectors > 0, axis=1)
+
+    def _int8_codes(self, vectors):
+        return np.clip(np.rint(vectors * (127.0 / self.bound)), -127, 127).astype(np.int8)
+
+    @property
+    def nbytes(self):
+        """Size of the codes in bytes."""
+        return self.codes.nbytes
+
+    def scores(self, query, rows):
+        """
+        Approximate dot products of a unit query with the given rows.
+
+        Args:
+            query: Unit float query vector
+            rows: Row IDs
+
+        Returns:
+            Float32 array aligned with rows
+        """
+        query = np.asarray(query, dtype=np.float32)
+        scores = np.empty(len(rows), dtype=np.float32)
+        if self.kind == "int8":
+            # The query stays float: only the rows' rounding error remains
+            query = query * (self.bound / 127.0)
+            for start in range(0, len(rows), CHUNK_ROWS):
+                chunk = self.codes[rows[start:start + CHUNK_ROWS]].astype(np.float32)
+                scores[start:start + CHUNK_ROWS] = chunk @ query
+        else:
+            query_bits = np.packbits(query > 0)
+            for start in range(0, len(rows), CHUNK_ROWS):
+                chunk = np.bitwise_xor(self.codes[rows[start:start + CHUNK_ROWS]], query_bits)
+                mismatches = _POPCOUNT[chunk].sum(axis=1, dtype=np.int32)
+                scores[start:start + CHUNK_ROWS] = 1.0 - 2.0 * mismatches / self.dim
+        return scores
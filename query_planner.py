@@ -0,0 +1,224 @@
+"""
+Selectivity-aware planning of the filtered hybrid search.
+
+Every search filters on category and price <= budget. How many products
+pass that filter decides the best way to run it:
+
+    - none: the cheapest product of the category is above the budget, so
+      the search is skipped and an empty result returned ("empty")
+    - a few hundred at most: an exact scan of the matching points is
+      cheaper than HNSW traversal with filtering, and has perfect recall
+      ("exact")
+    - more: the HNSW index, with prefetch limits growing with the number
+      of matching products so the fusion still sees enough candidates
+      ("indexed")
+
+The number of matching products is estimated from an equi-depth price
+histogram per category, written next to the catalog whenever the
+collection is loaded or synced (ingestion.py, sync.py), and reloaded by
+running planners when that file changes.
+
+Environment:
+    PARASAVE_PRICE_STATS=path      histogram file (default: Data_preparation/price_stats.json)
+    PARASAVE_EXACT_THRESHOLD=200   estimated matches up to which the search is exact
+"""
+import json
+import math
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+
+PRICE_STATS_PATH = os.getenv("PARASAVE_PRICE_STATS", "Data_preparation/price_stats.json")
+EXACT_THRESHOLD = int(os.getenv("PARASAVE_EXACT_THRESHOLD", "200"))
+
+# Buckets of each category's histogram
+HISTOGRAM_BUCKETS = 32
+
+# Prefetch limits of indexed searches: a share of the estimated matches,
+# between the historical fixed limit and a cap
+MIN_PREFETCH = 100
+MAX_PREFETCH = 400
+PREFETCH_SHARE = 0.25
+
+# strategy: "empty", "exact" or "indexed"; estimated: products estimated
+# to pass the filter; prefetch_limit: candidates of each prefetch
+QueryPlan = namedtuple("QueryPlan", ["strategy", "estimated", "prefetch_limit"])
+
+
+class PriceHistogram:
+    """
+    Equi-depth histogram of the prices of one category.
+
+    Bucket i holds the prices in (edges[i - 1], edges[i]], with
+    cumulative[i] products at or below edges[i]. min_price and the total
+    are exact, so "nothing under budget" and "everything under budget" are
+    never estimates.
+    """
+
+    def __init__(self, min_price, edges, cumulative):
+        self.min_price = min_price
+        self.edges = edges
+        self.cumulative = cumulative
+
+    @classmethod
+    def from_prices(cls, prices, buckets=HISTOGRAM_BUCKETS):
+        prices = sorted(float(price) for price in prices)
+        if not prices:
+            return cls(math.inf, [], [])
+        edges = []
+        cumulative = []
+        for bucket in range(1, buckets + 1):
+            # Price at the end of the bucket; equal prices all land in the
+            # bucket of their first occurrence
+            edge = prices[max(math.ceil(bucket * len(prices) / buckets) - 1, 0)]
+            if edges and edge <= edges[-1]:
+                continue
+            edges.append(edge)
+            cumulative.append(bisect_right(prices, edge))
+        return cls(prices[0], edges, cumulative)
+
+    @property
+    def total(self):
+        return self.cumulative[-1] if self.cumulative else 0
+
+    def estimate(self, budget):
+        """Estimated number of products with price <= budget."""
+        if budget < self.min_price:
+            return 0
+        idx = bisect_left(self.edges, budget)
+        if idx >= len(self.edges):
+            return self.total
+        if self.edges[idx] == budget:
+            return self.cumulative[idx]
+        # Linear interpolation inside the bucket
+        low_edge = self.edges[idx - 1] if idx else self.min_price
+        low_count = self.cumulative[idx - 1] if idx else 0
+        share = (budget - low_edge) / (self.edges[idx] - low_edge) if self.edges[idx] > low_edge else 1.0
+        return max(1, round(low_count + share * (self.cumulative[idx] - low_count)))
+
+    def to_json(self):
+        return {"min_price": self.min_price, "edges": self.edges, "cumulative": self.cumulative}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["min_price"], data["edges"], data["cumulative"])
+
+
+def build_price_stats(records, buckets=HISTOGRAM_BUCKETS):
+    """
+    Price histograms of every category of the catalog.
+
+    Returns:
+        Dict of category -> PriceHistogram
+    """
+    prices = {}
+    for record in records:
+        if record.get("price") is not None:
+            prices.setdefault(record["category"], []).append(record["price"])
+    return {category: PriceHistogram.from_prices(values, buckets) for category, values in prices.items()}
+
+
+def write_price_stats(records, path=PRICE_STATS_PATH):
+    """
+    Refresh the histogram file from the catalog that was just indexed.
+
+    Returns:
+        Dict of category -> PriceHistogram
+    """
+    stats = build_price_stats(records)
+    data = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "categories": {category: histogram.to_json() for category, histogram in stats.items()},
+    }
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+    return stats
+
+
+def load_price_stats(path=PRICE_STATS_PATH):
+    """Load a histogram file written by write_price_stats (None if missing)."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {category: PriceHistogram.from_json(item) for category, item in data["categories"].items()}
+
+
+class QueryPlanner:
+    """
+    Pick the strategy and prefetch limits of a search from the price histograms.
+
+    version_fn returns a tag of the data behind the histograms; when it
+    changes between two calls, they are reloaded with reload_fn (a stale
+    histogram could plan "empty" for a product that became cheaper).
+    """
+
+    def __init__(self, stats, exact_threshold=EXACT_THRESHOLD, reload_fn=None, version_fn=None):
+        """
+        Args:
+            stats: Dict of category -> PriceHistogram
+            exact_threshold: Estimated matches up to which the search is exact
+            reload_fn: Optional zero-argument callable returning fresh stats
+            version_fn: Optional callable returning the catalog version
+        """
+        self.stats = stats
+        self.exact_threshold = exact_threshold
+        self.reload_fn = reload_fn
+        self.version_fn = version_fn
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._version = version_fn() if version_fn else None
+
+    def _check_version(self):
+        if self.version_fn is None or self.reload_fn is None:
+            return
+        version = self.version_fn()
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self.stats = self.reload_fn()
+                self._version = version
+                self.reloads += 1
+
+    def cheapest(self, category):
+        """Lowest price of a category (None if the category is unknown)."""
+        self._check_version()
+        histogram = self.stats.get(category)
+        if histogram is None or not histogram.total:
+            return None
+        return histogram.min_price
+
+    def plan(self, category, budget, limit=10):
+        """
+        Plan the search of a category under a budget.
+
+        Args:
+            category: Product category
+            budget: Maximum price
+            limit: Number of results the caller wants
+
+        Returns:
+            QueryPlan
+        """
+        self._check_version()
+        histogram = self.stats.get(category)
+        if histogram is None:
+            # Category unknown to the stats (newer than them): plain
+            # indexed search with the default limits
+            return QueryPlan("indexed", None, MIN_PREFETCH)
+
+        estimated = histogram.estimate(float(budget))
+        if estimated == 0:
+            return QueryPlan("empty", 0, 0)
+        if estimated <= self.exact_threshold:
+            # Every matching point fits in the prefetch; the margin covers
+            # the histogram's interpolation error
+            return QueryPlan("exact", estimated, max(limit, min(estimated * 2, estimated + 50)))
+        prefetch_limit = min(MAX_PREFETCH, max(MIN_PREFETCH, limit, round(estimated * PREFETCH_SHARE)))
+        return QueryPlan("indexed", estimated, prefetch_limit)
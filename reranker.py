@@ -0,0 +1,150 @@
+import os
+
+import numpy as np
+from scipy import sparse
+from qdrant_client.http.models import QueryResponse, ScoredPoint
+
+
+# Blend of the second stage: weighted ingredient overlap and dense cosine
+OVERLAP_WEIGHT = float(os.getenv("PARASAVE_RERANK_OVERLAP_WEIGHT", "0.7"))
+DENSE_WEIGHT = float(os.getenv("PARASAVE_RERANK_DENSE_WEIGHT", "0.3"))
+
+# Fused candidates re-scored by the second stage (2 prefetches of 100)
+RERANK_CANDIDATES = 200
+
+
+def weighted_overlap(query_sparse, candidates):
+    """
+    Position-aware overlap of the query with every candidate.
+
+    Both sides carry e^(-k*pos) weights, so min(query, candidate) on a
+    shared ingredient is high only when it sits near the top of both
+    lists. The sum is normalized by the query's total weight: 1.0 means
+    every query ingredient at the same position.
+
+    Args:
+        query_sparse: SparseVector of the query (create_sparse_vector)
+        candidates: CSR matrix of the candidates' ingredient scores
+
+    Returns:
+        Array of overlaps in [0, 1], one per candidate
+    """
+    n_candidates = candidates.shape[0]
+    if not len(query_sparse.indices) or n_candidates == 0:
+        return np.zeros(n_candidates)
+
+    query = np.zeros(candidates.shape[1], dtype=np.float64)
+    query[np.asarray(query_sparse.indices)] = query_sparse.values
+    # The query repeats each position's weight on every spelling variant;
+    # positions have distinct weights, so the unique values are one per position
+    total = np.unique(np.asarray(query_sparse.values, dtype=np.float64)).sum()
+
+    shared = np.minimum(candidates.data, query[candidates.indices])
+    per_row = np.zeros(n_candidates)
+    rows = np.repeat(np.arange(n_candidates), np.diff(candidates.indptr))
+    np.add.at(per_row, rows, shared)
+    return np.minimum(per_row / total, 1.0)
+
+
+def dense_similarity(query_dense, candidates):
+    """Cosine similarity of the query with every candidate row."""
+    query = np.asarray(query_dense, dtype=np.float32)
+    candidates = np.asarray(candidates, dtype=np.float32)
+    norms = np.linalg.norm(candidates, axis=1) * max(np.linalg.norm(query), 1e-12)
+    norms[norms == 0] = 1.0
+    return (candidates @ query) / norms
+
+
+def rerank_scores(
+    query_dense,
+    query_sparse,
+    candidate_dense,
+    candidate_sparse,
+    overlap_weight=OVERLAP_WEIGHT,
+    dense_weight=DENSE_WEIGHT
+):
+    """
+    Blended second-stage score of every candidate.
+
+    Args:
+        query_dense: Dense query vector
+        query_sparse: SparseVector of the query
+        candidate_dense: (n, dim) dense vectors of the candidates
+        candidate_sparse: (n, vocab_size) CSR ingredient scores
+        overlap_weight: Weight of the weighted ingredient overlap
+        dense_weight: Weight of the dense cosine similarity
+
+    Returns:
+        Array of scores, one per candidate
+    """
+    return (
+        overlap_weight * weighted_overlap(query_sparse, candidate_sparse)
+        + dense_weight * dense_similarity(query_dense, candidate_dense)
+    )
+
+
+def _sparse_rows(vectors, vocab_size):
+    """Stack SparseVectors into a CSR matrix."""
+    indptr = np.zeros(len(vectors) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(vector.indices) for vector in vectors])
+    indices = np.fromiter(
+        (idx for vector in vectors for idx in vector.indices), dtype=np.int32, count=indptr[-1]
+    )
+    data = np.fromiter(
+        (value for vector in vectors for value in vector.values), dtype=np.float64, count=indptr[-1]
+    )
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(vectors), vocab_size))
+
+
+def rerank_points(
+    points,
+    query_dense,
+    query_sparse,
+    limit=10,
+    overlap_weight=OVERLAP_WEIGHT,
+    dense_weight=DENSE_WEIGHT
+):
+    """
+    Re-order fused candidates returned by Qdrant with their vectors.
+
+    Args:
+        points: ScoredPoints fetched with with_vectors=True
+            ("dense" and "sparse" named vectors)
+        query_dense: Dense query vector
+        query_sparse: SparseVector of the query
+        limit: Number of results to return
+        overlap_weight: Weight of the weighted ingredient overlap
+        dense_weight: Weight of the dense cosine similarity
+
+    Returns:
+        QueryResponse with the best limit points, scored by the blend and
+        without their vectors
+    """
+    if not points:
+        return QueryResponse(points=[])
+
+    sparse_vectors = [point.vector["sparse"] for point in points]
+    vocab_size = 1 + max(
+        [max(query_sparse.indices, default=0)]
+        + [max(vector.indices, default=0) for vector in sparse_vectors]
+    )
+    scores = rerank_scores(
+        query_dense,
+        query_sparse,
+        np.array([point.vector["dense"] for point in points]),
+        _sparse_rows(sparse_vectors, vocab_size),
+        overlap_weight,
+        dense_weight,
+    )
+
+    order = np.argsort(-scores, kind="stable")[:limit]
+    reranked = []
+    for pos in order:
+        point = points[pos]
+        reranked.append(ScoredPoint(
+            id=point.id,
+            version=point.version,
+            score=float(scores[pos]),
+            payload=point.payload,
+        ))
+    return QueryResponse(points=reranked)
@@ -0,0 +1,86 @@
+import threading
+import time
+
+
+class ResourceRegistry:
+    """
+    Lazily created, process-wide shared objects.
+
+    Each resource is registered with a zero-argument factory and built on
+    the first get(), exactly once per process even when several Streamlit
+    sessions ask for it at the same time. Factories may get() other
+    resources. Build and warmup times are recorded in self.timings.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._warmups = {}
+        self._instances = {}
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+        self.timings = {}
+
+    def register(self, name, factory, warmup=None):
+        """
+        Register a resource.
+
+        Args:
+            name: Resource name
+            factory: Zero-argument callable building the resource
+            warmup: Optional callable run on the built resource by warmup()
+        """
+        with self._registry_lock:
+            self._factories[name] = factory
+            self._warmups[name] = warmup
+            self._locks.setdefault(name, threading.RLock())
+
+    def get(self, name):
+        """Return the resource, building it on first use."""
+        # Membership, not truthiness: a factory may legitimately return None
+        # (e.g. an optional file that does not exist)
+        if name in self._instances:
+            return self._instances[name]
+
+        lock = self._locks.get(name)
+        if lock is None:
+            raise KeyError(f"Unknown resource: {name}")
+
+        with lock:
+            # Another thread may have built it while we were waiting
+            if name not in self._instances:
+                start = time.perf_counter()
+                instance = self._factories[name]()
+                self.timings[f"{name}.load"] = time.perf_counter() - start
+                self._instances[name] = instance
+        return self._instances[name]
+
+    def is_loaded(self, name):
+        """Return True if the resource has already been built."""
+        return name in self._instances
+
+    def warmup(self, names=None):
+        """
+        Build resources ahead of the first request and run their warmup hooks.
+
+        Args:
+            names: Resources to warm up (default: all registered)
+
+        Returns:
+            Dict of timings in seconds
+        """
+        for name in names or list(self._factories):
+            instance = self.get(name)
+            hook = self._warmups.get(name)
+            if hook is not None and f"{name}.warmup" not in self.timings:
+                start = time.perf_counter()
+                hook(instance)
+                self.timings[f"{name}.warmup"] = time.perf_counter() - start
+        return self.report()
+
+    def report(self):
+        """Return the recorded build and warmup timings."""
+        return dict(self.timings)
+
+
+# Shared by utils.py and app.py
+registry = ResourceRegistry()
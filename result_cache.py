@@ -0,0 +1,194 @@
+"""
+Cache of search results that serves lower budgets from wider ones.
+
+A scan is often retried with another budget. The hits of a search under
+budget B, when they go deeper than the requested limit, also answer any
+budget b < B: keep the hits priced at most b. Entries are keyed by the
+category, the query vectors (dense and resolved sparse) and the search
+options, and hold the candidate lists of up to BUDGETS_PER_KEY budgets:
+the widest one seen, plus the lower ones it could not answer.
+
+Like the precomputed alternatives table, the order under a lower budget
+can differ slightly from a live query (fused ranks were computed over the
+wider candidate set). A lookup misses when fewer than limit hits survive
+the budget and the cached list was cut at its depth (a live query may
+find more).
+
+Entries expire after a TTL and the whole cache is dropped when the catalog
+version changes (new snapshot, or the collection reloaded or synced).
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+
+# Candidate lists kept per query (different budgets)
+BUDGETS_PER_KEY = 4
+
+# points: hits best first (projected payload with "price"); budget: budget
+# searched; complete: every product under budget is in points
+CacheEntry = namedtuple("CacheEntry", ["points", "budget", "complete", "created"])
+
+
+def _narrow(entry, budget):
+    """Hits of an entry under a lower budget."""
+    if budget >= entry.budget:
+        return entry.points
+    return [point for point in entry.points if point.payload["price"] <= budget]
+
+
+def result_key(category, query_dense, query_sparse, **options):
+    """
+    Cache key of a search.
+
+    Args:
+        category: Product category
+        query_dense: Dense query vector
+        query_sparse: SparseVector of the resolved query ingredients
+        **options: Anything else that changes the results (fusion,
+            rerank, payload fields, ...)
+
+    Returns:
+        Hex digest
+    """
+    digest = hashlib.sha1()
+    digest.update(str(category).encode("utf-8"))
+    digest.update(np.asarray(query_dense, dtype=np.float32).tobytes())
+    digest.update(np.asarray(query_sparse.indices, dtype=np.int64).tobytes())
+    digest.update(np.asarray(query_sparse.values, dtype=np.float32).tobytes())
+    digest.update(repr(sorted(options.items())).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of search hits, monotonic in the budget.
+
+    version_fn returns a tag of the data behind the results; when it
+    changes between two calls, every entry is dropped.
+    """
+
+    def __init__(self, max_size=256, ttl=600.0, version_fn=None):
+        """
+        Args:
+            max_size: Maximum number of cached searches
+            ttl: Lifetime of an entry in seconds (None: no limit)
+            version_fn: Optional callable returning the catalog version
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version_fn = version_fn
+        self.hits = 0
+        self.narrowed_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = version_fn() if version_fn else None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Return hit/miss counters and the current size."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "narrowed_hits": self.narrowed_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "invalidations": self.invalidations,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+        }
+
+    def clear(self):
+        """Drop every entry and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.narrowed_hits = 0
+            self.misses = 0
+
+    def _check_version(self):
+        # Called with the lock held
+        if self.version_fn is None:
+            return
+        version = self.version_fn()
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+            self.invalidations += 1
+
+    def get(self, key, budget, limit):
+        """
+        Hits of a cached search under budget.
+
+        Args:
+            key: Output of result_key
+            budget: Maximum price
+            limit: Number of results wanted
+
+        Returns:
+            List of at most limit points, or None on a miss
+        """
+        budget = float(budget)
+        with self._lock:
+            self._check_version()
+            entries = self._live_entries(key)
+            # Narrowest budget first: it keeps the most hits under budget
+            for entry in entries:
+                if entry.budget < budget:
+                    continue
+                points = _narrow(entry, budget)
+                if len(points) >= limit or entry.complete:
+                    self.narrowed_hits += budget < entry.budget
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return points[:limit]
+            self.misses += 1
+            return None
+
+    def _live_entries(self, key):
+        # Called with the lock held: entries of a key without the expired ones
+        entries = self._entries.get(key, [])
+        if self.ttl is not None:
+            now = time.time()
+            entries = [entry for entry in entries if now - entry.created <= self.ttl]
+            if entries:
+                self._entries[key] = entries
+            else:
+                self._entries.pop(key, None)
+        return entries
+
+    def put(self, key, budget, points, depth):
+        """
+        Store the hits of a search, unless a cached wider search already
+        holds them.
+
+        Args:
+            key: Output of result_key
+            budget: Maximum price of the search
+            points: Hits, best first, with "price" in their payload
+            depth: Number of hits the search asked for (fewer returned
+                means every product under budget is in points)
+        """
+        budget = float(budget)
+        complete = len(points) < depth
+        with self._lock:
+            self._check_version()
+            entries = self._live_entries(key)
+            for entry in entries:
+                if entry.budget >= budget and (entry.complete or len(_narrow(entry, budget)) >= len(points)):
+                    return
+            entries = [entry for entry in entries if entry.budget != budget]
+            entries.append(CacheEntry(list(points), budget, complete, time.time()))
+            if len(entries) > BUDGETS_PER_KEY:
+                entries.remove(min(entries, key=lambda entry: entry.created))
+            self._entries[key] = sorted(entries, key=lambda entry: entry.budget)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
@@ -0,0 +1,482 @@
+"""
+Crawler of the parapharmacy shops the catalog comes from.
+
+Replaces the Selenium notebook (Data_preparation/para_scraping.ipynb):
+category listings and product pages are fetched with one pooled async HTTP
+client and parsed with BeautifulSoup, using the notebook's CSS selectors.
+Requests are bounded by a global concurrency limit and spaced per host.
+Every response's ETag, Last-Modified and a hash of the parsed content are
+kept in a state file, so a re-crawl sends conditional requests and reports
+which products actually changed.
+
+Usage:
+    python scraper.py --output Data_preparation/data_parasave.json --state Data_preparation/crawl_state.json
+    python scraper.py --site paralabel --concurrency 4 --rate 1
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from collections import Counter, namedtuple
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+from bs4 import BeautifulSoup
+
+
+logger = logging.getLogger(__name__)
+
+# Listing URLs and selectors of every shop, as in the scraping notebook.
+# "page_param" is the query parameter of the listing pagination (what the
+# "load more" button requests).
+SITES = {
+    "parashop": {
+        "listings": {
+            "solar": "https://www.parashop.tn/solaire?fc=345",
+            "foodSup": "https://www.parashop.tn/nos-complements-alimentaires?fc=149",
+            "faceGel": "https://www.parashop.tn/visage/nettoyant-demaquillant/gel-lavant",
+        },
+        "page_param": "page",
+        "product": "div.main-products.product-grid > div",
+        "link": "div.caption div.name a",
+        "brand": "div.stats > span > span:nth-child(2) > a",
+        "promo_price": "div.caption > div.price > div > span.price-new",
+        "price": "div.caption > div.price > div > span",
+        "description": "#content > div.product-blocks.blocks-default > div",
+    },
+    "paralabel": {
+        "listings": {
+            "solar": "https://www.paralabel.tn/13-ecran-solaire-",
+            "foodSup": "https://www.paralabel.tn/16-complements-alimentaires-",
+            "faceGel": "https://www.paralabel.tn/123-nettoyage",
+        },
+        "page_param": "page",
+        "product": "div.row.product_content.grid.row > div",
+        "link": "div.inner_desc > p > a",
+        "brand": "div.inner_desc > div.manufacturer > a",
+        "promo_price": None,
+        "price": "div.product_desc > div.inner_desc > div.product-price-and-shipping > span",
+        "description": "#main > div > div.col-md-12.description-block-costumization > section > div",
+    },
+}
+
+# Bundles and gifts are not single products
+EXCLUDED_WORDS = ["pack", "coffret", "box", "sac", "offert", "offerte", "0fferte", "0ffert"]
+
+USER_AGENT = "ParaSave-crawler/1.0"
+
+# Pages fetched per listing at most (guards against pagination loops)
+MAX_PAGES = 100
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# records: product dicts (notebook format), stats: Counter of fetch outcomes,
+# changed: URLs of new or changed products
+CrawlResult = namedtuple("CrawlResult", ["records", "stats", "changed"])
+
+
+def _text(element, selector, separator=" "):
+    found = element.select_one(selector) if selector else None
+    return found.get_text(separator, strip=True) if found else None
+
+
+def parse_listing(html, site, category, base_url):
+    """
+    Parse the products of a listing page.
+
+    Args:
+        html: Listing page HTML
+        site: Site config (see SITES)
+        category: Category stored on the products
+        base_url: URL of the page (to resolve relative links)
+
+    Returns:
+        List of product dicts without description and scraping date
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    products = []
+    for element in soup.select(site["product"]):
+        link = element.select_one(site["link"])
+        if link is None or not link.get("href"):
+            continue
+        name = link.get_text(" ", strip=True)
+        if any(word in name.lower() for word in EXCLUDED_WORDS):
+            continue
+
+        promo_price = _text(element, site["promo_price"])
+        products.append({
+            "category": category,
+            "product_name": name,
+            "product_brand": _text(element, site["brand"]),
+            "price": promo_price or _text(element, site["price"]),
+            "promo": 1 if promo_price else 0,
+            "url": urljoin(base_url, link["href"]),
+            "ingredients": None,
+            "description": None,
+        })
+    return products
+
+
+def parse_product(html, site):
+    """Return the description block of a product page (None if missing)."""
+    soup = BeautifulSoup(html, "html.parser")
+    # Line breaks kept, like Selenium's .text: preprocess.format_ingredients
+    # detects one-ingredient-per-line lists by counting them
+    return _text(soup, site["description"], separator="\n")
+
+
+def content_hash(data):
+    """Hash of parsed content, so layout-only page changes do not count."""
+    return hashlib.sha1(json.dumps(data, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class CrawlState:
+    """
+    Validators and parsed content of every fetched URL, kept between crawls.
+
+    Each entry: etag, last_modified, hash (content_hash of data), data and
+    checked (time of the last successful fetch). Product pages also keep
+    record_hash, the hash of the whole product record.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = entries or {}
+
+    @classmethod
+    def load(cls, path):
+        if not path or not os.path.exists(path):
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def save(self, path):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def get(self, url):
+        return self.entries.get(url)
+
+    def conditional_headers(self, url):
+        """If-None-Match / If-Modified-Since headers of a stored URL."""
+        entry = self.entries.get(url) or {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def update(self, url, response, data):
+        """
+        Store a fetched URL.
+
+        Returns:
+            "new", "changed" or "unchanged" (same parsed content as before)
+        """
+        digest = content_hash(data)
+        entry = self.entries.setdefault(url, {})
+        previous = entry.get("hash")
+        entry.update({
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "hash": digest,
+            "data": data,
+            "checked": time.time(),
+        })
+        if previous is None:
+            return "new"
+        return "unchanged" if previous == digest else "changed"
+
+    def touch(self, url):
+        """Record a successful revalidation (304) of a stored URL."""
+        self.entries[url]["checked"] = time.time()
+
+    def update_record(self, url, record):
+        """
+        Store the hash of a product record (listing fields and description).
+
+        A price change on the listing changes the record even when the
+        product page itself did not change.
+
+        Returns:
+            "new", "changed" or "unchanged"
+        """
+        digest = content_hash({key: value for key, value in record.items() if key != "scraping_date"})
+        entry = self.entries.setdefault(url, {})
+        previous = entry.get("record_hash")
+        entry["record_hash"] = digest
+        if previous is None:
+            return "new"
+        return "unchanged" if previous == digest else "changed"
+
+
+class HostRateLimiter:
+    """Space requests to the same host by at least 1 / rate seconds."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next = {}
+        self._locks = {}
+
+    async def wait(self, host):
+        if not self.interval:
+            return
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            start = max(now, self._next.get(host, now))
+            self._next[host] = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+
+
+def _retry_after(response, default):
+    """Delay requested by a 429/503 Retry-After header (seconds or HTTP date)."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default
+
+
+class Scraper:
+    """
+    Async crawler of the SITES listings and their product pages.
+
+    Args:
+        sites: Site configs (default: SITES)
+        state: CrawlState of the previous crawl (conditional requests)
+        concurrency: Requests in flight at most, over all hosts
+        rate: Requests per second per host
+        timeout: Timeout of one request in seconds
+        retries: Retries of a request on network errors, 429 and 5xx
+        backoff: Base delay of the exponential backoff in seconds
+        refresh_after: Product pages checked less than this many seconds
+            ago are not requested at all (None: always revalidate)
+        transport: Optional httpx transport (tests, fixtures)
+    """
+
+    def __init__(
+        self,
+        sites=None,
+        state=None,
+        concurrency=8,
+        rate=2.0,
+        timeout=15.0,
+        retries=3,
+        backoff=0.5,
+        refresh_after=None,
+        transport=None
+    ):
+        self.sites = sites or SITES
+        self.state = state or CrawlState()
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.refresh_after = refresh_after
+        self.transport = transport
+        self.limiter = HostRateLimiter(rate)
+        self.stats = Counter()
+        self._semaphore = None
+        self._client = None
+
+    async def _request(self, url, headers):
+        """GET with concurrency limit, per-host spacing and retries."""
+        host = urlsplit(url).netloc
+        for attempt in range(self.retries + 1):
+            await self.limiter.wait(host)
+            try:
+                async with self._semaphore:
+                    response = await self._client.get(url, headers=headers)
+            except httpx.TransportError as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                logger.debug("Retrying %s in %.1fs: %s", url, delay, e)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    return response
+                delay = _retry_after(response, self.backoff * 2 ** attempt)
+                logger.debug("Retrying %s in %.1fs: HTTP %d", url, delay, response.status_code)
+            self.stats["retries"] += 1
+            await asyncio.sleep(delay * (0.5 + random.random() / 2))
+
+    async def fetch(self, url, parse, kind):
+        """
+        Fetch and parse a URL, revalidating the stored copy if there is one.
+
+        Args:
+            url: Page URL
+            parse: parse(html) -> JSON-serializable data
+            kind: "listing" or "product" (stats key)
+
+        Returns:
+            Tuple of (data, outcome): outcome is "new", "changed",
+            "unchanged", "not_modified", "fresh" or "failed" (data is then
+            the stored copy, or None)
+        """
+        entry = self.state.get(url)
+        if (
+            kind == "product"
+            and entry is not None
+            and self.refresh_after is not None
+            and time.time() - entry.get("checked", 0) < self.refresh_after
+        ):
+            outcome = "fresh"
+            self.stats[f"{kind}_{outcome}"] += 1
+            return entry["data"], outcome
+
+        try:
+            response = await self._request(url, self.state.conditional_headers(url))
+            if response.status_code == 304 and entry is not None:
+                self.state.touch(url)
+                data, outcome = entry["data"], "not_modified"
+            else:
+                response.raise_for_status()
+                data = parse(response.text)
+                outcome = self.state.update(url, response, data)
+        except (httpx.HTTPError, ValueError) as e:
+            # Keep the last known copy rather than losing the product
+            logger.warning("❌ %s: %s", url, e)
+            data, outcome = (entry or {}).get("data"), "failed"
+        self.stats[f"{kind}_{outcome}"] += 1
+        return data, outcome
+
+    async def crawl_listing(self, site_name, category, url, scraping_date):
+        """
+        Every product of a category listing, following its pagination.
+
+        Stops at the first page without products or without new ones.
+        """
+        site = self.sites[site_name]
+        products = {}
+        for page in range(1, MAX_PAGES + 1):
+            page_url = url if page == 1 else str(httpx.URL(url).copy_merge_params({site["page_param"]: page}))
+            page_products, _ = await self.fetch(
+                page_url,
+                lambda html: parse_listing(html, site, category, page_url),
+                "listing",
+            )
+            new = [product for product in page_products or [] if product["url"] not in products]
+            if not new:
+                break
+            for product in new:
+                # Copies: the parsed page is also kept in the crawl state
+                products[product["url"]] = dict(product, scraping_date=scraping_date)
+        logger.info("   %s/%s: %d products", site_name, category, len(products))
+        return site_name, list(products.values())
+
+    async def _crawl_product(self, site_name, product):
+        data, outcome = await self.fetch(
+            product["url"], lambda html: parse_product(html, self.sites[site_name]), "product"
+        )
+        product["description"] = data
+        if outcome == "failed":
+            return product, outcome
+        return product, self.state.update_record(product["url"], product)
+
+    async def crawl(self, site_names=None):
+        """
+        Crawl listings and product pages of the given sites (default: all).
+
+        Returns:
+            CrawlResult
+        """
+        scraping_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        site_names = site_names or list(self.sites)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+
+        async with httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=limits,
+            follow_redirects=True,
+            headers={"User-Agent": USER_AGENT},
+            transport=self.transport,
+        ) as client:
+            self._client = client
+            listings = await asyncio.gather(*[
+                self.crawl_listing(site_name, category, url, scraping_date)
+                for site_name in site_names
+                for category, url in self.sites[site_name]["listings"].items()
+            ])
+            crawled = await asyncio.gather(*[
+                self._crawl_product(site_name, product)
+                for site_name, products in listings
+                for product in products
+            ])
+        self._client = None
+
+        records = [product for product, _ in crawled]
+        changed = [product["url"] for product, outcome in crawled if outcome in ("new", "changed")]
+        return CrawlResult(records, self.stats, changed)
+
+
+def crawl(site_names=None, state_path=None, **kwargs):
+    """
+    Run a crawl and save its state.
+
+    Args:
+        site_names: Sites to crawl (default: all of SITES)
+        state_path: State file of the previous crawl, updated in place
+        **kwargs: Scraper options
+
+    Returns:
+        CrawlResult
+    """
+    state = CrawlState.load(state_path)
+    result = asyncio.run(Scraper(state=state, **kwargs).crawl(site_names))
+    if state_path:
+        state.save(state_path)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl the shops' listings and product pages")
+    parser.add_argument("--output", default="Data_preparation/data_parasave.json")
+    parser.add_argument("--state", default="Data_preparation/crawl_state.json")
+    parser.add_argument("--site", action="append", choices=sorted(SITES), help="Default: every site")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=2.0, help="Requests per second per host")
+    parser.add_argument("--refresh-after", type=float, default=None,
+                        help="Skip product pages checked less than this many seconds ago")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    # httpx logs every request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    start = time.perf_counter()
+    result = crawl(
+        args.site,
+        args.state,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        refresh_after=args.refresh_after,
+    )
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result.records, f, ensure_ascii=False)
+
+    logger.info("📊 %s", dict(sorted(result.stats.items())))
+    logger.info(
+        "✅ %d products (%d new or changed) saved to %s in %.1fs",
+        len(result.records), len(result.changed), args.output, time.perf_counter() - start
+    )
+
+
+if __name__ == "__main__":
+    main()
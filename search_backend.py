@@ -0,0 +1,448 @@
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.http.exceptions import UnexpectedResponse
+from qdrant_client.models import FusionQuery
+
+
+class SearchBackendError(Exception):
+    """Raised when a search could not be served within its deadline."""
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing service for a while.
+
+    After failure_threshold consecutive failures the breaker opens and
+    allow() returns False for reset_timeout seconds. Then a single trial
+    call is let through (half-open): a success closes the breaker, a
+    failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now):
+        if self.opened_at is None:
+            return "closed"
+        if now - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        """Return True if a call may be attempted now."""
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    self.times_opened += 1
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Sliding window of call latencies."""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q, default=None):
+        """q-th percentile of the window, or default if it is empty."""
+        with self._lock:
+            if not self._samples:
+                return default
+            return float(np.percentile(self._samples, q))
+
+
+def _is_retryable(error):
+    """Client errors (bad request, missing collection) will fail again."""
+    if isinstance(error, UnexpectedResponse):
+        return error.status_code is None or error.status_code >= 500 or error.status_code == 429
+    return not isinstance(error, (ValueError, TypeError, KeyError))
+
+
+class SearchBackend:
+    """
+    Qdrant access layer with bounded latency.
+
+    Wraps an AsyncQdrantClient (REST or gRPC) running on a background event
+    loop, and exposes blocking methods for the app's threads. Every call has
+    a deadline; transient errors are retried with exponential backoff and
+    full jitter while the deadline allows; a circuit breaker fails fast when
+    Qdrant keeps failing. Hybrid searches are hedged: once a call has taken
+    longer than the hedge_percentile of recent hybrid latencies, a
+    dense-only query starts in parallel and the first successful answer
+    wins.
+    """
+
+    def __init__(
+        self,
+        url=None,
+        api_key=None,
+        collection_name="wellness_products",
+        prefer_grpc=False,
+        timeout=5,
+        deadline=2.0,
+        retries=2,
+        backoff=0.05,
+        hedge_percentile=95,
+        hedge_min_samples=20,
+        hedge_default_delay=0.5,
+        breaker=None,
+        client_factory=None
+    ):
+        """
+        Args:
+            url: Qdrant URL (":memory:" for an in-process instance)
+            api_key: Qdrant API key
+            collection_name: Collection to search
+            prefer_grpc: Use the gRPC transport
+            timeout: Transport timeout of a single request in seconds
+            deadline: Time budget of a whole call, retries and hedge included
+            retries: Retries after the first attempt
+            backoff: Base backoff in seconds (doubled per retry, jittered)
+            hedge_percentile: Latency percentile after which to hedge
+                (None disables hedging)
+            hedge_min_samples: Samples needed before trusting the percentile
+            hedge_default_delay: Hedge delay until then
+            breaker: CircuitBreaker (default: 5 failures, 30 s)
+            client_factory: Zero-argument callable returning an async client
+                (AsyncQdrantClient or a fake with the same methods), called
+                on the backend's event loop
+        """
+        self.collection_name = collection_name
+        self.deadline = deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_default_delay = hedge_default_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+        self.counters = {
+            "calls": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "deadline_exceeded": 0,
+            "rejected": 0,
+        }
+        self._counter_lock = threading.Lock()
+
+        if client_factory is None:
+            if url == ":memory:":
+                client_factory = lambda: AsyncQdrantClient(location=":memory:")
+            else:
+                client_factory = lambda: AsyncQdrantClient(
+                    url, api_key=api_key, prefer_grpc=prefer_grpc, timeout=timeout
+                )
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="search-backend", daemon=True
+        )
+        self._thread.start()
+        self.client = self._run(self._call_factory(client_factory), timeout=None)
+
+    @staticmethod
+    async def _call_factory(factory):
+        return factory()
+
+    def _run(self, coro, timeout):
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def _count(self, name, amount=1):
+        with self._counter_lock:
+            self.counters[name] += amount
+
+    def stats(self):
+        """Counters, breaker state and latency percentiles."""
+        with self._counter_lock:
+            stats = dict(self.counters)
+        stats["breaker"] = self.breaker.state
+        stats["breaker_opened"] = self.breaker.times_opened
+        stats["p50"] = self.latency.percentile(50)
+        stats["p95"] = self.latency.percentile(95)
+        return stats
+
+    def hedge_delay(self):
+        """Seconds to wait on the hybrid call before hedging."""
+        if len(self.latency) < self.hedge_min_samples:
+            return self.hedge_default_delay
+        return self.latency.percentile(self.hedge_percentile)
+
+    def close(self):
+        """Close the client and stop the event loop."""
+        try:
+            close = getattr(self.client, "close", None)
+            if close is not None:
+                self._run(close(), timeout=self.deadline)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=1)
+
+    # -- async internals -------------------------------------------------
+
+    async def _with_retries(self, make_call, deadline_at):
+        """Run make_call() until it succeeds, retries run out or time does."""
+        attempt = 0
+        while True:
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                return await asyncio.wait_for(make_call(), remaining)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt >= self.retries or not _is_retryable(e):
+                    raise
+                # Full jitter: uniform in [0, backoff * 2^attempt]
+                delay = random.uniform(0, self.backoff * (2 ** attempt))
+                if time.monotonic() + delay >= deadline_at:
+                    raise
+                attempt += 1
+                self._count("retries")
+                await asyncio.sleep(delay)
+
+    async def _guarded(self, make_call, deadline_at):
+        """_with_retries plus circuit breaker bookkeeping."""
+        try:
+            result = await self._with_retries(make_call, deadline_at)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return result
+
+    async def _hedged(self, hybrid_call, dense_call, deadline_at):
+        """
+        Race the hybrid call against a delayed dense-only call.
+
+        The dense call starts when the hybrid one is slower than the hedge
+        delay, or as soon as it fails. The hybrid latency is recorded when it
+        answers, and as a lower bound when it is cancelled.
+
+        Returns:
+            Tuple of (result, "hybrid" or "dense": the call that answered)
+        """
+        start = time.monotonic()
+        hybrid = asyncio.ensure_future(self._guarded(hybrid_call, deadline_at))
+        tasks = {hybrid}
+        hedged = dense_call is None
+
+        def start_hedge():
+            self._count("hedges")
+            tasks.add(asyncio.ensure_future(self._guarded(dense_call, deadline_at)))
+
+        error = None
+        try:
+            while tasks:
+                remaining = deadline_at - time.monotonic()
+                timeout = remaining
+                if not hedged and self.hedge_percentile is not None:
+                    timeout = min(remaining, self.hedge_delay() - (time.monotonic() - start))
+                done, pending = await asyncio.wait(
+                    tasks, timeout=max(timeout, 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                tasks.intersection_update(pending)
+                if not done:
+                    if time.monotonic() >= deadline_at:
+                        # The calls are cancelled below, count the hang here
+                        self.breaker.record_failure()
+                        raise asyncio.TimeoutError()
+                    # The hybrid call is in its latency tail
+                    hedged = True
+                    start_hedge()
+                    continue
+                for task in done:
+                    if task.exception() is None:
+                        if task is hybrid:
+                            self.latency.record(time.monotonic() - start)
+                            return task.result(), "hybrid"
+                        self._count("hedge_wins")
+                        return task.result(), "dense"
+                    error = task.exception()
+                    if task is hybrid and not hedged:
+                        hedged = True
+                        start_hedge()
+            raise error
+        finally:
+            if not hybrid.done():
+                # Lost to the hedge or cut by the deadline: the hybrid call
+                # took at least this long. Dropping these samples would
+                # leave only the fast calls and drift the hedge delay low.
+                self.latency.record(time.monotonic() - start)
+            for task in tasks:
+                task.cancel()
+
+    # -- blocking API ----------------------------------------------------
+
+    def _call(self, coro_factory, deadline):
+        """Run a call with a deadline, translating every failure."""
+        deadline = self.deadline if deadline is None else deadline
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("rejected")
+            raise SearchBackendError("Qdrant circuit breaker is open")
+
+        deadline_at = time.monotonic() + deadline
+        try:
+            # A little slack so the loop reports its own timeout first
+            return self._run(coro_factory(deadline_at), timeout=deadline + 0.5)
+        except (asyncio.TimeoutError, FutureTimeoutError, TimeoutError) as e:
+            self._count("deadline_exceeded")
+            raise SearchBackendError(f"Deadline of {deadline:.2f}s exceeded") from e
+        except SearchBackendError:
+            raise
+        except Exception as e:
+            raise SearchBackendError(str(e)) from e
+
+    def search(
+        self,
+        prefetch,
+        query_dense,
+        query_filter,
+        limit=10,
+        fusion="rrf",
+        with_payload=True,
+        with_vectors=False,
+        hedge=True,
+        deadline=None,
+        search_params=None,
+        return_source=False
+    ):
+        """
+        Hybrid query, hedged with a dense-only query.
+
+        Args:
+            prefetch: Prefetch list of the hybrid query
+            query_dense: Dense query vector of the hedge
+            query_filter: Filter of the hedge
+            limit: Number of results to return
+            fusion: "rrf" or "dbsf"
+            with_payload: Payload selector
+            with_vectors: Return the vectors
+            hedge: Allow the dense-only hedge
+            deadline: Time budget in seconds (default: self.deadline)
+            search_params: SearchParams of the hedge (exact scan, quantization)
+            return_source: Also return which query answered
+
+        Returns:
+            QueryResponse, or with return_source a tuple of (QueryResponse,
+            "hybrid" or "dense"): a dense answer is the degraded hedge result
+
+        Raises:
+            SearchBackendError: Every attempt failed or the deadline passed
+        """
+        def hybrid_call():
+            return self.client.query_points(
+                collection_name=self.collection_name,
+                prefetch=prefetch,
+                query=FusionQuery(fusion=fusion),
+                limit=limit,
+                with_payload=with_payload,
+                with_vectors=with_vectors,
+            )
+
+        def dense_call():
+            return self.client.query_points(
+                collection_name=self.collection_name,
+                query=query_dense,
+                using="dense",
+                query_filter=query_filter,
+                search_params=search_params,
+                limit=limit,
+                with_payload=with_payload,
+                with_vectors=with_vectors,
+            )
+
+        response, source = self._call(
+            lambda deadline_at: self._hedged(hybrid_call, dense_call if hedge else None, deadline_at),
+            deadline,
+        )
+        return (response, source) if return_source else response
+
+    def dense_search(self, query_dense, query_filter, limit=10, with_payload=True, deadline=None, search_params=None):
+        """Dense-only query (replaces the deprecated client.search)."""
+        def dense_call():
+            return self.client.query_points(
+                collection_name=self.collection_name,
+                query=query_dense,
+                using="dense",
+                query_filter=query_filter,
+                search_params=search_params,
+                limit=limit,
+                with_payload=with_payload,
+            )
+
+        return self._call(lambda deadline_at: self._guarded(dense_call, deadline_at), deadline)
+
+    def query_batch(self, requests, deadline=None):
+        """query_batch_points with deadline, retries and breaker."""
+        def batch_call():
+            return self.client.query_batch_points(
+                collection_name=self.collection_name, requests=requests
+            )
+
+        return self._call(lambda deadline_at: self._guarded(batch_call, deadline_at), deadline)
+
+    def retrieve(self, ids, with_payload=True, deadline=None):
+        """Points by ID, without vectors."""
+        def retrieve_call():
+            return self.client.retrieve(
+                collection_name=self.collection_name,
+                ids=ids,
+                with_payload=with_payload,
+                with_vectors=False,
+            )
+
+        return self._call(lambda deadline_at: self._guarded(retrieve_call, deadline_at), deadline)
@@ -0,0 +1,119 @@
+import threading
+
+
+# Payload fields the app actually uses (cards, scoring, LLM prompt).
+# The scraped description is several KB per product and only fetched on
+# demand.
+RESULT_FIELDS = ["product_name", "product_brand", "price", "url", "ingredients", "category"]
+
+
+class CompactHit:
+    """
+    Slotted search hit holding only the projected payload fields.
+
+    Behaves like a Qdrant ScoredPoint for the app: .id, .score and a
+    .payload dict. Fields that were not requested (e.g. "description") are
+    fetched by ID on first access through get() and then kept on the hit.
+    """
+
+    __slots__ = (
+        "id",
+        "score",
+        "product_name",
+        "product_brand",
+        "price",
+        "url",
+        "ingredients",
+        "category",
+        "_extra",
+        "_fetch",
+    )
+
+    def __init__(self, id, score, fields, fetch=None):
+        """
+        Args:
+            id: Point ID
+            score: Search score
+            fields: Dict of projected payload fields
+            fetch: Optional fetch(point_id, field_names) -> dict for the
+                fields that were not projected
+        """
+        self.id = id
+        self.score = score
+        for field in RESULT_FIELDS:
+            setattr(self, field, fields.get(field))
+        self._extra = None
+        self._fetch = fetch
+
+    @classmethod
+    def from_point(cls, point, fetch=None):
+        """Wrap a ScoredPoint (or Record) returned by a search."""
+        return cls(point.id, getattr(point, "score", 0.0), point.payload or {}, fetch)
+
+    @property
+    def payload(self):
+        """Projected fields (and any fetched ones) as a dict."""
+        payload = {field: getattr(self, field) for field in RESULT_FIELDS}
+        if self._extra:
+            payload.update(self._extra)
+        return payload
+
+    def get(self, field, default=None):
+        """
+        Return a payload field, fetching it by ID if it was not projected.
+
+        Args:
+            field: Payload field name
+            default: Value if the field is missing or cannot be fetched
+
+        Returns:
+            Field value
+        """
+        if field in RESULT_FIELDS:
+            value = getattr(self, field)
+            return default if value is None else value
+        if self._extra is None or field not in self._extra:
+            if self._fetch is None:
+                return default
+            fetched = self._fetch(self.id, [field]) or {}
+            if self._extra is None:
+                self._extra = {}
+            self._extra[field] = fetched.get(field)
+        value = self._extra[field]
+        return default if value is None else value
+
+    def __repr__(self):
+        return f"CompactHit(id={self.id!r}, score={self.score:.4f}, product_name={self.product_name!r})"
+
+
+def compact_points(points, fetch=None):
+    """Wrap search results into CompactHits sharing one fetch function."""
+    return [CompactHit.from_point(point, fetch) for point in points]
+
+
+class PayloadFetcher:
+    """
+    Fetch payload fields by point ID, with a small per-process cache.
+
+    Args:
+        retrieve: retrieve(point_ids, field_names) -> {point_id: payload dict}
+    """
+
+    def __init__(self, retrieve, max_size=1024):
+        self._retrieve = retrieve
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.max_size = max_size
+
+    def __call__(self, point_id, fields):
+        with self._lock:
+            cached = self._cache.get(point_id, {})
+            missing = [field for field in fields if field not in cached]
+        if missing:
+            fetched = self._retrieve([point_id], missing).get(point_id, {})
+            with self._lock:
+                if len(self._cache) >= self.max_size:
+                    self._cache.clear()
+                cached = self._cache.setdefault(point_id, {})
+                cached.update({field: fetched.get(field) for field in missing})
+        return {field: cached.get(field) for field in fields}
@@ -0,0 +1,384 @@
+"""
+Binary catalog snapshot, memory-mapped at startup.
+
+One file holds everything the app reads from the catalog:
+    - the dense embeddings (unit rows, float32 or float16)
+    - the sparse ingredient weights as CSR indptr/indices/values arrays
+    - the vocabulary as a string table (offsets + UTF-8 bytes)
+    - the payload columns as typed arrays: floats, ints, dictionary-encoded
+      categories and string tables
+
+Layout: the MAGIC bytes, a little-endian uint32 header length, a JSON
+header (format version, counts, source catalog version, and the offset,
+dtype and shape of every array), then the arrays, each aligned on 64
+bytes. The reader maps every array with numpy.memmap, so nothing is parsed
+and app workers opened on the same file share its pages.
+
+Usage:
+    python snapshot.py --embeddings Data_preparation/catalog_embeddings.npy
+    python snapshot.py --float16
+    python snapshot.py --inspect Data_preparation/catalog.snapshot
+"""
+import argparse
+import json
+import logging
+import os
+import struct
+import time
+
+import numpy as np
+from scipy import sparse
+
+from catalog import (
+    CATALOG_PATH,
+    VOCABULARY_PATH,
+    catalog_version,
+    load_catalog,
+    load_vocabulary,
+    scores_to_sparse,
+)
+
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_PATH = "Data_preparation/catalog.snapshot"
+MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+
+MAGIC = b"PARASNAP"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+# Payload column -> storage kind
+COLUMNS = {
+    "product_name": "str",
+    "product_brand": "str",
+    "price": "float64",
+    "promo": "int64",
+    "category": "category",
+    "ingredients": "str",
+    "description": "str",
+    "url": "str",
+    "scraping_date": "str",
+}
+
+
+class SnapshotError(Exception):
+    """Unreadable snapshot: wrong magic bytes or unsupported version."""
+
+
+def _encode_strings(values):
+    """
+    String table of values: (offsets, UTF-8 bytes, null mask or None).
+
+    String i is data[offsets[i]:offsets[i + 1]].
+    """
+    encoded = [b"" if value is None else str(value).encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    nulls = np.array([value is None for value in values], dtype=np.bool_)
+    return offsets, data, nulls if nulls.any() else None
+
+
+class StringTable:
+    """Read-only sequence of strings over memory-mapped offsets and bytes."""
+
+    def __init__(self, offsets, data, nulls=None):
+        self.offsets = offsets
+        self.data = data
+        self.nulls = nulls
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(idx)
+        if self.nulls is not None and self.nulls[idx]:
+            return None
+        return self.data[self.offsets[idx]:self.offsets[idx + 1]].tobytes().decode("utf-8")
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def tolist(self):
+        """All strings, decoded in one pass over the bytes."""
+        raw = self.data.tobytes()
+        offsets = self.offsets.tolist()
+        strings = [raw[start:end].decode("utf-8") for start, end in zip(offsets, offsets[1:])]
+        if self.nulls is not None:
+            for idx in np.flatnonzero(self.nulls).tolist():
+                strings[idx] = None
+        return strings
+
+
+def write_snapshot(path, records, vocab, dense, dtype="float32", source_version=None, model_name=MODEL_NAME):
+    """
+    Write a snapshot of the catalog.
+
+    Args:
+        path: Output file (replaced atomically)
+        records: Catalog records
+        vocab: List of all unique ingredients (vocabulary)
+        dense: Dense vectors aligned with records
+        dtype: Storage type of the dense vectors ("float32" or "float16")
+        source_version: Version of the catalog JSON the snapshot mirrors
+        model_name: Model of the dense vectors
+
+    Returns:
+        Size of the file in bytes
+    """
+    dense = np.asarray(dense, dtype=np.float32)
+    if len(dense) != len(records):
+        raise ValueError(f"{len(dense)} dense vectors for {len(records)} products")
+    norms = np.linalg.norm(dense, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+
+    vocab_index = {term: idx for idx, term in enumerate(vocab)}
+    indptr = [0]
+    indices = []
+    values = []
+    for record in records:
+        row_indices, row_values = scores_to_sparse(record["ingredient_scores"], vocab_index)
+        indices.extend(row_indices)
+        values.extend(row_values)
+        indptr.append(len(indices))
+    # scipy wants indptr and indices of the same type
+    index_dtype = np.int32 if len(indices) < 2 ** 31 else np.int64
+
+    arrays = {
+        "dense": (dense / norms).astype(dtype),
+        "sparse.indptr": np.array(indptr, dtype=index_dtype),
+        "sparse.indices": np.array(indices, dtype=index_dtype),
+        "sparse.values": np.array(values, dtype=np.float32),
+    }
+    arrays["vocab.offsets"], arrays["vocab.data"], _ = _encode_strings(vocab)
+
+    for column, kind in COLUMNS.items():
+        column_values = [record.get(column) for record in records]
+        if kind == "str":
+            offsets, data, nulls = _encode_strings(column_values)
+            arrays[f"{column}.offsets"] = offsets
+            arrays[f"{column}.data"] = data
+            if nulls is not None:
+                arrays[f"{column}.nulls"] = nulls
+        elif kind == "category":
+            labels = sorted({value for value in column_values if value is not None})
+            codes = {label: code for code, label in enumerate(labels)}
+            # -1: no category
+            arrays[f"{column}.codes"] = np.array([codes.get(value, -1) for value in column_values], dtype=np.int16)
+            arrays[f"{column}.labels.offsets"], arrays[f"{column}.labels.data"], _ = _encode_strings(labels)
+        else:
+            arrays[column] = np.array([value or 0 for value in column_values], dtype=kind)
+
+    header = {
+        "format_version": FORMAT_VERSION,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "model_name": model_name,
+        "source_version": source_version,
+        "n_products": len(records),
+        "vocab_size": len(vocab),
+        "dense_dim": int(dense.shape[1]) if dense.ndim == 2 else 0,
+        "columns": COLUMNS,
+        "arrays": {},
+    }
+
+    # Array offsets depend on the header size, which depends on the
+    # offsets: grow the reserved header space until it fits
+    sizes = [-(-array.nbytes // ALIGNMENT) * ALIGNMENT for array in arrays.values()]
+    data_start = ALIGNMENT
+    while True:
+        position = data_start
+        layout = {}
+        for (name, array), size in zip(arrays.items(), sizes):
+            layout[name] = {"offset": position, "dtype": array.dtype.str, "shape": list(array.shape)}
+            position += size
+        header["arrays"] = layout
+        header_bytes = json.dumps(header).encode("utf-8")
+        if len(MAGIC) + 4 + len(header_bytes) <= data_start:
+            break
+        data_start = -(-(len(MAGIC) + 4 + len(header_bytes)) // ALIGNMENT) * ALIGNMENT
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.write(b"\0" * (layout[name]["offset"] - f.tell()))
+            f.write(np.ascontiguousarray(array).tobytes())
+        size = f.tell()
+    # Workers that mapped the old file keep reading it until they reopen
+    os.replace(tmp_path, path)
+    return size
+
+
+class CatalogSnapshot:
+    """Memory-mapped view of a snapshot written by write_snapshot."""
+
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise SnapshotError(f"{path} is not a catalog snapshot")
+            (header_size,) = struct.unpack("<I", f.read(4))
+            self.header = json.loads(f.read(header_size))
+        if self.header["format_version"] != FORMAT_VERSION:
+            raise SnapshotError(
+                f"{path} has format version {self.header['format_version']}, expected {FORMAT_VERSION}"
+            )
+
+        # One read-only mapping of the whole file; every array is a view
+        self._map = np.memmap(path, dtype=np.uint8, mode="r")
+        self.arrays = {}
+        for name, entry in self.header["arrays"].items():
+            dtype = np.dtype(entry["dtype"])
+            count = int(np.prod(entry["shape"]))
+            self.arrays[name] = np.frombuffer(
+                self._map, dtype=dtype, count=count, offset=entry["offset"]
+            ).reshape(entry["shape"])
+
+        self.vocabulary = StringTable(self.arrays["vocab.offsets"], self.arrays["vocab.data"])
+        self.columns = {}
+        for column, kind in self.header["columns"].items():
+            if kind == "str":
+                self.columns[column] = StringTable(
+                    self.arrays[f"{column}.offsets"],
+                    self.arrays[f"{column}.data"],
+                    self.arrays.get(f"{column}.nulls"),
+                )
+            elif kind == "category":
+                labels = list(StringTable(self.arrays[f"{column}.labels.offsets"], self.arrays[f"{column}.labels.data"]))
+                codes = self.arrays[f"{column}.codes"]
+                self.columns[column] = [labels[code] if code >= 0 else None for code in codes.tolist()]
+            else:
+                self.columns[column] = self.arrays[column]
+
+    def __len__(self):
+        return self.header["n_products"]
+
+    @property
+    def source_version(self):
+        return self.header.get("source_version")
+
+    @property
+    def dense(self):
+        """(n_products, dim) unit-norm dense vectors (memory-mapped)."""
+        return self.arrays["dense"]
+
+    def sparse_matrix(self):
+        """CSR matrix of shape (n_products, vocab_size) over the mapped arrays."""
+        return sparse.csr_matrix(
+            (self.arrays["sparse.values"], self.arrays["sparse.indices"], self.arrays["sparse.indptr"]),
+            shape=(len(self), self.header["vocab_size"]),
+            copy=False,
+        )
+
+    def record(self, idx):
+        """
+        Catalog record of row idx.
+
+        ingredient_scores is rebuilt from the sparse row: float32 weights,
+        without the zero weights.
+        """
+        record = {}
+        for column, kind in self.header["columns"].items():
+            value = self.columns[column][idx]
+            if kind in ("float64", "int64"):
+                value = value.item()
+            record[column] = value
+        start, end = self.arrays["sparse.indptr"][idx], self.arrays["sparse.indptr"][idx + 1]
+        record["ingredient_scores"] = {
+            self.vocabulary[term]: float(weight)
+            for term, weight in zip(
+                self.arrays["sparse.indices"][start:end].tolist(), self.arrays["sparse.values"][start:end].tolist()
+            )
+        }
+        return record
+
+    def records(self):
+        """All catalog records, in catalog order (see record)."""
+        columns = {
+            column: values.tolist() if isinstance(values, (StringTable, np.ndarray)) else values
+            for column, values in self.columns.items()
+        }
+        vocabulary = self.vocabulary.tolist()
+        indptr = self.arrays["sparse.indptr"].tolist()
+        indices = self.arrays["sparse.indices"].tolist()
+        weights = self.arrays["sparse.values"].tolist()
+
+        records = []
+        for idx in range(len(self)):
+            record = {column: values[idx] for column, values in columns.items()}
+            start, end = indptr[idx], indptr[idx + 1]
+            record["ingredient_scores"] = {
+                vocabulary[term]: weight for term, weight in zip(indices[start:end], weights[start:end])
+            }
+            records.append(record)
+        return records
+
+
+def open_snapshot(path=SNAPSHOT_PATH, catalog_path=CATALOG_PATH):
+    """
+    Open a snapshot if it exists and mirrors the current catalog.
+
+    Returns:
+        CatalogSnapshot, or None if there is no usable snapshot (the
+        catalog JSON is then the source of truth)
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        snapshot = CatalogSnapshot(path)
+    except SnapshotError as e:
+        logger.warning("⚠️ %s, rebuild it with snapshot.py", e)
+        return None
+    if os.path.exists(catalog_path) and snapshot.source_version != catalog_version(catalog_path):
+        logger.warning("⚠️ %s is out of date with the catalog, rebuild it", path)
+        return None
+    return snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write (or inspect) the binary catalog snapshot")
+    parser.add_argument("--output", default=SNAPSHOT_PATH)
+    parser.add_argument("--catalog", default=CATALOG_PATH)
+    parser.add_argument("--vocab", default=VOCABULARY_PATH)
+    parser.add_argument("--embeddings", default=None, help="Dense vectors from preprocess.py (.npy)")
+    parser.add_argument("--float16", action="store_true", help="store the dense vectors as float16")
+    parser.add_argument("--inspect", metavar="PATH", help="print the header of a snapshot")
+    args = parser.parse_args()
+
+    if args.inspect:
+        snapshot = CatalogSnapshot(args.inspect)
+        header = dict(snapshot.header)
+        header["arrays"] = {name: f"{entry['dtype']} {entry['shape']}" for name, entry in header["arrays"].items()}
+        print(json.dumps(header, indent=2, ensure_ascii=False))
+        return
+
+    records = load_catalog(args.catalog)
+    if args.embeddings:
+        dense = np.load(args.embeddings)
+    else:
+        # Imported here so the module can be used without loading torch
+        from sentence_transformers import SentenceTransformer
+
+        dense = SentenceTransformer(MODEL_NAME).encode(
+            [record["ingredients"] for record in records], convert_to_numpy=True, batch_size=32
+        )
+
+    size = write_snapshot(
+        args.output,
+        records,
+        load_vocabulary(args.vocab),
+        dense,
+        dtype="float16" if args.float16 else "float32",
+        source_version=catalog_version(args.catalog),
+    )
+    print(f"✅ {len(records)} products written to {args.output} ({size / 1024:.0f} KB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+"""
+Delta sync of the catalog into the Qdrant collection.
+
+Point IDs are derived from the product URLs (catalog.product_id), so a new
+catalog can be diffed against what is indexed instead of re-uploading
+everything:
+
+    - new products, or products whose vectors changed (ingredients, model,
+      vocabulary): upserted with their vectors
+    - products whose price, promo or other payload fields changed: only
+      those fields, with set_payload
+    - products no longer in the catalog: deleted
+
+Vectors are never downloaded: each point's payload carries a vector_hash
+and a content_hash (see ingestion.point_payload) that are compared with the
+ones of the new catalog. A nightly price refresh therefore sends a few
+kilobytes of payload updates.
+
+Usage:
+    python sync.py --dry-run
+    python sync.py --url http://localhost:6333 --embeddings Data_preparation/catalog_embeddings.npy
+"""
+import argparse
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+from dotenv import load_dotenv
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointIdsList, SetPayload, SetPayloadOperation
+
+from catalog import (
+    CATALOG_PATH,
+    VOCABULARY_PATH,
+    build_payload,
+    load_catalog,
+    load_vocabulary,
+    product_id,
+    scores_to_sparse,
+)
+from ingestion import (
+    COLLECTION_NAME,
+    MODEL_NAME,
+    QDRANT_URL,
+    content_hash,
+    create_collection,
+    create_payload_indexes,
+    iter_point_batches,
+    upsert_batches,
+    vector_hash,
+)
+from query_planner import write_price_stats
+
+
+# Cheap payload fields, compared one by one and updated in place
+SYNC_FIELDS = [
+    "product_name",
+    "product_brand",
+    "price",
+    "promo",
+    "category",
+    "url",
+    "scraping_date",
+]
+
+# Heavy fields, only compared through content_hash
+CONTENT_FIELDS = ["description", "ingredients"]
+
+SyncPlan = namedtuple("SyncPlan", ["upserts", "payload_updates", "deletes"])
+
+
+def fetch_index_state(client, collection_name=COLLECTION_NAME, batch_size=256):
+    """
+    Read the sync-relevant payload of every indexed point (no vectors).
+
+    Returns:
+        Dict of point ID -> payload restricted to SYNC_FIELDS and the hashes
+    """
+    fields = SYNC_FIELDS + ["vector_hash", "content_hash"]
+    state = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=fields,
+            with_vectors=False,
+        )
+        # IDs kept as returned: points of the old position-based
+        # ingestion have integer IDs and get deleted as such
+        for point in points:
+            state[point.id] = point.payload or {}
+        if offset is None:
+            return state
+
+
+def plan_sync(records, vocab, indexed):
+    """
+    Diff the catalog against the indexed state.
+
+    Args:
+        records: Catalog records
+        vocab: List of all unique ingredients (vocabulary)
+        indexed: Output of fetch_index_state
+
+    Returns:
+        SyncPlan of (records to upsert with vectors,
+        list of (point ID, partial payload), point IDs to delete)
+    """
+    vocab_index = {term: idx for idx, term in enumerate(vocab)}
+
+    # Two records with the same URL are the same point: the last one wins
+    by_id = {}
+    for record in records:
+        point_id = product_id(record)
+        if point_id in by_id:
+            print(f"⚠️ Duplicate product URL, keeping the last record: {record['url']}")
+        by_id[point_id] = record
+
+    upserts = []
+    payload_updates = []
+    for point_id, record in by_id.items():
+        indexed_payload = indexed.get(point_id)
+        indices, values = scores_to_sparse(record["ingredient_scores"], vocab_index)
+        if indexed_payload is None or indexed_payload.get("vector_hash") != vector_hash(record, indices, values):
+            upserts.append(record)
+            continue
+
+        payload = build_payload(record)
+        changes = {
+            field: payload[field]
+            for field in SYNC_FIELDS
+            if indexed_payload.get(field) != payload[field]
+        }
+        new_content_hash = content_hash(record)
+        if indexed_payload.get("content_hash") != new_content_hash:
+            changes.update({field: payload[field] for field in CONTENT_FIELDS})
+            changes["content_hash"] = new_content_hash
+        if changes:
+            payload_updates.append((point_id, changes))
+
+    deletes = [point_id for point_id in indexed if point_id not in by_id]
+    return SyncPlan(upserts, payload_updates, deletes)
+
+
+def _payload_bytes(payload_updates):
+    return sum(len(json.dumps(changes, ensure_ascii=False).encode("utf-8")) for _, changes in payload_updates)
+
+
+def apply_sync(
+    client,
+    plan,
+    vocab,
+    model,
+    collection_name=COLLECTION_NAME,
+    batch_size=64,
+    workers=4,
+    embeddings=None
+):
+    """
+    Send a SyncPlan to the collection, in batches.
+
+    Args:
+        client: Qdrant client
+        plan: Output of plan_sync
+        vocab: List of all unique ingredients (vocabulary)
+        model: Sentence transformer model (unused with embeddings)
+        collection_name: Name of the collection
+        batch_size: Points (or operations) per request
+        workers: Maximum number of concurrent upserts
+        embeddings: Optional dense vectors aligned with plan.upserts
+
+    Returns:
+        Dict of counts: upserted, updated, deleted
+    """
+    upserted = 0
+    if plan.upserts:
+        batches = iter_point_batches(plan.upserts, vocab, model, batch_size=batch_size, embeddings=embeddings)
+        upserted = upsert_batches(client, batches, collection_name, workers=workers)
+
+    for start in range(0, len(plan.payload_updates), batch_size):
+        operations = [
+            SetPayloadOperation(set_payload=SetPayload(payload=changes, points=[point_id]))
+            for point_id, changes in plan.payload_updates[start:start + batch_size]
+        ]
+        client.batch_update_points(collection_name=collection_name, update_operations=operations, wait=True)
+
+    for start in range(0, len(plan.deletes), batch_size):
+        client.delete(
+            collection_name=collection_name,
+            points_selector=PointIdsList(points=plan.deletes[start:start + batch_size]),
+            wait=True,
+        )
+
+    return {"upserted": upserted, "updated": len(plan.payload_updates), "deleted": len(plan.deletes)}
+
+
+def sync(
+    client,
+    records,
+    vocab,
+    model,
+    collection_name=COLLECTION_NAME,
+    batch_size=64,
+    workers=4,
+    embeddings=None,
+    dry_run=False
+):
+    """
+    Bring the collection in line with the catalog.
+
+    Args:
+        client: Qdrant client
+        records: Catalog records
+        vocab: List of all unique ingredients (vocabulary)
+        model: Sentence transformer model (unused with embeddings)
+        collection_name: Name of the collection (created if missing)
+        batch_size: Points (or operations) per request
+        workers: Maximum number of concurrent upserts
+        embeddings: Optional precomputed dense vectors aligned with records
+        dry_run: Only compute and report the plan
+
+    Returns:
+        The SyncPlan
+    """
+    if not client.collection_exists(collection_name) and not dry_run:
+        create_collection(
+            client,
+            collection_name,
+            dense_dim=embeddings.shape[1] if embeddings is not None else model.get_sentence_embedding_dimension(),
+        )
+        create_payload_indexes(client, collection_name)
+    indexed = fetch_index_state(client, collection_name) if client.collection_exists(collection_name) else {}
+
+    plan = plan_sync(records, vocab, indexed)
+    print(
+        f"🔄 {len(plan.upserts)} upserts, {len(plan.payload_updates)} payload updates "
+        f"(~{_payload_bytes(plan.payload_updates) / 1024:.1f} KB), {len(plan.deletes)} deletes"
+    )
+    if dry_run:
+        return plan
+
+    upsert_embeddings = None
+    if embeddings is not None and plan.upserts:
+        positions = {id(record): position for position, record in enumerate(records)}
+        upsert_embeddings = embeddings[[positions[id(record)] for record in plan.upserts]]
+    counts = apply_sync(
+        client,
+        plan,
+        vocab,
+        model,
+        collection_name=collection_name,
+        batch_size=batch_size,
+        workers=workers,
+        embeddings=upsert_embeddings,
+    )
+    print(f"✅ {counts['upserted']} upserted, {counts['updated']} updated, {counts['deleted']} deleted in {collection_name}")
+    # Price histograms of the query planner follow what is indexed
+    write_price_stats(records)
+    return plan
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the ParaSave catalog into Qdrant")
+    parser.add_argument("--url", default=os.getenv("QDRANT_URL", QDRANT_URL))
+    parser.add_argument("--catalog", default=CATALOG_PATH)
+    parser.add_argument("--vocab", default=VOCABULARY_PATH)
+    parser.add_argument("--embeddings", default=None, help="Dense vectors from preprocess.py (.npy)")
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--dry-run", action="store_true", help="only print what would change")
+    args = parser.parse_args()
+
+    load_dotenv()
+
+    client = QdrantClient(args.url, api_key=os.getenv("QDRANT_API_KEY"))
+    records = load_catalog(args.catalog)
+    if args.embeddings:
+        model = None
+        embeddings = np.load(args.embeddings)
+        if len(embeddings) != len(records):
+            raise SystemExit(f"❌ {args.embeddings} has {len(embeddings)} vectors for {len(records)} products")
+    elif args.dry_run:
+        # The plan only needs hashes
+        model = None
+        embeddings = None
+    else:
+        # Imported here so the module can be used without loading torch
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(MODEL_NAME)
+        embeddings = None
+
+    sync(
+        client,
+        records,
+        load_vocabulary(args.vocab),
+        model,
+        collection_name=args.collection,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        embeddings=embeddings,
+        dry_run=args.dry_run,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+In-process metrics, per-request traces and an optional profiler hook.
+
+Stages are timed with span("stage") blocks, which feed a latency
+histogram per stage and, inside a request(), the request's trace. Counters
+track cache hits, fallbacks and unresolved ingredients. Everything can be
+exported as Prometheus text (serve_metrics) or JSON (write_json).
+
+Environment:
+    PARASAVE_TELEMETRY=0        disable metrics and traces (spans become no-ops)
+    PARASAVE_METRICS_PORT=9464  serve /metrics (Prometheus) and /metrics.json
+    PARASAVE_METRICS_JSON=path  write the JSON snapshot after every request
+    PARASAVE_PROFILE=cprofile|pyinstrument  profile every request
+    PARASAVE_PROFILE_DIR=path   where the profiles go (default: profiles)
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv("PARASAVE_TELEMETRY", "1") != "0"
+PROFILER = os.getenv("PARASAVE_PROFILE", "")
+PROFILE_DIR = os.getenv("PARASAVE_PROFILE_DIR", "profiles")
+METRICS_JSON = os.getenv("PARASAVE_METRICS_JSON")
+
+# Seconds; from cache lookups (~1 ms) to VLM calls (several seconds)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_PREFIX = "parasave_"
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram (Prometheus layout)."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Approximate quantile: upper bound of the bucket holding it."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+
+class Metrics:
+    """Thread-safe counters, histograms and gauge collectors."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self._collectors = {}
+
+    def inc(self, name, amount=1, **labels):
+        """Increase a counter."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        """Add a sample to a histogram."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def register_collector(self, name, collect):
+        """
+        Register a callable returning {gauge name: value} at export time.
+
+        Lets objects that already count things (caches, the search
+        backend) be exported without double bookkeeping.
+        """
+        with self._lock:
+            self._collectors[name] = collect
+
+    def _gauges(self):
+        with self._lock:
+            collectors = dict(self._collectors)
+        gauges = {}
+        for source, collect in collectors.items():
+            try:
+                values = collect()
+            except Exception as e:
+                logger.warning("Metrics collector %s failed: %s", source, e)
+                continue
+            for name, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    gauges[f"{source}_{name}"] = value
+        return gauges
+
+    def to_json(self):
+        """Snapshot as a JSON-serializable dict."""
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(key), "value": value}
+                for (name, key), value in sorted(self.counters.items())
+            ]
+            histograms = [
+                {
+                    "name": name,
+                    "labels": dict(key),
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                }
+                for (name, key), histogram in sorted(self.histograms.items())
+            ]
+        return {"counters": counters, "histograms": histograms, "gauges": self._gauges()}
+
+    def to_prometheus(self):
+        """Snapshot in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            counter_names = sorted({name for name, _ in self.counters})
+            for metric in counter_names:
+                lines.append(f"# TYPE {_PREFIX}{metric}_total counter")
+                for (name, key), value in sorted(self.counters.items()):
+                    if name == metric:
+                        lines.append(f"{_PREFIX}{name}_total{_format_labels(key)} {value}")
+
+            histogram_names = sorted({name for name, _ in self.histograms})
+            for metric in histogram_names:
+                lines.append(f"# TYPE {_PREFIX}{metric} histogram")
+                for (name, key), histogram in sorted(self.histograms.items()):
+                    if name != metric:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{_PREFIX}{name}_bucket{_format_labels(key, [('le', bound)])} {cumulative}")
+                    lines.append(f"{_PREFIX}{name}_bucket{_format_labels(key, [('le', '+Inf')])} {histogram.count}")
+                    lines.append(f"{_PREFIX}{name}_sum{_format_labels(key)} {histogram.sum}")
+                    lines.append(f"{_PREFIX}{name}_count{_format_labels(key)} {histogram.count}")
+
+        for name, value in sorted(self._gauges().items()):
+            lines.append(f"# TYPE {_PREFIX}{name} gauge")
+            lines.append(f"{_PREFIX}{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+# Spans of the request being handled (shared with its worker threads
+# through contextvars, see submit)
+_current_trace = contextvars.ContextVar("parasave_trace", default=None)
+_current_depth = contextvars.ContextVar("parasave_span_depth", default=0)
+
+
+class _Span:
+    __slots__ = ("name", "labels", "start", "depth_token")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.depth_token = _current_depth.set(_current_depth.get() + 1)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        depth = _current_depth.get()
+        _current_depth.reset(self.depth_token)
+        metrics.observe("stage_seconds", duration, stage=self.name, **self.labels)
+        if exc_type is not None:
+            metrics.inc("stage_errors", stage=self.name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append((self.name, depth - 1, self.start, duration))
+        return False
+
+
+_NOOP_SPAN = contextlib.nullcontext()
+
+
+def span(name, **labels):
+    """
+    Time a stage: feeds the stage_seconds histogram and the request trace.
+
+    Usage:
+        with span("encode"):
+            ...
+    """
+    if not ENABLED:
+        return _NOOP_SPAN
+    return _Span(name, labels)
+
+
+def inc(name, amount=1, **labels):
+    """Increase a counter (no-op when telemetry is disabled)."""
+    if ENABLED:
+        metrics.inc(name, amount, **labels)
+
+
+def observe(name, value, **labels):
+    """Add a histogram sample (no-op when telemetry is disabled)."""
+    if ENABLED:
+        metrics.observe(name, value, **labels)
+
+
+def submit(executor, fn, *args, **kwargs):
+    """executor.submit that keeps the caller's trace in the worker thread."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def format_trace(trace):
+    """Render a trace as indented "stage  12.3 ms" lines, in start order."""
+    if not trace:
+        return ""
+    origin = min(start for _, _, start, _ in trace)
+    lines = []
+    for name, depth, start, duration in sorted(trace, key=lambda item: item[2]):
+        lines.append(
+            f"{'  ' * depth}{name:<{28 - 2 * depth}} +{(start - origin) * 1000:7.1f} ms "
+            f"{duration * 1000:8.1f} ms"
+        )
+    return "\n".join(lines)
+
+
+@contextlib.contextmanager
+def _profile(name):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}")
+
+    if PROFILER == "pyinstrument":
+        from pyinstrument import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path + ".html", "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+            logger.info("🧪 Profile written to %s.html", path)
+    else:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path + ".prof")
+            logger.info("🧪 Profile written to %s.prof", path)
+
+
+@contextlib.contextmanager
+def request(name="request"):
+    """
+    Scope of one user request: collects its spans into a trace, runs the
+    optional profiler and writes the JSON snapshot afterwards.
+
+    Yields:
+        The trace: list of (stage, depth, start, duration)
+    """
+    trace = []
+    token = _current_trace.set(trace if ENABLED else None)
+    profiler = _profile(name) if PROFILER else contextlib.nullcontext()
+    try:
+        with profiler, span(name):
+            yield trace
+    finally:
+        _current_trace.reset(token)
+        if ENABLED:
+            metrics.inc("requests", kind=name)
+            if METRICS_JSON:
+                write_json(METRICS_JSON)
+
+
+def write_json(path):
+    """Write the metrics snapshot to a JSON file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(metrics.to_json(), f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body = json.dumps(metrics.to_json()).encode("utf-8")
+            content_type = "application/json"
+        elif self.path.startswith("/metrics"):
+            body = metrics.to_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port, host="127.0.0.1"):
+    """
+    Serve /metrics (Prometheus text) and /metrics.json in a background thread.
+
+    Returns:
+        The HTTP server (call shutdown() to stop it)
+    """
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info("📈 Metrics on http://%s:%d/metrics", host, server.server_address[1])
+    return server
@@ -1,8 +1,9 @@
-from sentence_transformers import SentenceTransformer
-import json
+import logging
 import numpy as np
 from qdrant_client import QdrantClient
 import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from qdrant_client.models import (
     SparseVector,
     Filter,
@@ -11,58 +12,427 @@ from qdrant_client.models import (
     Range,
     Prefetch,
     QueryRequest,
-    FusionQuery
+    FusionQuery,
+    QuantizationSearchParams,
+    SearchParams
 )
-import torch
+from qdrant_client.http.models import QueryResponse
 from dotenv import load_dotenv
+from ingredient_resolver import IngredientResolver
+from local_search import LocalSearchEngine
+from embedding_cache import EmbeddingCache
+from catalog import CATALOG_PATH, build_payload, load_catalog, load_vocabulary, product_id, project_payload
+from snapshot import SNAPSHOT_PATH, open_snapshot
+from search_results import RESULT_FIELDS, PayloadFetcher, compact_points
+from product_matcher import ProductMatcher
+from query_planner import PRICE_STATS_PATH, QueryPlanner, build_price_stats, load_price_stats
+from result_cache import ResultCache, result_key
+from alternatives_table import TABLE_PATH, AlternativesTable
+from reranker import RERANK_CANDIDATES, rerank_points
+from search_backend import SearchBackend
+import telemetry
+from telemetry import span
+from resources import registry
 
 
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize model
-model = SentenceTransformer("paraphrase-multilingual-MiniLM-L12-v2")
-device = "cuda" if torch.cuda.is_available() else "cpu"
-model = model.to(device)
+logger = logging.getLogger(__name__)
 
-# Load vocabulary (assuming it's a list)
-with open("parasave_vocabulary.json", "r", encoding="utf-8") as f:
-    vocab = json.load(f)
+MODEL_NAME = "paraphrase-multilingual-MiniLM-L12-v2"
+QDRANT_URL = "https://f0c459b3-fc02-412f-b600-df3242a3c241.europe-west3-0.gcp.cloud.qdrant.io:6333"
+COLLECTION_NAME = "wellness_products"
 
-# Initialize Qdrant client
-client = QdrantClient(
-    "https://f0c459b3-fc02-412f-b600-df3242a3c241.europe-west3-0.gcp.cloud.qdrant.io:6333",
-    api_key=os.getenv("QDRANT_API_KEY"),
+# "qdrant" (default, local engine as fallback) or "local" (local engine only)
+SEARCH_BACKEND = os.getenv("PARASAVE_SEARCH_BACKEND", "qdrant")
+
+# Fusion of the dense and sparse prefetches: "rrf" (ranks) or "dbsf" (scores)
+FUSION = os.getenv("PARASAVE_FUSION", "rrf")
+
+# Second stage: re-score the fused candidates with the position-aware
+# ingredient overlap blended with the dense score (see reranker.py)
+RERANK = os.getenv("PARASAVE_RERANK") == "1"
+
+# Hits fetched per search for the result cache, so retries with a lower
+# budget are answered from them (see result_cache.py)
+RESULT_CACHE_DEPTH = int(os.getenv("PARASAVE_RESULT_CACHE_DEPTH", "30"))
+
+# Quantized dense vectors (ingestion.py --quantization, or
+# PARASAVE_LOCAL_QUANTIZATION for the local engine): candidates scanned on
+# the compressed vectors per result, rescored with the float originals
+DENSE_OVERSAMPLING = float(os.getenv("PARASAVE_OVERSAMPLING", "2.0"))
+LOCAL_QUANTIZATION = os.getenv("PARASAVE_LOCAL_QUANTIZATION") or None
+
+
+# Heavy objects are created on first use through the resource registry,
+# not at import time, so importing utils is cheap.
+
+def _load_model():
+    # torch and sentence_transformers are slow to import, keep them lazy too
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    return SentenceTransformer(MODEL_NAME).to(device)
+
+
+def _warmup_model(model):
+    # The first encode pays for lazy initialisation and kernel selection
+    model.encode(["aqua, glycerin, dimethicone"])
+
+
+def _create_qdrant_client():
+    return QdrantClient(
+        QDRANT_URL,
+        api_key=os.getenv("QDRANT_API_KEY"),
+        timeout=int(os.getenv("QDRANT_TIMEOUT", "5")),
+    )
+
+
+def _create_search_backend():
+    # Deadline, retries and hedging of the app's searches (see search_backend.py)
+    hedge_percentile = os.getenv("PARASAVE_HEDGE_PERCENTILE", "95")
+    backend = SearchBackend(
+        QDRANT_URL,
+        api_key=os.getenv("QDRANT_API_KEY"),
+        collection_name=COLLECTION_NAME,
+        prefer_grpc=os.getenv("PARASAVE_QDRANT_GRPC") == "1",
+        timeout=int(os.getenv("QDRANT_TIMEOUT", "5")),
+        deadline=float(os.getenv("PARASAVE_SEARCH_DEADLINE", "2.0")),
+        retries=int(os.getenv("PARASAVE_SEARCH_RETRIES", "2")),
+        hedge_percentile=float(hedge_percentile) if hedge_percentile else None,
+    )
+    telemetry.metrics.register_collector("search_backend", backend.stats)
+    return backend
+
+
+def _create_embedding_cache():
+    # Set PARASAVE_EMBEDDING_CACHE to persist query embeddings
+    cache = EmbeddingCache(
+        get_model(),
+        MODEL_NAME,
+        max_size=int(os.getenv("PARASAVE_EMBEDDING_CACHE_SIZE", "1024")),
+        store_path=os.getenv("PARASAVE_EMBEDDING_CACHE"),
+    )
+    telemetry.metrics.register_collector("embedding_cache", cache.stats)
+    return cache
+
+
+def _load_alternatives_table():
+    # Optional: built offline with alternatives_table.py
+    path = os.getenv("PARASAVE_ALTERNATIVES_TABLE", TABLE_PATH)
+    if not os.path.exists(path):
+        return None
+    table = AlternativesTable.load(path)
+    if table is not None:
+        logger.info("✅ Precomputed alternatives loaded (%d products)", len(table))
+    return table
+
+
+def _open_snapshot():
+    # Optional: written by snapshot.py or preprocess.py; the catalog JSON
+    # is read instead when it is missing or stale
+    snapshot = open_snapshot(os.getenv("PARASAVE_SNAPSHOT", SNAPSHOT_PATH))
+    if snapshot is not None:
+        logger.info("✅ Catalog snapshot mapped (%d products)", len(snapshot))
+    return snapshot
+
+
+def _load_vocab():
+    snapshot = registry.get("snapshot")
+    return list(snapshot.vocabulary) if snapshot is not None else load_vocabulary()
+
+
+def _load_records():
+    snapshot = registry.get("snapshot")
+    return snapshot.records() if snapshot is not None else load_catalog()
+
+
+def _load_price_stats():
+    # Histograms written by ingestion.py / sync.py, or computed from the
+    # catalog when the file is missing
+    stats = load_price_stats()
+    if stats is None:
+        stats = build_price_stats(_load_records())
+    return stats
+
+
+def _catalog_state():
+    # Changes when the snapshot is rebuilt, the catalog regenerated, or the
+    # collection reloaded or synced (both rewrite the price stats)
+    paths = [os.getenv("PARASAVE_SNAPSHOT", SNAPSHOT_PATH), CATALOG_PATH, PRICE_STATS_PATH]
+    state = []
+    for path in paths:
+        try:
+            state.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            state.append(None)
+    return tuple(state)
+
+
+def _create_query_planner():
+    # Reloads the histograms when ingestion.py / sync.py rewrite them or the
+    # catalog changes, like the result cache is invalidated
+    return QueryPlanner(_load_price_stats(), reload_fn=_load_price_stats, version_fn=_catalog_state)
+
+
+def _create_result_cache():
+    ttl = float(os.getenv("PARASAVE_RESULT_CACHE_TTL", "600"))
+    cache = ResultCache(
+        max_size=int(os.getenv("PARASAVE_RESULT_CACHE_SIZE", "256")),
+        ttl=ttl if ttl > 0 else None,
+        version_fn=_catalog_state,
+    )
+    telemetry.metrics.register_collector("result_cache", cache.stats)
+    return cache
+
+
+def _create_local_engine():
+    snapshot = registry.get("snapshot")
+    if snapshot is not None:
+        engine = LocalSearchEngine.from_snapshot(snapshot)
+    else:
+        engine = LocalSearchEngine.from_catalog(
+            get_vocab(),
+            get_model(),
+            embeddings_path=os.getenv("PARASAVE_EMBEDDINGS_PATH"),
+        )
+    if LOCAL_QUANTIZATION:
+        engine.quantize(LOCAL_QUANTIZATION, oversampling=DENSE_OVERSAMPLING)
+    logger.info("✅ Local search engine ready (%d products)", len(engine))
+    return engine
+
+
+registry.register("model", _load_model, warmup=_warmup_model)
+registry.register("snapshot", _open_snapshot)
+registry.register("vocab", _load_vocab)
+registry.register("resolver", lambda: IngredientResolver(get_vocab()))
+registry.register("qdrant", _create_qdrant_client)
+registry.register("search_backend", _create_search_backend)
+registry.register("embedding_cache", _create_embedding_cache)
+registry.register("local_engine", _create_local_engine)
+registry.register("product_matcher", lambda: ProductMatcher(_load_records()))
+registry.register(
+    "catalog_payloads", lambda: {product_id(record): build_payload(record) for record in _load_records()}
 )
+registry.register("payload_fetcher", lambda: PayloadFetcher(_retrieve_payloads))
+registry.register("alternatives_table", _load_alternatives_table)
+registry.register("query_planner", _create_query_planner)
+registry.register("result_cache", _create_result_cache)
+
+
+def get_model():
+    """Shared sentence transformer model."""
+    return registry.get("model")
+
+
+def get_vocab():
+    """Shared ingredient vocabulary."""
+    return registry.get("vocab")
+
+
+def get_resolver():
+    """Shared IngredientResolver over the vocabulary."""
+    return registry.get("resolver")
+
+
+def get_qdrant_client():
+    """Shared Qdrant client."""
+    return registry.get("qdrant")
+
+
+def get_search_backend():
+    """Shared Qdrant search backend (async client, deadlines, hedging)."""
+    return registry.get("search_backend")
 
-def create_sparse_vector(ingredients_list, vocab, lambda_decay=0.65):
+
+def get_embedding_cache():
+    """Shared query embedding cache."""
+    return registry.get("embedding_cache")
+
+
+def get_local_engine():
+    """Shared in-process search engine."""
+    return registry.get("local_engine")
+
+
+def _retrieve_payloads(point_ids, fields):
+    """Payload fields of points by ID, from Qdrant or the local catalog copy."""
+    if SEARCH_BACKEND != "local":
+        try:
+            records = get_search_backend().retrieve(point_ids, with_payload=list(fields))
+            return {record.id: record.payload or {} for record in records}
+        except Exception as e:
+            logger.warning("⚠️ Could not retrieve payloads from Qdrant: %s", e)
+            telemetry.inc("fallbacks", kind="payload_local")
+    payloads = registry.get("catalog_payloads")
+    return {
+        point_id: project_payload(payloads[point_id], fields) for point_id in point_ids if point_id in payloads
+    }
+
+
+def get_payload_fetcher():
+    """Shared on-demand fetcher of payload fields left out of search results."""
+    return registry.get("payload_fetcher")
+
+
+def get_product_matcher():
+    """Shared catalog product-name matcher."""
+    return registry.get("product_matcher")
+
+
+def get_alternatives_table():
+    """Shared precomputed alternatives table (None if not built)."""
+    return registry.get("alternatives_table")
+
+
+def get_query_planner():
+    """Shared selectivity-aware query planner (follows the price stats file)."""
+    return registry.get("query_planner")
+
+
+def get_result_cache():
+    """Shared budget-monotonic search result cache."""
+    return registry.get("result_cache")
+
+
+def warmup():
+    """
+    Load everything a search needs and run a dummy encode.
+
+    Returns:
+        Dict of load/warmup timings in seconds
+    """
+    names = ["model", "vocab", "resolver", "embedding_cache", "alternatives_table", "query_planner"]
+    if get_alternatives_table() is not None:
+        names.append("product_matcher")
+    names.append("local_engine" if SEARCH_BACKEND == "local" else "search_backend")
+    timings = registry.warmup(names)
+    logger.info("✅ Warmup done: %s", ", ".join(f"{k} {v:.2f}s" for k, v in timings.items()))
+    return timings
+
+
+# Old module attributes, now resolved lazily (PEP 562)
+_LAZY_ATTRIBUTES = {
+    "model": "model",
+    "vocab": "vocab",
+    "resolver": "resolver",
+    "client": "qdrant",
+    "embedding_cache": "embedding_cache",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        return registry.get(_LAZY_ATTRIBUTES[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _as_resolver(vocab):
+    """Return an IngredientResolver for vocab, reusing the shared one when possible."""
+    if isinstance(vocab, IngredientResolver):
+        return vocab
+    if registry.is_loaded("vocab") and vocab is get_vocab():
+        return get_resolver()
+    return IngredientResolver(vocab)
+
+
+def create_sparse_vector(ingredients_list, vocab, lambda_decay=0.65, return_resolution=False):
     """
     Create sparse vector from ingredients list.
     
     Args:
         ingredients_list: List of ingredients in order
-        vocab: List of all unique ingredients (vocabulary)
+        vocab: List of all unique ingredients (vocabulary) or an IngredientResolver
         lambda_decay: Decay constant (default 0.65)
+        return_resolution: Also return the per-ingredient resolution report
         
     Returns:
-        SparseVector object for Qdrant
+        SparseVector object for Qdrant, or (SparseVector, list of
+        ResolvedIngredient) if return_resolution is True
     """
+    ingredient_resolver = _as_resolver(vocab)
+    resolutions = ingredient_resolver.resolve_many(ingredients_list)
+    
     query_indices = []
     query_values = []
+    seen = set()
     
-    for pos, ing in enumerate(ingredients_list, start=1):
-        ing_lower = ing.strip().lower()
-        
-        # Find ingredient in vocabulary
-        if ing_lower in vocab:
-            idx = vocab.index(ing_lower)
-            # ✅ CORRECT FORMULA: e^(-k * position)
-            weight = float(np.exp(-lambda_decay * pos))
+    for pos, resolution in enumerate(resolutions, start=1):
+        # ✅ CORRECT FORMULA: e^(-k * position)
+        weight = float(np.exp(-lambda_decay * pos))
+        # The catalog spells the same ingredient several ways, so the weight
+        # goes on every vocabulary variant. Skip unknown ingredients and keep
+        # the first (heaviest) occurrence of an index.
+        for idx in resolution.indices:
+            if idx in seen:
+                continue
+            seen.add(idx)
             query_indices.append(idx)
             query_values.append(weight)
     
-    return SparseVector(indices=query_indices, values=query_values)
+    sparse_vector = SparseVector(indices=query_indices, values=query_values)
+    if return_resolution:
+        return sparse_vector, resolutions
+    return sparse_vector
+
+
+def _price_category_filter(budget, category):
+    """Qdrant filter: price <= budget and category == category."""
+    return Filter(
+        must=[
+            FieldCondition(
+                key="price",
+                range=Range(lte=float(budget))
+            ),
+            FieldCondition(
+                key="category",
+                match=MatchValue(value=category)
+            )
+        ]
+    )
+
+
+def _dense_search_params(exact=False):
+    """
+    SearchParams of the dense searches.
+
+    exact scans the filtered points instead of walking the HNSW graph
+    (the planner picks it when few products pass the filter), on the float
+    vectors. Otherwise a quantized collection returns DENSE_OVERSAMPLING
+    times more candidates from the compressed vectors, rescored with the
+    originals; the quantization params are ignored by a collection
+    without quantization.
+    """
+    return SearchParams(
+        exact=exact,
+        quantization=QuantizationSearchParams(ignore=exact, rescore=True, oversampling=DENSE_OVERSAMPLING)
+    )
+
+
+def _hybrid_prefetch(query_dense, query_sparse, query_filter, prefetch_limit=100, exact=False):
+    """
+    Dense and sparse prefetches of the hybrid query, both filtered.
+
+    exact: exact dense scan (see _dense_search_params)
+    """
+    return [
+        Prefetch(
+            query=query_dense,
+            using="dense",
+            limit=prefetch_limit,
+            filter=query_filter,
+            params=_dense_search_params(exact)
+        ),
+        Prefetch(
+            query=query_sparse,
+            using="sparse",
+            limit=prefetch_limit,
+            filter=query_filter
+        )
+    ]
 
 
 def search_products(
@@ -74,98 +444,255 @@ def search_products(
     model,
     client,
     lambda_decay=0.65,
-    limit=10
+    limit=10,
+    fusion=None,
+    rerank=None,
+    payload_fields=RESULT_FIELDS,
+    prefetch_limit=None
 ):
     """
     Hybrid search with price and category filters.
+
+    The query planner first estimates how many products pass the filters:
+    none skips the search, few make it an exact scan, many raise the
+    prefetch limits. Results are cached RESULT_CACHE_DEPTH deep, so the
+    same query with a lower budget is answered without searching.
     
     Args:
         query_text: Text representation of ingredients (for dense search)
         query_ingredients: List of ingredients (for sparse search)
         budget: Maximum price
         category: Product category
-        vocab: Vocabulary list
+        vocab: Vocabulary list or IngredientResolver
         model: Sentence transformer model
-        client: Qdrant client
+        client: SearchBackend (deadlines, retries, hedging) or a plain
+            QdrantClient
         lambda_decay: Decay constant for scoring
         limit: Number of results to return
+        fusion: "rrf" or "dbsf" (default: FUSION)
+        rerank: Apply the second-stage reranker (default: RERANK)
+        payload_fields: Payload fields to return (None: the whole payload)
+        prefetch_limit: Candidates of each (dense, sparse) prefetch
+            (default: sized by the query planner)
         
     Returns:
         Search results from Qdrant
     """
+    fusion = fusion or FUSION
+    rerank = RERANK if rerank is None else rerank
+    with_payload = list(payload_fields) if payload_fields is not None else True
+
+    plan = get_query_planner().plan(category, budget, limit)
+    telemetry.inc("query_plans", strategy=plan.strategy)
+    if plan.strategy == "empty":
+        logger.info("💸 No %s products under %s, search skipped", category, budget)
+        return QueryResponse(points=[])
+    # Only the requested limit goes in the cache key, not the planned one:
+    # the plan depends on the budget, and one entry serves every budget
+    requested_prefetch_limit = prefetch_limit
+    if prefetch_limit is None:
+        prefetch_limit = plan.prefetch_limit
+    exact = plan.strategy == "exact"
+    search_params = _dense_search_params(exact)
     
     # Create filter for price and category
-    price_category_filter = Filter(
-        must=[
-            FieldCondition(
-                key="price",
-                range=Range(lte=float(budget))
-            ),
-            FieldCondition(
-                key="category",
-                match=MatchValue(value=category)
-            )
-        ]
-    )
+    price_category_filter = _price_category_filter(budget, category)
     
-    # 1. Create dense vector
-    query_dense = model.encode([query_text])[0].tolist()
+    # 1. Create dense vector (cached for the shared model)
+    with span("encode"):
+        if registry.is_loaded("model") and model is get_model():
+            query_dense = get_embedding_cache().encode_one(query_text).tolist()
+        else:
+            query_dense = model.encode([query_text])[0].tolist()
     
     # 2. Create sparse vector
-    query_sparse = create_sparse_vector(query_ingredients, vocab, lambda_decay)
+    with span("sparse"):
+        query_sparse, resolutions = create_sparse_vector(
+            query_ingredients, vocab, lambda_decay, return_resolution=True
+        )
+    unresolved = [r.query for r in resolutions if r.index is None]
+    telemetry.inc("ingredients", len(resolutions))
+    telemetry.inc("unresolved_ingredients", len(unresolved))
+    
+    logger.debug(
+        "🔍 Searching with: category=%s budget=%s ingredients=%d sparse non-zero=%d plan=%s",
+        category, budget, len(query_ingredients), len(query_sparse.indices), plan
+    )
+    if unresolved:
+        logger.info("   Unresolved ingredients: %s", unresolved)
+
+    # 3. Same query vectors with a budget at most the cached one: no search
+    cache = get_result_cache()
+    cacheable = payload_fields is None or "price" in payload_fields
+    if cacheable:
+        cache_key = result_key(
+            category, query_dense, query_sparse, backend=SEARCH_BACKEND, fusion=fusion, rerank=rerank,
+            payload_fields=payload_fields and tuple(payload_fields), prefetch_limit=requested_prefetch_limit
+        )
+        cached = cache.get(cache_key, budget, limit)
+        telemetry.inc("result_cache", result="hit" if cached is not None else "miss")
+        if cached is not None:
+            logger.debug("✅ Found %d results (cached)", len(cached))
+            return QueryResponse(points=cached)
+    depth = max(limit, RESULT_CACHE_DEPTH) if cacheable else limit
     
-    print(f"🔍 Searching with:")
-    print(f"   Category: {category}")
-    print(f"   Budget: ${budget}")
-    print(f"   Ingredients: {len(query_ingredients)}")
-    print(f"   Sparse vector non-zero: {len(query_sparse.indices)}")
+    if SEARCH_BACKEND == "local":
+        with span("local_search"):
+            response = get_local_engine().query(
+                query_dense, query_sparse, category, budget, prefetch_limit=prefetch_limit, limit=depth,
+                fusion=fusion, rerank=rerank, payload_fields=payload_fields
+            )
+        if cacheable:
+            cache.put(cache_key, budget, response.points, depth)
+        logger.debug("✅ Found %d results (local)", len(response.points))
+        return QueryResponse(points=response.points[:limit])
     
     try:
-        # 3. Hybrid search using query_points with prefetch
-        response = client.query_points(
-            collection_name="wellness_products",
-            prefetch=[
-                Prefetch(
-                    query=query_dense,
-                    using="dense",
-                    limit=100,
-                    filter=price_category_filter
-                ),
-                Prefetch(
-                    query=query_sparse,
-                    using="sparse",
-                    limit=100,
-                    filter=price_category_filter
+        # 4. Hybrid search using query_points with prefetch
+        prefetch = _hybrid_prefetch(query_dense, query_sparse, price_category_filter, prefetch_limit, exact)
+        # The reranker needs every fused candidate with its vectors
+        candidates = max(RERANK_CANDIDATES, depth) if rerank else depth
+        source = "hybrid"
+        with span("qdrant"):
+            if isinstance(client, SearchBackend):
+                # Hedged with a dense-only query when the hybrid one is slow
+                response, source = client.search(
+                    prefetch,
+                    query_dense,
+                    price_category_filter,
+                    limit=candidates,
+                    fusion=fusion,  # RRF or DBSF fusion
+                    with_payload=with_payload,
+                    with_vectors=rerank,
+                    search_params=search_params,
+                    return_source=True
                 )
-            ],
-            query=FusionQuery(fusion="rrf"),  # RRF fusion
-            limit=limit,
-            with_payload=True
-        )
+            else:
+                response = client.query_points(
+                    collection_name=COLLECTION_NAME,
+                    prefetch=prefetch,
+                    query=FusionQuery(fusion=fusion),  # RRF or DBSF fusion
+                    limit=candidates,
+                    with_payload=with_payload,
+                    with_vectors=rerank
+                )
+        if rerank:
+            with span("rerank"):
+                response = rerank_points(response.points, query_dense, query_sparse, candidates)
+        # A dense-only hedge answer is degraded: serve it, don't cache it
+        # under the hybrid key
+        if cacheable and source == "hybrid":
+            cache.put(cache_key, budget, response.points, candidates)
         
-        print(f"✅ Found {len(response.points) if hasattr(response, 'points') else 0} results")
-        return response
+        logger.debug("✅ Found %d results (%s)", len(response.points), source)
+        return QueryResponse(points=response.points[:limit])
         
     except Exception as e:
-        print(f"❌ Error in search: {e}")
-        print("   Trying fallback search with dense only...")
+        logger.warning("❌ Error in search: %s, trying the local engine", e)
+        telemetry.inc("fallbacks", kind="local")
         
-        # Fallback: dense search only
+        # Fallback 1: same hybrid query in-process
         try:
-            response = client.search(
-                collection_name="wellness_products",
-                query_vector=("dense", query_dense),
-                query_filter=price_category_filter,
-                limit=limit,
-                with_payload=True
-            )
-            print(f"✅ Fallback search found {len(response)} results")
+            with span("local_search"):
+                response = get_local_engine().query(
+                    query_dense, query_sparse, category, budget, prefetch_limit=prefetch_limit, limit=limit,
+                    fusion=fusion, rerank=rerank, payload_fields=payload_fields
+                )
+            logger.info("✅ Local fallback found %d results", len(response.points))
+            return response
+        except Exception as e_local:
+            logger.warning("❌ Local fallback failed: %s, trying dense only", e_local)
+            telemetry.inc("fallbacks", kind="dense")
+        
+        # Fallback 2: dense search only
+        try:
+            with span("qdrant_dense"):
+                if isinstance(client, SearchBackend):
+                    response = client.dense_search(
+                        query_dense, price_category_filter, limit=limit, with_payload=with_payload,
+                        search_params=search_params
+                    )
+                else:
+                    response = client.query_points(
+                        collection_name=COLLECTION_NAME,
+                        query=query_dense,
+                        using="dense",
+                        query_filter=price_category_filter,
+                        search_params=search_params,
+                        limit=limit,
+                        with_payload=with_payload
+                    )
+            logger.info("✅ Fallback search found %d results", len(response.points))
             return response
         except Exception as e2:
-            print(f"❌ Fallback also failed: {e2}")
+            logger.error("❌ Fallback also failed: %s", e2)
+            telemetry.inc("search_failures")
             raise
 
 
+def build_query(ingredients):
+    """
+    Clean ingredients and build the dense query text.
+
+    Args:
+        ingredients: List of ingredient strings
+
+    Returns:
+        Tuple of (cleaned ingredient list, query text)
+    """
+    ingredients_clean = [ing.strip().lower() for ing in ingredients if ing.strip()]
+    return ingredients_clean, ", ".join(ingredients_clean)
+
+
+def prime_query_embedding(ingredients):
+    """
+    Embed the query text of an ingredient list into the embedding cache.
+
+    Lets several concurrent searches for the same ingredients share one
+    model.encode call.
+    """
+    _, query_text = build_query(ingredients)
+    if query_text:
+        get_embedding_cache().encode_one(query_text)
+
+
+def get_catalog_alternatives(product_info, category, budget, limit=10):
+    """
+    Alternatives of a scanned catalog product from the precomputed table.
+
+    Short-circuits the embedding and vector search when the VLM product
+    name matches a catalog product of the same category.
+
+    Args:
+        product_info: product_info answer of the VLM
+        category: Product category
+        budget: Maximum price
+        limit: Number of results to return
+
+    Returns:
+        List of CompactHit alternatives, or None when the table is missing,
+        the product is not in the catalog or the table cannot answer
+    """
+    table = get_alternatives_table()
+    if table is None or not product_info or not category:
+        return None
+
+    with span("catalog_match"):
+        match = get_product_matcher().match(product_info, category)
+        response = None if match is None else table.query(
+            match.id, budget, limit=limit, payload_fields=RESULT_FIELDS
+        )
+    if response is None:
+        telemetry.inc("catalog_shortcut", result="miss")
+        return None
+    telemetry.inc("catalog_shortcut", result="hit")
+    logger.info(
+        "⚡ Catalog product matched: %s (%.2f), %d precomputed alternatives",
+        match.name, match.score, len(response.points)
+    )
+    return compact_points(response.points, get_payload_fetcher())
+
+
 def get_alternatives(ingredients, category, budget):
     """
     Main function to get product alternatives.
@@ -176,48 +703,189 @@ def get_alternatives(ingredients, category, budget):
         budget: Maximum price
         
     Returns:
-        List of alternative products
+        List of alternative products (CompactHit, heavy payload fields are
+        fetched on demand)
     """
     
     # Validate inputs
     if not ingredients:
-        print("⚠️ No ingredients provided")
+        logger.warning("⚠️ No ingredients provided")
         return []
     
     if not category:
-        print("⚠️ No category provided")
+        logger.warning("⚠️ No category provided")
         return []
     
-    # Clean ingredients (lowercase, strip)
-    ingredients_clean = [ing.strip().lower() for ing in ingredients if ing.strip()]
-    
-    print(f"\n🔎 Searching alternatives:")
-    print(f"   Ingredients: {ingredients_clean[:5]}...")
-    print(f"   Category: {category}")
-    print(f"   Budget: ${budget}")
+    # Clean ingredients (lowercase, strip) and build the dense query text
+    ingredients_clean, query_text = build_query(ingredients)
     
-    # Create query text for dense search
-    query_text = ", ".join(ingredients_clean)
+    logger.info(
+        "🔎 Searching alternatives: category=%s budget=%s ingredients=%s...",
+        category, budget, ingredients_clean[:5]
+    )
     
     # Perform search
     try:
-        results = search_products(
-            query_text=query_text,
-            query_ingredients=ingredients_clean,
-            budget=budget,
-            category=category,
-            vocab=vocab,
-            model=model,
-            client=client,
-        )
+        with span("search", category=category):
+            results = search_products(
+                query_text=query_text,
+                query_ingredients=ingredients_clean,
+                budget=budget,
+                category=category,
+                vocab=get_resolver(),
+                model=get_model(),
+                client=get_search_backend(),
+            )
         
-        # Return points
-        if hasattr(results, 'points'):
-            return results.points
-        else:
-            return results
+        # Return compact points
+        points = results.points if hasattr(results, 'points') else results
+        return compact_points(points, get_payload_fetcher())
             
     except Exception as e:
-        print(f"❌ Error in get_alternatives: {e}")
+        logger.error("❌ Error in get_alternatives: %s", e)
         return []
 
+
+
+
+# points: list of CompactHit alternatives (empty on error), error: None or message
+BatchResult = namedtuple("BatchResult", ["points", "error"])
+
+
+def _batch_item(item):
+    """Accept {"ingredients", "category", "budget"} dicts or 3-tuples."""
+    if isinstance(item, dict):
+        return item.get("ingredients"), item.get("category"), item.get("budget")
+    ingredients, category, budget = item
+    return ingredients, category, budget
+
+
+def _search_chunk(client, chunk, limit, deadline):
+    """
+    Run one chunk of prepared queries, falling back per item.
+
+    Args:
+        client: SearchBackend (None: local engine only)
+        chunk: List of (position, dense, sparse, category, budget, plan)
+        limit: Results per query
+        deadline: Time budget of the batch request in seconds
+
+    Returns:
+        List of (position, BatchResult)
+    """
+    if client is not None:
+        try:
+            requests = [
+                QueryRequest(
+                    prefetch=_hybrid_prefetch(
+                        dense, sparse, _price_category_filter(budget, category), plan.prefetch_limit,
+                        plan.strategy == "exact"
+                    ),
+                    query=FusionQuery(fusion=FUSION),
+                    limit=RERANK_CANDIDATES if RERANK else limit,
+                    with_payload=RESULT_FIELDS,
+                    with_vector=RERANK
+                )
+                for _, dense, sparse, category, budget, plan in chunk
+            ]
+            responses = client.query_batch(requests, deadline=deadline)
+            if RERANK:
+                responses = [
+                    rerank_points(response.points, dense, sparse, limit)
+                    for (_, dense, sparse, _, _, _), response in zip(chunk, responses)
+                ]
+            fetch = get_payload_fetcher()
+            return [
+                (position, BatchResult(compact_points(response.points, fetch), None))
+                for (position, *_), response in zip(chunk, responses)
+            ]
+        except Exception as e:
+            logger.warning("❌ Batch query of %d items failed: %s, falling back per item", len(chunk), e)
+            telemetry.inc("fallbacks", kind="batch_local")
+
+    results = []
+    for position, dense, sparse, category, budget, plan in chunk:
+        try:
+            response = get_local_engine().query(
+                dense, sparse, category, budget, prefetch_limit=plan.prefetch_limit, limit=limit,
+                fusion=FUSION, rerank=RERANK, payload_fields=RESULT_FIELDS
+            )
+            results.append((position, BatchResult(compact_points(response.points, get_payload_fetcher()), None)))
+        except Exception as e:
+            results.append((position, BatchResult([], f"Search failed: {e}")))
+    return results
+
+
+def get_alternatives_batch(items, limit=10, chunk_size=64, max_workers=4, lambda_decay=0.65, deadline=30.0):
+    """
+    Get alternatives for many products at once.
+
+    All query texts are embedded with one batched model.encode call (through
+    the embedding cache), then the hybrid searches go to Qdrant's batch query
+    endpoint in chunks of chunk_size, with up to max_workers chunks in
+    flight. A failed chunk is retried item by item on the local engine, so
+    one bad item or request never fails the whole batch.
+
+    Args:
+        items: List of {"ingredients", "category", "budget"} dicts or
+            (ingredients, category, budget) tuples
+        limit: Number of alternatives per item
+        chunk_size: Queries per batch request
+        max_workers: Chunks sent concurrently
+        lambda_decay: Decay constant for the sparse weights
+        deadline: Time budget of each batch request in seconds
+
+    Returns:
+        List of BatchResult, aligned with items
+    """
+    results = [None] * len(items)
+    queries = []
+    planner = get_query_planner()
+
+    # Validate and build the query texts
+    for position, item in enumerate(items):
+        try:
+            ingredients, category, budget = _batch_item(item)
+            if not ingredients:
+                results[position] = BatchResult([], "No ingredients provided")
+                continue
+            if not category:
+                results[position] = BatchResult([], "No category provided")
+                continue
+            budget = float(budget)
+        except (TypeError, ValueError) as e:
+            results[position] = BatchResult([], f"Invalid item: {e}")
+            continue
+        plan = planner.plan(category, budget, limit)
+        telemetry.inc("query_plans", strategy=plan.strategy)
+        if plan.strategy == "empty":
+            # Nothing under the budget: no encode, no search
+            results[position] = BatchResult([], None)
+            continue
+        ingredients_clean, query_text = build_query(ingredients)
+        queries.append((position, ingredients_clean, query_text, category, budget, plan))
+
+    if not queries:
+        return results
+
+    # One batched encode for every query text, then the sparse vectors
+    dense_vectors = get_embedding_cache().encode([query[2] for query in queries])
+    resolver = get_resolver()
+    prepared = [
+        (position, dense.tolist(), create_sparse_vector(ingredients_clean, resolver, lambda_decay),
+         category, budget, plan)
+        for (position, ingredients_clean, _, category, budget, plan), dense in zip(queries, dense_vectors)
+    ]
+
+    client = None if SEARCH_BACKEND == "local" else get_search_backend()
+    chunks = [prepared[i:i + chunk_size] for i in range(0, len(prepared), chunk_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for chunk_results in executor.map(lambda chunk: _search_chunk(client, chunk, limit, deadline), chunks):
+            for position, result in chunk_results:
+                results[position] = result
+
+    failed = sum(1 for result in results if result.error)
+    telemetry.inc("batch_items", len(items))
+    telemetry.inc("batch_errors", failed)
+    logger.info("✅ Batch search: %d items, %d requests, %d errors", len(items), len(chunks), failed)
+    return results
@@ -0,0 +1,271 @@
+import hashlib
+import io
+import json
+import sqlite3
+import threading
+import time
+
+from PIL import Image
+
+
+def cache_version(model, prompt):
+    """Version tag of a VLM call: changes when the model or the prompt does."""
+    return hashlib.sha1(f"{model}\0{prompt}".encode("utf-8")).hexdigest()[:16]
+
+
+def _gray(image_bytes):
+    """Grayscale PIL image of the bytes, or None if not an image."""
+    try:
+        return Image.open(io.BytesIO(image_bytes)).convert("L")
+    except Exception:
+        return None
+
+
+def _dhash(image, size):
+    """size * size-bit difference hash of a grayscale image, as an unsigned int."""
+    pixels = list(image.resize((size + 1, size), Image.LANCZOS).getdata())
+    value = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def perceptual_hash(image_bytes):
+    """
+    64-bit difference hash (dHash) of an image.
+
+    Near-identical re-shoots of the same product (slightly different
+    framing, lighting or compression) land within a few bits of each other.
+    So do different labels printed on the same template: a match is only a
+    candidate, confirmed with fine_hash.
+
+    Returns:
+        Signed 64-bit int (sqlite INTEGER range), or None if not an image
+    """
+    image = _gray(image_bytes)
+    if image is None:
+        return None
+    value = _dhash(image, 8)
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def fine_hash(image_bytes):
+    """
+    256-bit dHash (16x16) of an image, as 64 hex digits.
+
+    Resolves the text blocks that the 64-bit hash averages away; used to
+    confirm perceptual_hash candidates.
+
+    Returns:
+        Hex string, or None if not an image
+    """
+    image = _gray(image_bytes)
+    if image is None:
+        return None
+    return format(_dhash(image, 16), "064x")
+
+
+def _hamming(a, b):
+    return bin((a ^ b) & ((1 << 64) - 1)).count("1")
+
+
+def _fine_distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+class VLMCache:
+    """
+    Content-addressed sqlite cache of VLM extraction results.
+
+    Entries are keyed by task ("product_info", "category", ...), a version
+    tag derived from the model name and prompt text, and the SHA-256 of the
+    image bytes. With max_distance set, a miss on the exact hash falls back
+    to the closest perceptual hash within max_distance bits whose fine hash
+    is also within max_fine_distance bits. Only use near matches for
+    answers that survive a different label on the same layout (the
+    category); text read off the image needs the exact bytes.
+
+    Eviction drops entries older than max_age seconds and then the least
+    recently used ones beyond max_entries.
+    """
+
+    def __init__(self, path, max_entries=5000, max_age=30 * 24 * 3600, max_distance=4, max_fine_distance=16):
+        """
+        Args:
+            path: sqlite file
+            max_entries: Maximum number of cached results
+            max_age: Maximum age of an entry in seconds (None: no limit)
+            max_distance: Maximum dHash Hamming distance for a near match
+                (None disables perceptual matching)
+            max_fine_distance: Maximum fine_hash Hamming distance (out of
+                256 bits) confirming a near match
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.max_distance = max_distance
+        self.max_fine_distance = max_fine_distance
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._puts = 0
+
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS vlm_results ("
+            "task TEXT NOT NULL, version TEXT NOT NULL, image_hash TEXT NOT NULL, "
+            "phash INTEGER, fine_hash TEXT, result TEXT NOT NULL, created_at REAL NOT NULL, "
+            "last_access REAL NOT NULL, PRIMARY KEY (task, version, image_hash))"
+        )
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(vlm_results)")]
+        if "fine_hash" not in columns:
+            # Older cache file: its entries have no fine hash, so they only
+            # match exactly
+            self._db.execute("ALTER TABLE vlm_results ADD COLUMN fine_hash TEXT")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS vlm_results_last_access ON vlm_results (last_access)"
+        )
+        self._db.commit()
+
+    def stats(self):
+        """Return hit/miss counters."""
+        return {"hits": self.hits, "near_hits": self.near_hits, "misses": self.misses}
+
+    def get(self, task, version, image_bytes, allow_near=True):
+        """
+        Look up a cached result.
+
+        Args:
+            task: Name of the extraction call
+            version: cache_version() of the model and prompt
+            image_bytes: Image content
+            allow_near: Fall back to a perceptual-hash match
+
+        Returns:
+            Cached result (JSON-decoded) or None
+        """
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        now = time.time()
+        min_created = now - self.max_age if self.max_age else 0
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT image_hash, result FROM vlm_results "
+                "WHERE task = ? AND version = ? AND image_hash = ? AND created_at >= ?",
+                (task, version, image_hash, min_created),
+            ).fetchone()
+
+            near = False
+            if row is None and allow_near and self.max_distance is not None:
+                row = self._nearest(task, version, image_bytes, min_created)
+                near = row is not None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._db.execute(
+                "UPDATE vlm_results SET last_access = ? "
+                "WHERE task = ? AND version = ? AND image_hash = ?",
+                (now, task, version, row[0]),
+            )
+            self._db.commit()
+            if near:
+                self.near_hits += 1
+            else:
+                self.hits += 1
+            return json.loads(row[1])
+
+    def put(self, task, version, image_bytes, result, allow_near=True):
+        """
+        Store a result (must be JSON-serializable).
+
+        With allow_near=False no perceptual hash is stored, so the entry
+        only ever matches the exact same bytes (use it for keys made of
+        several images).
+        """
+        image_hash = hashlib.sha256(image_bytes).hexdigest()
+        use_phash = allow_near and self.max_distance is not None
+        phash = perceptual_hash(image_bytes) if use_phash else None
+        fine = fine_hash(image_bytes) if phash is not None else None
+        now = time.time()
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO vlm_results "
+                "(task, version, image_hash, phash, fine_hash, result, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (task, version, image_hash, phash, fine, json.dumps(result), now, now),
+            )
+            self._puts += 1
+            # Evicting on every write would be wasteful
+            if self._puts % 50 == 1:
+                self._evict(now)
+            self._db.commit()
+
+    def get_or_compute(self, task, version, image_bytes, compute, is_valid=None, allow_near=True):
+        """
+        Return the cached result, or compute and cache it.
+
+        Args:
+            task: Name of the extraction call
+            version: cache_version() of the model and prompt
+            image_bytes: Image content
+            compute: Zero-argument callable producing the result
+            is_valid: Optional predicate; invalid results are not cached
+            allow_near: Allow perceptual-hash matches (see get/put)
+
+        Returns:
+            Result
+        """
+        result = self.get(task, version, image_bytes, allow_near)
+        if result is not None:
+            return result
+        result = compute()
+        if is_valid is None or is_valid(result):
+            self.put(task, version, image_bytes, result, allow_near)
+        return result
+
+    def evict(self):
+        """Apply the age and size limits now."""
+        with self._lock:
+            self._evict(time.time())
+            self._db.commit()
+
+    def _nearest(self, task, version, image_bytes, min_created):
+        phash = perceptual_hash(image_bytes)
+        if phash is None:
+            return None
+        fine = None
+
+        best = None
+        best_distance = self.max_fine_distance + 1
+        rows = self._db.execute(
+            "SELECT image_hash, result, phash, fine_hash FROM vlm_results "
+            "WHERE task = ? AND version = ? AND fine_hash IS NOT NULL AND created_at >= ?",
+            (task, version, min_created),
+        )
+        for image_hash, result, other, other_fine in rows:
+            if _hamming(phash, other) > self.max_distance:
+                continue
+            # Same layout: confirm on the finer hash
+            if fine is None:
+                fine = fine_hash(image_bytes)
+            distance = _fine_distance(fine, other_fine)
+            if distance < best_distance:
+                best = (image_hash, result)
+                best_distance = distance
+        return best
+
+    def _evict(self, now):
+        if self.max_age:
+            self._db.execute("DELETE FROM vlm_results WHERE created_at < ?", (now - self.max_age,))
+        self._db.execute(
+            "DELETE FROM vlm_results WHERE rowid IN ("
+            "SELECT rowid FROM vlm_results ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )